@@ -0,0 +1,28 @@
+"""Add content hash and stored result to uploaded_files.
+
+Revision ID: 003_add_upload_content_hash
+Revises: 002_add_transaction_types
+Create Date: 2026-10-19 09:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '003_add_upload_content_hash'
+down_revision = '002_add_transaction_types'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('uploaded_files', sa.Column('content_hash', sa.String(length=64), nullable=True))
+    op.add_column('uploaded_files', sa.Column('upload_result', sa.Text(), nullable=True))
+    op.create_index(op.f('ix_uploaded_files_content_hash'), 'uploaded_files', ['content_hash'], unique=True)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_uploaded_files_content_hash'), table_name='uploaded_files')
+    op.drop_column('uploaded_files', 'upload_result')
+    op.drop_column('uploaded_files', 'content_hash')
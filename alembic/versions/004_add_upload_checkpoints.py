@@ -0,0 +1,62 @@
+"""Add upload_checkpoints and upload_rejects tables.
+
+Revision ID: 004_add_upload_checkpoints
+Revises: 003_add_upload_content_hash
+Create Date: 2026-10-19 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '004_add_upload_checkpoints'
+down_revision = '003_add_upload_content_hash'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'upload_checkpoints',
+        sa.Column('id', sa.BigInteger(), nullable=False),
+        sa.Column('uploaded_file_id', sa.BigInteger(), nullable=False),
+        sa.Column('staging_id', sa.String(length=32), nullable=False),
+        sa.Column('member_name', sa.String(length=500), nullable=False),
+        sa.Column('file_type', sa.String(length=20), nullable=False),
+        sa.Column('rows_committed', sa.BigInteger(), nullable=False, server_default='0'),
+        sa.Column('batches_committed', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('records_saved', sa.BigInteger(), nullable=False, server_default='0'),
+        sa.Column('duplicate_count', sa.BigInteger(), nullable=False, server_default='0'),
+        sa.Column('rejected_count', sa.BigInteger(), nullable=False, server_default='0'),
+        sa.Column('status', sa.String(length=20), nullable=False, server_default='in_progress'),
+        sa.Column('created_at', sa.TIMESTAMP(), server_default=sa.func.now(), nullable=True),
+        sa.Column('updated_at', sa.TIMESTAMP(), server_default=sa.func.now(), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_upload_checkpoints_id'), 'upload_checkpoints', ['id'], unique=False)
+    op.create_index(op.f('ix_upload_checkpoints_uploaded_file_id'), 'upload_checkpoints', ['uploaded_file_id'], unique=True)
+    op.create_index(op.f('ix_upload_checkpoints_staging_id'), 'upload_checkpoints', ['staging_id'], unique=False)
+
+    op.create_table(
+        'upload_rejects',
+        sa.Column('id', sa.BigInteger(), nullable=False),
+        sa.Column('uploaded_file_id', sa.BigInteger(), nullable=False),
+        sa.Column('row_index', sa.BigInteger(), nullable=False),
+        sa.Column('reason', sa.Text(), nullable=True),
+        sa.Column('row_data', sa.Text(), nullable=True),
+        sa.Column('created_at', sa.TIMESTAMP(), server_default=sa.func.now(), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_upload_rejects_id'), 'upload_rejects', ['id'], unique=False)
+    op.create_index(op.f('ix_upload_rejects_uploaded_file_id'), 'upload_rejects', ['uploaded_file_id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_upload_rejects_uploaded_file_id'), table_name='upload_rejects')
+    op.drop_index(op.f('ix_upload_rejects_id'), table_name='upload_rejects')
+    op.drop_table('upload_rejects')
+    op.drop_index(op.f('ix_upload_checkpoints_staging_id'), table_name='upload_checkpoints')
+    op.drop_index(op.f('ix_upload_checkpoints_uploaded_file_id'), table_name='upload_checkpoints')
+    op.drop_index(op.f('ix_upload_checkpoints_id'), table_name='upload_checkpoints')
+    op.drop_table('upload_checkpoints')
@@ -0,0 +1,40 @@
+"""Add recon_match_results table.
+
+Revision ID: 005_add_recon_match_results
+Revises: 004_add_upload_checkpoints
+Create Date: 2026-10-19 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '005_add_recon_match_results'
+down_revision = '004_add_upload_checkpoints'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'recon_match_results',
+        sa.Column('id', sa.BigInteger(), nullable=False),
+        sa.Column('run_id', sa.String(length=32), nullable=False),
+        sa.Column('status', sa.String(length=20), nullable=False),
+        sa.Column('atm_id', sa.BigInteger(), nullable=False),
+        sa.Column('switch_id', sa.BigInteger(), nullable=True),
+        sa.Column('flexcube_id', sa.BigInteger(), nullable=True),
+        sa.Column('created_at', sa.TIMESTAMP(), server_default=sa.func.now(), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_recon_match_results_id'), 'recon_match_results', ['id'], unique=False)
+    op.create_index(op.f('ix_recon_match_results_run_id'), 'recon_match_results', ['run_id'], unique=False)
+    op.create_index(op.f('ix_recon_match_results_atm_id'), 'recon_match_results', ['atm_id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_recon_match_results_atm_id'), table_name='recon_match_results')
+    op.drop_index(op.f('ix_recon_match_results_run_id'), table_name='recon_match_results')
+    op.drop_index(op.f('ix_recon_match_results_id'), table_name='recon_match_results')
+    op.drop_table('recon_match_results')
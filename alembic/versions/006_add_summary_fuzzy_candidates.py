@@ -0,0 +1,24 @@
+"""Add fuzzy_candidates column to recon_matching_summary.
+
+Revision ID: 006_add_summary_fuzzy_candidates
+Revises: 005_add_recon_match_results
+Create Date: 2026-10-19 14:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '006_add_summary_fuzzy_candidates'
+down_revision = '005_add_recon_match_results'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('recon_matching_summary', sa.Column('fuzzy_candidates', sa.Text(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('recon_matching_summary', 'fuzzy_candidates')
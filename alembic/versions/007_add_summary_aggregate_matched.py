@@ -0,0 +1,24 @@
+"""Add aggregate_matched column to recon_matching_summary.
+
+Revision ID: 007_add_summary_aggregate_matched
+Revises: 006_add_summary_fuzzy_candidates
+Create Date: 2026-10-19 16:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '007_add_summary_aggregate_matched'
+down_revision = '006_add_summary_fuzzy_candidates'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('recon_matching_summary', sa.Column('aggregate_matched', sa.Text(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('recon_matching_summary', 'aggregate_matched')
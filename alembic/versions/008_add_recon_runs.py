@@ -0,0 +1,48 @@
+"""Add recon_runs table.
+
+Revision ID: 008_add_recon_runs
+Revises: 007_add_summary_aggregate_matched
+Create Date: 2026-10-19 18:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '008_add_recon_runs'
+down_revision = '007_add_summary_aggregate_matched'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'recon_runs',
+        sa.Column('id', sa.BigInteger(), nullable=False),
+        sa.Column('reference', sa.String(length=100), nullable=False),
+        sa.Column('run_id', sa.String(length=32), nullable=False),
+        sa.Column('trigger', sa.String(length=255), nullable=True),
+        sa.Column('status', sa.String(length=20), nullable=False),
+        sa.Column('engine', sa.String(length=20), nullable=True),
+        sa.Column('rule_id', sa.String(length=255), nullable=True),
+        sa.Column('rule_version', sa.String(length=64), nullable=True),
+        sa.Column('input_counts', sa.JSON(), nullable=True),
+        sa.Column('output_counts', sa.JSON(), nullable=True),
+        sa.Column('stage_timings', sa.JSON(), nullable=True),
+        sa.Column('total_ms', sa.Float(), nullable=True),
+        sa.Column('error', sa.Text(), nullable=True),
+        sa.Column('started_at', sa.TIMESTAMP(), server_default=sa.func.now(), nullable=True),
+        sa.Column('finished_at', sa.TIMESTAMP(), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_recon_runs_id'), 'recon_runs', ['id'], unique=False)
+    op.create_index(op.f('ix_recon_runs_reference'), 'recon_runs', ['reference'], unique=True)
+    op.create_index(op.f('ix_recon_runs_run_id'), 'recon_runs', ['run_id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_recon_runs_run_id'), table_name='recon_runs')
+    op.drop_index(op.f('ix_recon_runs_reference'), table_name='recon_runs')
+    op.drop_index(op.f('ix_recon_runs_id'), table_name='recon_runs')
+    op.drop_table('recon_runs')
@@ -0,0 +1,48 @@
+"""Add recon_run_deltas and recon_item_states tables.
+
+Revision ID: 009_add_recon_run_deltas
+Revises: 008_add_recon_runs
+Create Date: 2026-10-19 20:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '009_add_recon_run_deltas'
+down_revision = '008_add_recon_runs'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'recon_run_deltas',
+        sa.Column('id', sa.BigInteger(), nullable=False),
+        sa.Column('recon_run_id', sa.BigInteger(), nullable=False),
+        sa.Column('atm_id', sa.BigInteger(), nullable=False),
+        sa.Column('kind', sa.String(length=20), nullable=False),
+        sa.Column('from_status', sa.String(length=20), nullable=True),
+        sa.Column('to_status', sa.String(length=20), nullable=False),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_recon_run_deltas_run_id', 'recon_run_deltas', ['recon_run_id', 'id'], unique=False)
+    op.create_index('ix_recon_run_deltas_run_kind_id', 'recon_run_deltas', ['recon_run_id', 'kind', 'id'],
+                    unique=False)
+    op.create_table(
+        'recon_item_states',
+        sa.Column('atm_id', sa.BigInteger(), autoincrement=False, nullable=False),
+        sa.Column('status', sa.String(length=20), nullable=False),
+        sa.Column('recon_run_id', sa.BigInteger(), nullable=False),
+        sa.PrimaryKeyConstraint('atm_id')
+    )
+    op.add_column('recon_runs', sa.Column('delta_counts', sa.JSON(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('recon_runs', 'delta_counts')
+    op.drop_table('recon_item_states')
+    op.drop_index('ix_recon_run_deltas_run_kind_id', table_name='recon_run_deltas')
+    op.drop_index('ix_recon_run_deltas_run_id', table_name='recon_run_deltas')
+    op.drop_table('recon_run_deltas')
@@ -0,0 +1,24 @@
+"""Add a (run_id, status, id) index to recon_match_results for result pages.
+
+Revision ID: 010_add_match_results_page_index
+Revises: 009_add_recon_run_deltas
+Create Date: 2026-10-19 22:00:00.000000
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '010_add_match_results_page_index'
+down_revision = '009_add_recon_run_deltas'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_recon_match_results_run_status_id', 'recon_match_results', ['run_id', 'status', 'id'],
+                    unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_recon_match_results_run_status_id', table_name='recon_match_results')
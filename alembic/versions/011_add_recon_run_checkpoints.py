@@ -0,0 +1,47 @@
+"""Add recon_run_checkpoints, and the rule, shard count and cancel flag of a recon run.
+
+Revision ID: 011_add_recon_run_checkpoints
+Revises: 010_add_match_results_page_index
+Create Date: 2026-10-19 23:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '011_add_recon_run_checkpoints'
+down_revision = '010_add_match_results_page_index'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'recon_run_checkpoints',
+        sa.Column('id', sa.BigInteger(), nullable=False),
+        sa.Column('recon_run_id', sa.BigInteger(), nullable=False),
+        sa.Column('shard', sa.Integer(), nullable=False),
+        sa.Column('rows_committed', sa.BigInteger(), nullable=False, server_default='0'),
+        sa.Column('status', sa.String(length=20), nullable=False, server_default='in_progress'),
+        sa.Column('created_at', sa.TIMESTAMP(), server_default=sa.func.now(), nullable=True),
+        sa.Column('updated_at', sa.TIMESTAMP(), server_default=sa.func.now(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('recon_run_id', 'shard', name='uq_recon_run_checkpoints_run_shard')
+    )
+    op.create_index(op.f('ix_recon_run_checkpoints_id'), 'recon_run_checkpoints', ['id'], unique=False)
+    op.create_index(op.f('ix_recon_run_checkpoints_recon_run_id'), 'recon_run_checkpoints', ['recon_run_id'],
+                    unique=False)
+    op.add_column('recon_runs', sa.Column('rule_json', sa.JSON(), nullable=True))
+    op.add_column('recon_runs', sa.Column('shards', sa.Integer(), nullable=True))
+    op.add_column('recon_runs', sa.Column('cancel_requested', sa.Boolean(), nullable=False,
+                                          server_default=sa.false()))
+
+
+def downgrade() -> None:
+    op.drop_column('recon_runs', 'cancel_requested')
+    op.drop_column('recon_runs', 'shards')
+    op.drop_column('recon_runs', 'rule_json')
+    op.drop_index(op.f('ix_recon_run_checkpoints_recon_run_id'), table_name='recon_run_checkpoints')
+    op.drop_index(op.f('ix_recon_run_checkpoints_id'), table_name='recon_run_checkpoints')
+    op.drop_table('recon_run_checkpoints')
@@ -0,0 +1,26 @@
+"""Add the per-rule counts and timings of a recon run, and of each of its shards.
+
+Revision ID: 012_add_recon_run_rule_stats
+Revises: 011_add_recon_run_checkpoints
+Create Date: 2026-10-20 09:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '012_add_recon_run_rule_stats'
+down_revision = '011_add_recon_run_checkpoints'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('recon_runs', sa.Column('rule_stats', sa.JSON(), nullable=True))
+    op.add_column('recon_run_checkpoints', sa.Column('rule_stats', sa.JSON(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('recon_run_checkpoints', 'rule_stats')
+    op.drop_column('recon_runs', 'rule_stats')
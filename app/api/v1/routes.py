@@ -1,3 +1,4 @@
+from typing import List, Optional, Union
 from fastapi import APIRouter, Body, Depends, Request, UploadFile, File
 from sqlalchemy.orm import Session
 from app.controllers.MatchingRuleController import MatchingRuleController
@@ -14,8 +15,20 @@ matchingRuleController = MatchingRuleController()
 #     return await fileUploadController.upload_file(db, file)
 
 @router.post("/uplaod")
-async def upload_file(file: UploadFile = File(...),db: Session = Depends(get_db)):
-    return await fileUploadController.upload_file(db, file)
+async def upload_file(file: UploadFile = File(...), layout: Optional[str] = None, db: Session = Depends(get_db)):
+    return await fileUploadController.upload_file(db, file, layout)
+
+@router.post("/uplaod/batch")
+async def upload_batch(files: List[UploadFile] = File(...), layout: Optional[str] = None, db: Session = Depends(get_db)):
+    return await fileUploadController.upload_batch(db, files, layout)
+
+@router.post("/uplaod/retry/{staging_id}")
+async def retry_upload(staging_id: str, layout: Optional[str] = None, db: Session = Depends(get_db)):
+    return await fileUploadController.retry_upload(db, staging_id, layout)
+
+@router.post("/uplaod/resume/{staging_id}")
+async def resume_upload(staging_id: str, layout: Optional[str] = None, db: Session = Depends(get_db)):
+    return await fileUploadController.resume_upload(db, staging_id, layout)
 
 @router.get("/file-list")
 async def getUplaodFileList(offset:int = 0, limit:int= 0, db: Session = Depends(get_db)):
@@ -45,8 +58,56 @@ async def getMatchingSourceFields(db:Session = Depends(get_db),source:int=0):
     return await matchingRuleController.getMachingSourceFields(db,source)
 
 @router.get("/matching-engine")
-async def runMatchingEngine(db:Session = Depends(get_db)):
-    return await matchingRuleController.runMatchingEngine(db)
+async def runMatchingEngine(db:Session = Depends(get_db), wait: bool = True):
+    return await matchingRuleController.runMatchingEngine(db, wait)
+
+@router.post("/matching-engine/explain")
+async def explainMatchingRule(db: Session = Depends(get_db), data: Union[dict, list] = Body(...)):
+    # data: a rule in the /matching-rule format, or a list of them explained as a waterfall; nothing is written
+    return await matchingRuleController.explainMatchingRule(db, data)
+
+@router.get("/matching-engine/runs/{run_id}")
+async def getMatchingRun(run_id: str):
+    return await matchingRuleController.getMatchingRun(run_id)
+
+@router.post("/matching-engine/runs/{run_id}/cancel")
+async def cancelMatchingRun(run_id: str):
+    return await matchingRuleController.cancelMatchingRun(run_id)
+
+@router.get("/recon-runs")
+async def getReconRuns(offset:int = 0, limit:int = 20, db: Session = Depends(get_db)):
+    return await matchingRuleController.getReconRuns(db, offset, limit)
+
+@router.get("/recon-runs/compare")
+async def compareReconRuns(references: Optional[str] = None, limit:int = 10, db: Session = Depends(get_db)):
+    # references: comma separated run references; default the latest completed runs
+    refs = [ref.strip() for ref in references.split(",") if ref.strip()] if references else None
+    return await matchingRuleController.compareReconRuns(db, refs, limit)
+
+@router.get("/recon-runs/{reference}")
+async def getReconRun(reference: str, db: Session = Depends(get_db)):
+    return await matchingRuleController.getReconRun(db, reference)
+
+@router.post("/recon-runs/{reference}/cancel")
+async def cancelReconRun(reference: str, db: Session = Depends(get_db)):
+    return await matchingRuleController.cancelReconRun(db, reference)
+
+@router.post("/recon-runs/{reference}/resume")
+async def resumeReconRun(reference: str, wait: bool = True, db: Session = Depends(get_db)):
+    return await matchingRuleController.resumeReconRun(db, reference, wait)
+
+@router.get("/recon-runs/{reference}/delta")
+async def getReconRunDelta(reference: str, kind: Optional[str] = None, after: int = 0, limit: int = 100,
+                           db: Session = Depends(get_db)):
+    # Keyset pagination: pass the previous page's nextCursor as after
+    return await matchingRuleController.getReconRunDelta(db, reference, kind, after, min(max(limit, 1), 1000))
+
+@router.get("/recon-runs/{reference}/results")
+async def getReconRunResults(reference: str, status: str = "unmatched", offset: int = 0, limit: int = 50,
+                             db: Session = Depends(get_db)):
+    # Rows are loaded for the requested page only
+    return await matchingRuleController.getReconRunResults(db, reference, status, max(offset, 0),
+                                                           min(max(limit, 1), 1000))
 
 @router.post("/matching-rule")
 async def saveMarchingRule(db: Session = Depends(get_db), data: dict = Body(...)):
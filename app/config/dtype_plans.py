@@ -0,0 +1,35 @@
+# app/config/dtype_plans.py
+
+# Per-source dtype plan applied to uploaded frames before they are handed to
+# the save services. Column names are the normalized (lower-cased) headers.
+#
+#   category - low-cardinality columns, stored as pandas categoricals
+#   integer  - nullable integer columns (column -> pandas extension dtype)
+#   decimal  - exact amounts (column -> (precision, scale)), Arrow decimal128
+#   string   - identifiers and free text, Arrow-backed strings
+DTYPE_PLANS = {
+    "ATM": {
+        "category": ["terminalid", "location", "transactiontype", "currency", "responsecode", "responsedesc"],
+        "integer": {},
+        "decimal": {"amount": (15, 2)},
+        "string": ["datetime", "atmindex", "pan_masked", "account_masked", "stan", "rrn", "auth"],
+    },
+
+    "SWITCH": {
+        "category": ["direction", "currency", "terminalid", "source", "destination", "responsecode"],
+        "integer": {"mti": "Int16", "processingcode": "Int32", "stan": "Int64"},
+        "decimal": {"amountminor": (18, 2)},
+        "string": ["datetime", "pan_masked", "rrn", "authid"],
+    },
+
+    "FLEXCUBE": {
+        "category": ["currency", "status"],
+        "integer": {"stan": "Int64"},
+        "decimal": {"dr": (18, 2), "cr": (18, 2)},
+        "string": ["posteddatetime", "fc_txn_id", "rrn", "account_masked", "description"],
+    },
+}
+
+# A planned category column is only converted when its distinct values make up
+# at most this share of the rows; otherwise the categorical costs more than it saves.
+CATEGORY_MAX_UNIQUE_RATIO = 0.5
@@ -0,0 +1,87 @@
+# app/config/switch_log_layouts.py
+
+# Columns every parsed switch-log row carries; the SWITCH save path reads all of them.
+SWITCH_COLUMNS = [
+    "datetime", "direction", "mti", "pan_masked", "processingcode", "amountminor",
+    "currency", "terminalid", "stan", "rrn", "source", "destination",
+]
+
+# Declarative layouts for native switch journal dumps.
+#
+# fixed: one record per line, fields as (column, offset, length).
+# iso8583: length-prefixed ASCII ISO 8583 messages; "elements" maps the data elements
+#          we keep to switch columns, all other present elements are skipped using
+#          ISO8583_ELEMENT_FORMATS.
+#
+# Optional per-layout keys:
+#   datetime_format - strptime format of the datetime column (a missing year is taken
+#                     from the upload date); rows get "YYYY-MM-DD HH:MM:SS"
+#   mask_pan        - mask the PAN column to first 6 / last 4 digits
+#   constants       - columns with a fixed value for every row
+#   extensions      - upload extensions that select this layout by default
+SWITCH_LOG_LAYOUTS = {
+    "fixed_width": {
+        "format": "fixed",
+        "encoding": "ascii",
+        "fields": [
+            ("datetime", 0, 14),
+            ("direction", 14, 3),
+            ("mti", 17, 4),
+            ("pan_masked", 21, 19),
+            ("processingcode", 40, 6),
+            ("amountminor", 46, 12),
+            ("currency", 58, 3),
+            ("terminalid", 61, 8),
+            ("stan", 69, 6),
+            ("rrn", 75, 12),
+            ("source", 87, 10),
+            ("destination", 97, 10),
+        ],
+        "datetime_format": "%Y%m%d%H%M%S",
+        "mask_pan": True,
+        "extensions": [".fwf", ".dat"],
+    },
+
+    "iso8583": {
+        "format": "iso8583",
+        "encoding": "ascii",
+        "length_prefix": "binary2",   # binary2 | ascii4 | newline
+        "bitmap": "binary",           # binary (8 bytes) | hex (16 characters)
+        "elements": {
+            2: "pan_masked",
+            3: "processingcode",
+            4: "amountminor",
+            7: "datetime",
+            11: "stan",
+            32: "source",
+            37: "rrn",
+            41: "terminalid",
+            49: "currency",
+            100: "destination",
+        },
+        "datetime_format": "%m%d%H%M%S",
+        "mask_pan": True,
+        "constants": {"direction": "IN"},
+        "extensions": [".iso"],
+    },
+}
+
+# ISO 8583:1987 data element lengths: an int is a fixed length, "LL"/"LLL" a variable
+# length with a 2/3-digit length indicator.
+ISO8583_ELEMENT_FORMATS = {
+    2: "LL", 3: 6, 4: 12, 5: 12, 6: 12, 7: 10, 8: 8, 9: 8, 10: 8, 11: 6, 12: 6, 13: 4,
+    14: 4, 15: 4, 16: 4, 17: 4, 18: 4, 19: 3, 20: 3, 21: 3, 22: 3, 23: 3, 24: 3, 25: 2,
+    26: 2, 27: 1, 28: 9, 29: 9, 30: 9, 31: 9, 32: "LL", 33: "LL", 34: "LL", 35: "LL",
+    36: "LLL", 37: 12, 38: 6, 39: 2, 40: 3, 41: 8, 42: 15, 43: 40, 44: "LL", 45: "LL",
+    46: "LLL", 47: "LLL", 48: "LLL", 49: 3, 50: 3, 51: 3, 52: 8, 53: 16, 54: "LLL",
+    55: "LLL", 56: "LLL", 57: "LLL", 58: "LLL", 59: "LLL", 60: "LLL", 61: "LLL",
+    62: "LLL", 63: "LLL", 64: 8, 66: 1, 67: 2, 68: 3, 69: 3, 70: 3, 71: 4, 72: 4,
+    73: 6, 74: 10, 75: 10, 76: 10, 77: 10, 78: 10, 79: 10, 80: 10, 81: 10, 82: 12,
+    83: 12, 84: 12, 85: 12, 86: 16, 87: 16, 88: 16, 89: 16, 90: 42, 91: 1, 92: 2,
+    93: 5, 94: 7, 95: 42, 96: 8, 97: 17, 98: 25, 99: "LL", 100: "LL", 101: "LL",
+    102: "LL", 103: "LL", 104: "LLL", 105: "LLL", 106: "LLL", 107: "LLL", 108: "LLL",
+    109: "LLL", 110: "LLL", 111: "LLL", 112: "LLL", 113: "LLL", 114: "LLL",
+    115: "LLL", 116: "LLL", 117: "LLL", 118: "LLL", 119: "LLL", 120: "LLL",
+    121: "LLL", 122: "LLL", 123: "LLL", 124: "LLL", 125: "LLL", 126: "LLL",
+    127: "LLL", 128: 8,
+}
@@ -1,13 +1,51 @@
 import asyncio
+import datetime
+import json
 from app.controllers.MatchingRuleController import MatchingRuleController
-from app.utils.file_reader import read_file_by_extension
+from itertools import chain
+from app.utils.file_reader import iter_upload_members, split_extension
+from app.utils.upload_staging import get_staged_upload, stage_upload
 from app.utils.smart_column_mapper import SmartColumnMapper
 from app.services.bulkUploadService import BulkUploadService
-import pandas as pd
 from typing import Dict, Any
 from app.config.column_patterns import COLUMN_PATTERNS
+from app.utils.dtype_planner import FrameMemoryReport, normalize_batch
+from app.utils.parallel_csv import iter_parallel_csv_batches
+from app.utils.stage_timer import StageTimings
+from app.db.database import SessionLocal
+from app.core.config import UPLOAD_PARALLEL_MIN_BYTES, UPLOAD_PARSE_WORKERS, UPLOAD_STAGING_TTL_SECONDS
 import re
 
+FILE_TYPE_SAVERS = {
+    "ATM": BulkUploadService.saveATMFileData,
+    "SWITCH": BulkUploadService.saveSwitchFileData,
+    "FLEXCUBE": BulkUploadService.saveFlexCubeFileData,
+}
+
+UPLOAD_MESSAGES = {
+    "ATM": "ATM file uploded",
+    "SWITCH": "Switch file uploded",
+    "FLEXCUBE": "Flec-cube file uploded",
+}
+
+# Duplicate rows returned with an upload result and kept in the stored result that
+# answers a re-upload of the same file; duplicateCount carries the full count
+DUPLICATE_SAMPLE_ROWS = 100
+
+
+def _stored_result(value):
+    """Copy of an upload response for uploaded_files.upload_result, with duplicate lists sampled."""
+    if isinstance(value, dict):
+        return {
+            key: item[:DUPLICATE_SAMPLE_ROWS] if key == "duplicateRecords" and isinstance(item, list)
+            else _stored_result(item)
+            for key, item in value.items()
+        }
+    if isinstance(value, list):
+        return [_stored_result(item) for item in value]
+    return value
+
+
 class FileUpload:
     @staticmethod
     # async def upload_file(db, file) -> Dict[str, Any]:
@@ -28,52 +66,313 @@ class FileUpload:
     #     save_result = await BulkUploadService.save_bulk(db, mapped_df)
     #     return save_result
     
-    async def upload_file(db, file) -> Dict[str, Any]:
+    async def upload_file(db, file, layout=None) -> Dict[str, Any]:
+        try:
+            # Spill the upload to local disk; parsing works off the staged copy
+            staged = await stage_upload(file)
+        except Exception as e:
+            return {"file_type": "ERROR", "error": str(e)}
+        return await FileUpload.ingest_staged_file(db, staged, layout)
+
+    @staticmethod
+    async def upload_batch(db, files, layout=None, wait=True) -> Dict[str, Any]:
+        """
+        Upload several source files in one request. Every file is staged, then all of
+        them are parsed and loaded concurrently, each on its own worker thread and DB
+        session, and the matching engine runs once after all of them have committed.
+        """
+        timings = StageTimings()
+        staged_files = []
+        results = [None] * len(files)
+        with timings.measure("staging"):
+            for index, file in enumerate(files):
+                try:
+                    staged_files.append((index, await stage_upload(file)))
+                except Exception as e:
+                    results[index] = {"file_type": "ERROR", "error": str(e), "fileName": file.filename}
+
+        loop = asyncio.get_running_loop()
+        slots = asyncio.Semaphore(max(UPLOAD_PARSE_WORKERS, 1))
+
+        async def ingest(index, staged):
+            async with slots:
+                try:
+                    results[index] = await loop.run_in_executor(None, FileUpload.ingest_in_thread, staged, layout)
+                except Exception as e:
+                    # One file's failure must not discard the others' results or their matching run
+                    results[index] = {"file_type": "ERROR", "error": str(e), "fileName": staged.filename,
+                                      "stagingId": staged.staging_id}
+
+        with timings.measure("ingest"):
+            await asyncio.gather(*(ingest(index, staged) for index, staged in staged_files))
+
+        matching = None
+        if any(FileUpload.upload_saved(result) for result in results):
+            # One matching pass for the whole batch, after every file has committed
+            with timings.measure("matching"):
+                matching = await MatchingRuleController.runMatchingEngine(db, wait=wait, trigger="batch-upload")
+
+        for result in results:
+            members = result.get("result") if isinstance(result.get("result"), list) else [result]
+            for member in members:
+                for stage, ms in member.get("timings", {}).items():
+                    timings.add(stage[:-len("Ms")], ms)
+        return {
+            "data": {"files": len(files), "filesSaved": sum(FileUpload.upload_saved(r) for r in results)},
+            "result": results,
+            "matching": matching,
+            "timings": timings.to_dict(),
+            "message": "Batch uploded",
+        }
+
+    @staticmethod
+    def ingest_in_thread(staged, layout=None) -> Dict[str, Any]:
+        """Ingest one staged file on a worker thread, with its own event loop and session."""
+        db = SessionLocal()
+        try:
+            return asyncio.run(FileUpload.ingest_staged_file(db, staged, layout, runMatching=False))
+        finally:
+            db.close()
+
+    @staticmethod
+    def upload_saved(response) -> bool:
+        """Whether an upload response committed new data (replays of earlier uploads did not)."""
+        if not response or "duplicateOf" in response:
+            return False
+        result = response.get("result")
+        if isinstance(result, list):
+            return any(member.get("result", {}).get("status") == "success" for member in result)
+        return isinstance(result, dict) and result.get("status") == "success"
+
+    @staticmethod
+    async def retry_upload(db, staging_id: str, layout=None) -> Dict[str, Any]:
+        return await FileUpload.resume_upload(db, staging_id, layout)
+
+    @staticmethod
+    async def resume_upload(db, staging_id: str, layout=None) -> Dict[str, Any]:
+        """
+        Continue a staged upload after a failure, crash or redeploy. Data files with a
+        completed checkpoint are skipped, an interrupted one restarts after its last
+        committed batch, and files never reached are ingested as usual.
+        """
+        staged = get_staged_upload(staging_id)
+        if staged is None:
+            return {"file_type": "ERROR", "error": "Staged upload not found or expired"}
+        return await FileUpload.ingest_staged_file(db, staged, layout)
+
+    @staticmethod
+    def detect_file_type(columns, filename) -> Dict[str, Any]:
+        # Normalize columns
+        cols = [str(c).strip().lower().replace(" ", "").replace("_", "") for c in columns]
+
+        mti_found = any("mti" in col for col in cols)
+        atm_index_found = any("atmindex" in col for col in cols)
+        flexcube_index_found = any("fctxnid" in col for col in cols)
+        fileType = {}
+        if mti_found:
+            fileType = {'fileType':"SWITCH","totalRecords":0,"validRecords":0, "invalidRecords":0, 'fileName':filename}
+        elif atm_index_found:
+            fileType = {'fileType':"ATM","totalRecords":0,"validRecords":0, "invalidRecords":0, 'fileName':filename}
+        elif flexcube_index_found:
+            fileType = {'fileType':"FLEXCUBE","totalRecords":0,"validRecords":0, "invalidRecords":0, 'fileName':filename}
+        return fileType
+
+    @staticmethod
+    async def save_batches(db, file_type, batches, uploaded_file_id, memoryReport, checkpoint, timings) -> Dict[str, Any]:
+        """
+        Save an upload batch by batch, so only one batch is ever materialized. Every batch
+        commits together with the checkpoint, so a resume skips the rows already committed.
+        batches yields (records, stats) pairs as produced by normalize_batch. Only the first
+        DUPLICATE_SAMPLE_ROWS duplicates are kept; the checkpoint counts all of them.
+        """
+        save_batch = FILE_TYPE_SAVERS[file_type]
+        duplicates = []
+
+        for records, stats in timings.iterate("parse", FileUpload.skip_committed(batches, checkpoint.rows_committed)):
+            memoryReport.merge(stats)
+            with timings.measure("load"):
+                batchResult = await save_batch(db, records, uploaded_file_id, checkpoint)
+            duplicates.extend(batchResult["duplicateRecords"][:DUPLICATE_SAMPLE_ROWS - len(duplicates)])
+
+        BulkUploadService.completeUploadCheckpoint(db, checkpoint)
+        return FileUpload.checkpoint_result(checkpoint, duplicates)
+
+    @staticmethod
+    def skip_committed(batches, skip):
+        """Drop the first skip records of a (records, stats) batch stream."""
+        for records, stats in batches:
+            if skip >= len(records):
+                skip -= len(records)
+                continue
+            if skip:
+                records, skip = records[skip:], 0
+            yield records, stats
+
+    @staticmethod
+    def checkpoint_result(checkpoint, duplicates=()) -> Dict[str, Any]:
+        return {
+            "status": "success",
+            "message": f"{checkpoint.records_saved} records inserted, {checkpoint.duplicate_count} duplicates skipped, "
+                       f"{checkpoint.rejected_count} rejected",
+            "recordsSaved": checkpoint.records_saved,
+            "duplicateRecords": list(duplicates),
+            "duplicateCount": checkpoint.duplicate_count,
+            "rejectedRecords": checkpoint.rejected_count,
+            "totalRecords": checkpoint.rows_committed,
+        }
+
+    @staticmethod
+    def normalized_batches(staged, name, file_type, first_batch, batches):
+        """
+        Normalized (records, stats) batches for one data file of an upload. A large plain
+        CSV is re-parsed across the parse process pool; everything else, including
+        decompressed archive members, is normalized in-process.
+        """
+        if (name == staged.filename and staged.extension == ".csv"
+                and staged.size >= UPLOAD_PARALLEL_MIN_BYTES and UPLOAD_PARSE_WORKERS > 1):
+            batches.close()
+            return iter_parallel_csv_batches(staged, file_type)
+        return (normalize_batch(batch, file_type) for batch in chain([first_batch], batches))
+
+    @staticmethod
+    def is_abandoned(existing) -> bool:
+        """An unfinished upload whose staged file has outlived the staging TTL can no longer be resumed."""
+        started = existing.created_at
+        return started is not None and started < datetime.datetime.now() - datetime.timedelta(seconds=UPLOAD_STAGING_TTL_SECONDS)
+
+    @staticmethod
+    def replay_upload(existing) -> Dict[str, Any]:
+        """Answer a re-upload of identical content with the result of the original upload."""
+        if not existing.upload_result:
+            return {"data": {}, "message": "An identical file is already being processed", "duplicateOf": existing.id}
+        response = json.loads(existing.upload_result)
+        response["duplicateOf"] = existing.id
+        return response
+
+    @staticmethod
+    async def ingest_member(db, staged, name, batches, content_hash=None, checkpoint=None) -> Dict[str, Any]:
+        """
+        Detect the source of one data file from its header, then save it batch by batch.
+        With a checkpoint from an earlier attempt the file's uploaded_files row is reused
+        and only the rows after the last committed batch are saved.
+        """
+        if checkpoint is not None and checkpoint.status == "completed":
+            batches.close()
+            fileType = {'fileType': checkpoint.file_type, "totalRecords": checkpoint.rows_committed,
+                        "validRecords": checkpoint.rows_committed, "invalidRecords": 0, 'fileName': name}
+            return {"data": fileType, "result": FileUpload.checkpoint_result(checkpoint),
+                    "message": UPLOAD_MESSAGES[checkpoint.file_type], "uploadedFileId": checkpoint.uploaded_file_id}
+
+        timings = StageTimings()
+        with timings.measure("parse"):
+            first_batch = next(batches, [])
+        columns = list(first_batch[0].keys()) if first_batch else []
+        fileType = FileUpload.detect_file_type(columns, name)
+
+        if not fileType:
+            batches.close()
+            return {"data": fileType, "message": "Could not determine file type based on column patterns."}
+
+        if checkpoint is None:
+            save_result = await BulkUploadService.saveUploadedFile(db, fileType, content_hash)
+            if save_result['status'] == 'duplicate':
+                batches.close()
+                return FileUpload.replay_upload(BulkUploadService.getUploadedFileByHash(db, content_hash))
+            if save_result['status'] != 'success':
+                batches.close()
+                return {"data": fileType,"result": save_result,  "message": "file uploded with errors"}
+            checkpoint = BulkUploadService.createUploadCheckpoint(
+                db, save_result['insertedId'], staged.staging_id, name, fileType['fileType'])
+        uploadedFileId = checkpoint.uploaded_file_id
+
+        memoryReport = FrameMemoryReport()
+        saveResult = await FileUpload.save_batches(
+            db, fileType['fileType'], FileUpload.normalized_batches(staged, name, fileType['fileType'], first_batch, batches),
+            uploadedFileId, memoryReport, checkpoint, timings
+        )
+        fileType.update(totalRecords=saveResult["totalRecords"],
+                        validRecords=saveResult["totalRecords"] - saveResult["rejectedRecords"],
+                        invalidRecords=saveResult["rejectedRecords"])
+        await BulkUploadService.updateUploadedFileDescription(db, uploadedFileId, fileType)
+        return {"data": fileType,"result": saveResult,  "message": UPLOAD_MESSAGES[fileType['fileType']], "memory": memoryReport.to_dict(),
+                "timings": timings.to_dict(), "uploadedFileId": uploadedFileId}
+
+    @staticmethod
+    async def ingest_staged_file(db, staged, layout=None, runMatching=True) -> Dict[str, Any]:
+        checkpoints = BulkUploadService.getUploadCheckpoints(db, staged.staging_id)
+        is_archive = split_extension(staged.filename)[1] == "zip"
+        claimedId = None
+
+        # Identical content was uploaded before: answer with its result, nothing is re-parsed
+        existing = BulkUploadService.getUploadedFileByHash(db, staged.sha256)
+        if existing is not None:
+            if existing.upload_result is None and checkpoints:
+                # Resuming this very upload, which claimed the hash on its first attempt
+                claimedId = existing.id if is_archive else None
+            elif existing.upload_result is None and FileUpload.is_abandoned(existing):
+                await BulkUploadService.releaseUploadHash(db, existing.id)
+            else:
+                staged.discard()
+                return FileUpload.replay_upload(existing)
+
         try:
-            # Read file
-            file_data = await read_file_by_extension(file)
-            df = pd.DataFrame(file_data["data"]) if isinstance(file_data, dict) and "data" in file_data else pd.DataFrame(file_data)
-
-            # Normalize columns
-            cols = [str(c).strip().lower().replace(" ", "").replace("_", "") for c in df.columns]
-            
-            mti_found = any("mti" in col for col in cols)
-            atm_index_found = any("atmindex" in col for col in cols)
-            flexcube_index_found = any("fctxnid" in col for col in cols)
-            fileType = {}        
-            if mti_found:
-                fileType = {'fileType':"SWITCH","totalRecords":len(df),"validRecords":len(df), "invalidRecords":0, 'fileName':file.filename}
-            elif atm_index_found:
-                fileType = {'fileType':"ATM","totalRecords":len(df),"validRecords":len(df), "invalidRecords":0, 'fileName':file.filename}
-            elif flexcube_index_found:
-                fileType = {'fileType':"FLEXCUBE","totalRecords":len(df),"validRecords":len(df), "invalidRecords":0, 'fileName':file.filename}
-            
-            if fileType:
-                save_result = await BulkUploadService.saveUploadedFile(db, fileType)
-                df.columns = [str(col).strip().lower() for col in df.columns]
-                normalized_data = df.to_dict(orient="records")
-
-                if save_result['status'] == 'success':
-                    if fileType['fileType'] == "ATM":
-                        saveAtmResult = await BulkUploadService.saveATMFileData(db, normalized_data, save_result['insertedId'])
-                        await MatchingRuleController.runMatchingEngine(db)
-                        return {"data": fileType,"result": saveAtmResult,  "message": "ATM file uploded"}
-                    elif fileType['fileType'] == "SWITCH":
-                        saveSwitchresult = await BulkUploadService.saveSwitchFileData(db, normalized_data, save_result['insertedId'])
-                        await MatchingRuleController.runMatchingEngine(db)
-                        return {"data": fileType,"result": saveSwitchresult,  "message": "Switch file uploded"}
-                    elif fileType['fileType'] == "FLEXCUBE":
-                        saveSwitchresult = await BulkUploadService.saveFlexCubeFileData(db, normalized_data, save_result['insertedId'])
-                        await MatchingRuleController.runMatchingEngine(db)
-                        return {"data": fileType,"result": saveSwitchresult,  "message": "Flec-cube file uploded"}
-                    return { "message": "Not FOund"}
-                else:
-                    return {"data": fileType,"result": save_result,  "message": "file uploded with errors"}
+            if is_archive and claimedId is None:
+                # The archive row carries the hash; each member gets its own row as usual
+                claim = await BulkUploadService.saveUploadedFile(
+                    db, {"fileType": "ARCHIVE", "fileName": staged.filename}, staged.sha256)
+                if claim["status"] == "duplicate":
+                    staged.discard()
+                    return FileUpload.replay_upload(BulkUploadService.getUploadedFileByHash(db, staged.sha256))
+                if claim["status"] != "success":
+                    return {"file_type": "ERROR", "error": claim["message"], "stagingId": staged.staging_id}
+                claimedId = claim["insertedId"]
+
+            # A plain or gzipped file has a single member; a zip can carry several sources
+            results, skipped = [], []
+            for name, batches in iter_upload_members(staged, layout=layout):
+                if batches is None:
+                    skipped.append(name)
+                    continue
+                result = await FileUpload.ingest_member(db, staged, name, batches, None if is_archive else staged.sha256,
+                                                        checkpoints.get(name))
+                if "duplicateOf" in result:
+                    staged.discard()
+                    return result
+                claimedId = claimedId or result.get("uploadedFileId")
+                results.append(result)
+
+            saved = any(r.get("result", {}).get("status") == "success" for r in results)
+            failed = any(r.get("result", {}).get("status") == "error" for r in results)
+            matchingRun = MatchingRuleController.scheduleMatchingRun("upload") if saved and runMatching else None
+
+            if is_archive:
+                response = {"data": {"fileType": "ARCHIVE", "fileName": staged.filename, "members": len(results),
+                                     "skipped": skipped},
+                            "result": results, "message": "Archive uploded"}
+                await BulkUploadService.updateUploadedFileDescription(db, claimedId, response["data"])
+            elif results:
+                response = results[0]
             else:
-                return {"data": fileType, "message": "Could not determine file type based on column patterns."}
+                response = {"data": {}, "message": "Could not determine file type based on column patterns."}
+
+            if matchingRun is not None:
+                response["matchingRunId"] = matchingRun.id
+
+            if failed:
+                if claimedId:
+                    await BulkUploadService.releaseUploadHash(db, claimedId)
+                response["stagingId"] = staged.staging_id
+            else:
+                if claimedId:
+                    await BulkUploadService.saveUploadResult(db, claimedId, _stored_result(response))
+                staged.discard()
+            return response
 
         except Exception as e:
-            return {"file_type": "ERROR", "error": str(e)}
+            db.rollback()
+            # Keep the staged file and the committed checkpoints, so the upload can be
+            # resumed without re-sending it; the content hash stays claimed until then
+            return {"file_type": "ERROR", "error": str(e), "stagingId": staged.staging_id}
         
 
     @staticmethod
@@ -1,7 +1,19 @@
 
 
+import asyncio
 import logging
-from app.services.MatchingRuleService import MatchingRuleService
+import uuid
+from app.core.config import MATCHING_CANCEL_POLL_SECONDS
+from app.db.database import SessionLocal
+from app.services.MatchingRuleService import SUMMARY_COLUMNS, MatchingRuleService, MatchResultWriter
+from app.services.ReconRunService import ReconRunService, output_counts
+from app.utils.matching_engine import MatchingCancelled, build_plan
+from app.utils.matching_runner import MatchingJob, shard_count
+from app.utils.matching_scheduler import MatchingRun, MatchingScheduler, advisory_lock
+from app.utils.stage_timer import StageTimings
+
+# Created on first use, inside the running event loop
+matching_scheduler = None
 
 class MatchingRuleController:
     
@@ -25,29 +37,135 @@ class MatchingRuleController:
             }
         
     @staticmethod
-    async def runMatchingEngine(db):
+    def scheduler() -> MatchingScheduler:
+        global matching_scheduler
+        if matching_scheduler is None:
+            matching_scheduler = MatchingScheduler(MatchingRuleController.executeMatchingRun)
+        return matching_scheduler
+
+    @staticmethod
+    def scheduleMatchingRun(trigger="upload") -> MatchingRun:
+        """Queue a coalesced matching run without waiting for it."""
+        return MatchingRuleController.scheduler().trigger(trigger)
+
+    @staticmethod
+    async def runMatchingEngine(db, wait=True, trigger="api"):
+        run = MatchingRuleController.scheduleMatchingRun(trigger)
+        if not wait:
+            return {
+                "success": True,
+                "status_code": 202,
+                "message": "Matching run scheduled",
+                "data": run.to_dict()
+            }
+        # Shielded: a client disconnect must not cancel a run other callers share
+        result = await asyncio.shield(run.done)
+        return {**result, "runId": run.id}
+
+    @staticmethod
+    async def explainMatchingRule(db, data):
+        """Dry run of a rule on samples of the sources: selectivity, candidate pairs, outcome and runtime."""
         try:
-            atm_data = MatchingRuleService.getAllAtmTransactions(db)
-            switch_data = MatchingRuleService.getAllSwitchTransactions(db)
-            flex_cube_data = MatchingRuleService.getAllFlexcubeTransactions(db)
-
-            if atm_data and switch_data and flex_cube_data:
-                get_Matching_json = MatchingRuleService.getMatchingRuleJson(db,userId=10,category=1)
-                matching_json = {
-                    "matchCondition": get_Matching_json[0]['matchcondition'],
-                    "tolerance": get_Matching_json[0]['tolerance']
-                }
-                reconMatchingData = await MatchingRuleService.match_three_way_async(atm_data,switch_data,flex_cube_data,matching_json)
-                # ref_no = f"RECON{''.join(__import__('random').choices('ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz', k=2))}{__import__('datetime').datetime.now().strftime('%d%m%y')}"
-                ref_no = "RECONfZ161225"
-                result = MatchingRuleService.saveReconMatchingSummary(db,reconMatchingData,ref_no)
-                return {
-                    "success": True,
-                    "status_code": 200,
-                    "message": "Matching Data save successfully.",
-                    "data": result,
-                    # "dsd":reconMatchingData
-                }
+            plan = await asyncio.get_running_loop().run_in_executor(
+                None, MatchingRuleService.explainMatchingRule, db, data
+            )
+            return {
+                "success": True,
+                "status_code": 200,
+                "message": "Matching rule plan",
+                "data": plan
+            }
+        except ValueError as e:
+            return {
+                "success": False,
+                "status_code": 400,
+                "message": str(e),
+                "data": None
+            }
+        except Exception as e:
+            logging.exception("Error while explaining matching rule")
+            return {
+                "success": False,
+                "status_code": 500,
+                "message": "Failed to explain matching rule",
+                "error": str(e)
+            }
+
+    @staticmethod
+    async def getMatchingRun(run_id):
+        run = MatchingRuleController.scheduler().get(run_id)
+        if run is None:
+            return {
+                "success": False,
+                "status_code": 404,
+                "message": "Matching run not found",
+                "data": None
+            }
+        return {
+            "success": True,
+            "status_code": 200,
+            "message": "Matching run status",
+            "data": run.to_dict()
+        }
+
+    @staticmethod
+    async def cancelMatchingRun(run_id):
+        run = MatchingRuleController.scheduler().cancel(run_id)
+        if run is None:
+            return {
+                "success": False,
+                "status_code": 404,
+                "message": "Matching run not found",
+                "data": None
+            }
+        return {
+            "success": True,
+            "status_code": 200,
+            "message": "Matching run cancellation requested",
+            "data": run.to_dict()
+        }
+
+    @staticmethod
+    async def executeMatchingRun(run):
+        """Scheduler runner: one engine pass on its own session, serialized across workers."""
+        db = SessionLocal()
+        try:
+            async with advisory_lock(db.get_bind()):
+                return await MatchingRuleController.executeMatchingEngine(db, run)
+        finally:
+            db.close()
+
+    @staticmethod
+    async def executeMatchingEngine(db, run=None):
+        try:
+            timings = StageTimings()
+            with timings.measure("load"):
+                counts = MatchingRuleService.countSourceRows(db)
+
+            if run is not None and run.resume is not None:
+                return await MatchingRuleController.resumeEngine(db, run, counts)
+            if all(counts.values()):
+                # One rule, or an ordered waterfall of them
+                with timings.measure("load"):
+                    matching_json = MatchingRuleService.getMatchingRuleSet(db,userId=10,category=1)
+                if matching_json is None:
+                    return {
+                        "success": False,
+                        "status_code": 400,
+                        "message": "No matching rule configured.",
+                        "data": []
+                    }
+                job = MatchingJob()
+                if run is not None:
+                    run.job = job
+                    if run.cancel_requested:
+                        job.cancel()
+                engine = MatchingRuleService.selectMatchingEngine(counts, matching_json)
+                run_id = run.id if run is not None else uuid.uuid4().hex
+                trigger = ",".join(dict.fromkeys(run.triggers)) if run is not None else "api"
+                shards = shard_count(counts["ATM"]) if engine == "memory" else 1
+                reconRun = ReconRunService.startRun(db, run_id, trigger, engine, matching_json, counts, shards)
+                return await MatchingRuleController.superviseEngine(db, reconRun, matching_json, job, timings, run)
             else:
                 return {
                     "success": False,
@@ -55,6 +173,13 @@ class MatchingRuleController:
                     "message": "Kindly upload all required files.",
                     "data": []
                 }
+        except MatchingCancelled:
+            return {
+                "success": False,
+                "status_code": 409,
+                "message": "Matching run cancelled",
+                "data": None
+            }
         except Exception as e:
             logging.exception("Error while save Matching transactions")
             return {
@@ -64,6 +189,282 @@ class MatchingRuleController:
                 "error": str(e)
             }
 
+    @staticmethod
+    async def resumeEngine(db, run, counts):
+        """Continue an interrupted recon run from its checkpoints, with the rule it started with."""
+        reconRun = ReconRunService.getRunByReference(db, run.resume)
+        if reconRun is None:
+            return {
+                "success": False,
+                "status_code": 404,
+                "message": "Reconciliation run not found",
+                "data": None
+            }
+        if reconRun.status == "completed" or reconRun.rule_json is None:
+            return {
+                "success": False,
+                "status_code": 409,
+                "message": "Reconciliation run cannot be resumed",
+                "data": ReconRunService.serialize(reconRun)
+            }
+        if reconRun.input_counts != counts:
+            # Checkpointed shards were matched against the old rows
+            return {
+                "success": False,
+                "status_code": 409,
+                "message": "Source data changed since the run started; start a new matching run",
+                "data": ReconRunService.serialize(reconRun)
+            }
+        job = MatchingJob()
+        run.job = job
+        if run.cancel_requested:
+            job.cancel()
+        # Timings accumulate over the attempts of the run
+        timings = StageTimings()
+        for stage, ms in (reconRun.stage_timings or {}).items():
+            timings.add(stage[:-2], ms)
+        reconRun = ReconRunService.resumeRun(db, reconRun)
+        return await MatchingRuleController.superviseEngine(db, reconRun, reconRun.rule_json, job, timings, run)
+
+    @staticmethod
+    async def superviseEngine(db, reconRun, matching_json, job, timings, run=None):
+        """runEngine, recording how the run ended and relaying cancel requests made through recon_runs."""
+        watcher = asyncio.get_running_loop().create_task(MatchingRuleController.watchCancel(reconRun.id, job, run))
+        try:
+            return await MatchingRuleController.runEngine(db, reconRun, reconRun.engine, matching_json, job, timings)
+        except MatchingCancelled:
+            ReconRunService.finishRun(db, reconRun, "cancelled", timings)
+            raise
+        except Exception as e:
+            ReconRunService.finishRun(db, reconRun, "failed", timings, error=str(e))
+            raise
+        finally:
+            watcher.cancel()
+
+    @staticmethod
+    async def watchCancel(record_id, job, run=None):
+        """
+        Poll the run's cancel flag, which any worker may set, and stop the job once it is.
+        The scheduler run is flagged too, so it ends as cancelled rather than failed.
+        """
+        loop = asyncio.get_running_loop()
+
+        def requested():
+            db = SessionLocal()
+            try:
+                return ReconRunService.isCancelRequested(db, record_id)
+            finally:
+                db.close()
+
+        while not job.cancelled:
+            await asyncio.sleep(MATCHING_CANCEL_POLL_SECONDS)
+            if await loop.run_in_executor(None, requested):
+                if run is not None:
+                    run.cancel_requested = True
+                job.cancel()
+
+    @staticmethod
+    async def runEngine(db, reconRun, engine, matching_json, job, timings):
+        """One engine pass for a registered run, timed per stage (load, index, match, persist)."""
+        if engine == "sql":
+            with timings.measure("match"):
+                result = await asyncio.get_running_loop().run_in_executor(
+                    None, MatchingRuleService.matchThreeWayInDatabase, db, matching_json, reconRun.run_id, reconRun.id
+                )
+            with timings.measure("persist"):
+                await asyncio.get_running_loop().run_in_executor(None, ReconRunService.recordDelta, db, reconRun)
+            reconRun = ReconRunService.finishRun(db, reconRun, "completed", timings, result)
+            return {
+                "success": True,
+                "status_code": 200,
+                "message": "Matching Data save successfully.",
+                "data": {"runId": reconRun.run_id, "engine": engine, **result},
+                "run": ReconRunService.serialize(reconRun),
+            }
+        # Results reach recon_match_results in batches while the run is in progress
+        if engine == "external":
+            with timings.measure("match"):
+                reconMatchingData = await MatchingRuleService.matchThreeWayExternal(db,matching_json,job,reconRun=reconRun)
+        else:
+            with timings.measure("load"):
+                packed = await asyncio.get_running_loop().run_in_executor(
+                    None, MatchingRuleService.loadPackedSources, db, build_plan(matching_json)
+                )
+            # Results are written off the event loop, on a session of their own
+            writerDb = SessionLocal()
+            try:
+                writer = MatchResultWriter(writerDb, reconRun.run_id, reconRun.id, cancel=job.cancel_event)
+                with timings.measure("match"):
+                    reconMatchingData = await MatchingRuleService.matchPackedInPool(packed, matching_json, job, writer,
+                                                                                    reconRun.shards)
+            finally:
+                writerDb.close()
+        # The engine reports its index build and streamed persist times; the rest of the call stays under match
+        for stage, ms in (("index", reconMatchingData.get("timings", {}).get("indexMs")),
+                          ("persist", reconMatchingData.get("persistMs"))):
+            if ms is not None:
+                timings.add(stage, ms)
+                timings.add("match", -ms)
+        with timings.measure("persist"):
+            result = MatchingRuleService.saveReconMatchingSummary(db,reconMatchingData,reconRun.reference)
+            await asyncio.get_running_loop().run_in_executor(None, ReconRunService.recordDelta, db, reconRun)
+        counts = MatchingRuleService.getMatchResultCounts(db, reconRun.run_id)
+        counts.update({status: count for status, count in output_counts(reconMatchingData).items() if status not in counts})
+        reconRun = ReconRunService.finishRun(db, reconRun, "completed", timings, counts,
+                                             rule_stats=reconMatchingData.get("rules"))
+        return {
+            "success": True,
+            "status_code": 200,
+            "message": "Matching Data save successfully.",
+            "data": result,
+            # Per-rule counts and timings of a waterfall run
+            "rules": reconMatchingData.get("rules", []),
+            "run": ReconRunService.serialize(reconRun),
+        }
+
+    @staticmethod
+    async def getReconRuns(db, offset=0, limit=20):
+        return {
+            "success": True,
+            "status_code": 200,
+            "message": "Reconciliation runs",
+            "data": ReconRunService.getRuns(db, offset, limit)
+        }
+
+    @staticmethod
+    async def getReconRun(db, reference):
+        record = ReconRunService.getRunByReference(db, reference)
+        if record is None:
+            return {
+                "success": False,
+                "status_code": 404,
+                "message": "Reconciliation run not found",
+                "data": None
+            }
+        return {
+            "success": True,
+            "status_code": 200,
+            "message": "Reconciliation run",
+            "data": {**ReconRunService.serialize(record), "checkpoints": ReconRunService.getCheckpoints(db, record)}
+        }
+
+    @staticmethod
+    async def cancelReconRun(db, reference):
+        """Ask a running recon run to stop, whichever worker runs it; its checkpoints stay for a resume."""
+        record = ReconRunService.getRunByReference(db, reference)
+        if record is None:
+            return {
+                "success": False,
+                "status_code": 404,
+                "message": "Reconciliation run not found",
+                "data": None
+            }
+        if record.status != "running":
+            return {
+                "success": False,
+                "status_code": 409,
+                "message": "Reconciliation run is not running",
+                "data": ReconRunService.serialize(record)
+            }
+        record = ReconRunService.requestCancel(db, record)
+        return {
+            "success": True,
+            "status_code": 200,
+            "message": "Reconciliation run cancellation requested",
+            "data": ReconRunService.serialize(record)
+        }
+
+    @staticmethod
+    async def resumeReconRun(db, reference, wait=True):
+        """
+        Continue a cancelled, failed or interrupted recon run from its last checkpoints,
+        through the scheduler so it never overlaps another run. A run still marked
+        running when its turn comes was interrupted (the advisory lock is free again).
+        """
+        record = ReconRunService.getRunByReference(db, reference)
+        if record is None:
+            return {
+                "success": False,
+                "status_code": 404,
+                "message": "Reconciliation run not found",
+                "data": None
+            }
+        if record.status == "completed":
+            return {
+                "success": False,
+                "status_code": 409,
+                "message": "Reconciliation run already completed",
+                "data": ReconRunService.serialize(record)
+            }
+        run = MatchingRuleController.scheduler().trigger("resume", resume=record.reference)
+        if run is None:
+            # Joining the pending run would drop this resume
+            return {
+                "success": False,
+                "status_code": 409,
+                "message": "Another matching run is pending; resume the run once it has started",
+                "data": MatchingRuleController.scheduler().pending.to_dict()
+            }
+        if not wait:
+            return {
+                "success": True,
+                "status_code": 202,
+                "message": "Reconciliation run resume scheduled",
+                "data": run.to_dict()
+            }
+        result = await asyncio.shield(run.done)
+        return {**result, "runId": run.id}
+
+    @staticmethod
+    async def getReconRunDelta(db, reference, kind=None, after=0, limit=100):
+        record = ReconRunService.getRunByReference(db, reference)
+        if record is None:
+            return {
+                "success": False,
+                "status_code": 404,
+                "message": "Reconciliation run not found",
+                "data": None
+            }
+        return {
+            "success": True,
+            "status_code": 200,
+            "message": "Reconciliation run delta",
+            "data": ReconRunService.getRunDelta(db, record, kind, after, limit)
+        }
+
+    @staticmethod
+    async def getReconRunResults(db, reference, status, offset=0, limit=50):
+        if status not in SUMMARY_COLUMNS:
+            return {
+                "success": False,
+                "status_code": 400,
+                "message": f"status must be one of {', '.join(SUMMARY_COLUMNS)}",
+                "data": None
+            }
+        page = MatchingRuleService.getResultPage(db, reference, status, offset, limit)
+        if page is None:
+            return {
+                "success": False,
+                "status_code": 404,
+                "message": "Reconciliation run not found",
+                "data": None
+            }
+        return {
+            "success": True,
+            "status_code": 200,
+            "message": "Reconciliation run results",
+            "data": page
+        }
+
+    @staticmethod
+    async def compareReconRuns(db, references=None, limit=10):
+        return {
+            "success": True,
+            "status_code": 200,
+            "message": "Reconciliation run timings",
+            "data": ReconRunService.compareRuns(db, references, limit)
+        }
+
     @staticmethod
     async def saveMarchingRule(db, data):
         result = MatchingRuleService.saveMatchingRule(db,data)
@@ -101,7 +502,7 @@ class MatchingRuleController:
             return {
                     "success": True,
                     "status_code": 200,
-                    "message": "Recon ATM Transactions Summery Data",
+                    "message": "Recon ATM Transactions Summery counts; page the lists from /recon-runs/{reference}/results",
                     "data": getAtmSummeryData
                 }
         except Exception as e:
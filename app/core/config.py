@@ -0,0 +1,60 @@
+import os
+import tempfile
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Upload staging: uploads are streamed to local disk before parsing
+UPLOAD_STAGING_DIR = os.getenv("UPLOAD_STAGING_DIR", os.path.join(tempfile.gettempdir(), "recon-uploads"))
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(2 * 1024 * 1024 * 1024)))
+UPLOAD_CHUNK_BYTES = int(os.getenv("UPLOAD_CHUNK_BYTES", str(1024 * 1024)))
+UPLOAD_STAGING_TTL_SECONDS = int(os.getenv("UPLOAD_STAGING_TTL_SECONDS", str(24 * 60 * 60)))
+
+# Rows per batch handed from the file readers to the save services
+UPLOAD_BATCH_ROWS = int(os.getenv("UPLOAD_BATCH_ROWS", "5000"))
+
+# Parallel CSV parsing: staged CSVs of at least UPLOAD_PARALLEL_MIN_BYTES are split
+# into record-aligned byte ranges and parsed across UPLOAD_PARSE_WORKERS processes
+UPLOAD_PARSE_WORKERS = int(os.getenv("UPLOAD_PARSE_WORKERS", str(os.cpu_count() or 1)))
+UPLOAD_PARALLEL_MIN_BYTES = int(os.getenv("UPLOAD_PARALLEL_MIN_BYTES", str(64 * 1024 * 1024)))
+UPLOAD_PARALLEL_CHUNK_BYTES = int(os.getenv("UPLOAD_PARALLEL_CHUNK_BYTES", str(16 * 1024 * 1024)))
+
+# Matching scheduler: triggers arriving within MATCHING_DEBOUNCE_SECONDS of each other
+# collapse into one run, which starts at most MATCHING_DEBOUNCE_MAX_SECONDS after the
+# first of them. Runs in every worker process serialize on a Postgres advisory lock.
+MATCHING_DEBOUNCE_SECONDS = float(os.getenv("MATCHING_DEBOUNCE_SECONDS", "2"))
+MATCHING_DEBOUNCE_MAX_SECONDS = float(os.getenv("MATCHING_DEBOUNCE_MAX_SECONDS", "30"))
+MATCHING_ADVISORY_LOCK_KEY = int(os.getenv("MATCHING_ADVISORY_LOCK_KEY", "7201"))
+MATCHING_RUN_HISTORY = int(os.getenv("MATCHING_RUN_HISTORY", "100"))
+
+# Matching engine process pool; runs never execute on the event loop
+MATCHING_WORKERS = int(os.getenv("MATCHING_WORKERS", str(os.cpu_count() or 1)))
+# Hash-partitioned matching: runs with at least MATCHING_PARTITION_MIN_ROWS ATM rows are
+# split into MATCHING_SHARDS shards by their primary match key, reconciled in parallel
+MATCHING_SHARDS = int(os.getenv("MATCHING_SHARDS", str(MATCHING_WORKERS)))
+MATCHING_PARTITION_MIN_ROWS = int(os.getenv("MATCHING_PARTITION_MIN_ROWS", "50000"))
+
+# Matching engine selection: "memory" loads all three sources, "external" sort-merges
+# them through spill files in MATCHING_SPILL_DIR within MATCHING_MEMORY_BUDGET_BYTES,
+# "auto" picks external once the sources would not fit in the budget, "sql" runs the
+# rule inside Postgres and writes recon_match_results instead of the summary JSON
+MATCHING_ENGINE = os.getenv("MATCHING_ENGINE", "auto")
+MATCHING_MEMORY_BUDGET_BYTES = int(os.getenv("MATCHING_MEMORY_BUDGET_BYTES", str(512 * 1024 * 1024)))
+MATCHING_SPILL_DIR = os.getenv("MATCHING_SPILL_DIR", os.path.join(tempfile.gettempdir(), "recon-matching"))
+MATCHING_STREAM_BATCH_ROWS = int(os.getenv("MATCHING_STREAM_BATCH_ROWS", "10000"))
+
+# Reconciliation run registry: runs older than RECON_RUN_RETENTION_DAYS, or beyond the
+# newest RECON_RUN_RETENTION_COUNT, are pruned with their summaries (0 keeps everything)
+RECON_RUN_RETENTION_DAYS = int(os.getenv("RECON_RUN_RETENTION_DAYS", "90"))
+RECON_RUN_RETENTION_COUNT = int(os.getenv("RECON_RUN_RETENTION_COUNT", "500"))
+# Match results are written to recon_match_results in batches of this many rows while the run is in progress
+MATCHING_PERSIST_BATCH_ROWS = int(os.getenv("MATCHING_PERSIST_BATCH_ROWS", "5000"))
+# How often a running match checks recon_runs for a cancel requested from another worker
+MATCHING_CANCEL_POLL_SECONDS = float(os.getenv("MATCHING_CANCEL_POLL_SECONDS", "2"))
+
+# Matching explain (dry run): rows sampled per source; the sampled ATM rows are matched
+# against their real candidates only while those stay under MATCHING_EXPLAIN_MAX_PARTNER_ROWS
+# per source, and a key giving more than MATCHING_EXPLAIN_MAX_PAIRS_PER_ROW candidates is flagged
+MATCHING_EXPLAIN_SAMPLE_ROWS = int(os.getenv("MATCHING_EXPLAIN_SAMPLE_ROWS", "2000"))
+MATCHING_EXPLAIN_MAX_PARTNER_ROWS = int(os.getenv("MATCHING_EXPLAIN_MAX_PARTNER_ROWS", "50000"))
+MATCHING_EXPLAIN_MAX_PAIRS_PER_ROW = int(os.getenv("MATCHING_EXPLAIN_MAX_PAIRS_PER_ROW", "50"))
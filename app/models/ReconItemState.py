@@ -0,0 +1,10 @@
+from sqlalchemy import BigInteger, Column, String
+from app.db.database import Base
+
+class ReconItemState(Base):
+    __tablename__ = "recon_item_states"
+
+    # Latest status of every ATM item, the baseline the next run's delta is taken against
+    atm_id = Column(BigInteger, primary_key=True, autoincrement=False)
+    status = Column(String(20), nullable=False)
+    recon_run_id = Column(BigInteger, nullable=False)  # run that set the status
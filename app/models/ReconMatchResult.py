@@ -0,0 +1,20 @@
+from sqlalchemy import TIMESTAMP, BigInteger, Column, Index, String
+from sqlalchemy.sql import func
+from app.db.database import Base
+
+class ReconMatchResult(Base):
+    __tablename__ = "recon_match_results"
+
+    id = Column(BigInteger, primary_key=True, index=True, autoincrement=True)
+    # Matching run the classification belongs to (scheduler run id)
+    run_id = Column(String(32), nullable=False, index=True)
+    status = Column(String(20), nullable=False)  # matched / partially_matched / unmatched / aggregate_matched
+    atm_id = Column(BigInteger, nullable=False, index=True)
+    switch_id = Column(BigInteger, nullable=True)
+    flexcube_id = Column(BigInteger, nullable=True)
+    created_at = Column(TIMESTAMP, server_default=func.now())
+
+    # Result pages of one status of a run, in write order
+    __table_args__ = (
+        Index("ix_recon_match_results_run_status_id", "run_id", "status", "id"),
+    )
@@ -11,6 +11,10 @@ class ReconMatchingSummary(Base):
     matched = Column(Text, nullable=True)
     un_matched = Column(Text, nullable=True)
     partially_matched = Column(Text, nullable=True)
+    # Scored fuzzy pairs over the unmatched/partial residue, for manual review
+    fuzzy_candidates = Column(Text, nullable=True)
+    # One-to-many matches whose grouped amounts add up (several dispenses in one posting)
+    aggregate_matched = Column(Text, nullable=True)
     added_by = Column(BigInteger)
     created_at = Column(TIMESTAMP, server_default=func.now())
     updated_at = Column(TIMESTAMP, server_default=func.now(), onupdate=func.now())
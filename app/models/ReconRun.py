@@ -0,0 +1,30 @@
+from sqlalchemy import JSON, TIMESTAMP, BigInteger, Boolean, Column, Float, Integer, String, Text
+from sqlalchemy.sql import func
+from app.db.database import Base
+
+class ReconRun(Base):
+    __tablename__ = "recon_runs"
+
+    id = Column(BigInteger, primary_key=True, index=True, autoincrement=True)
+    # Also the recon_matching_summary.recon_reference_number of the run
+    reference = Column(String(100), nullable=False, unique=True, index=True)
+    # Scheduler run id; recon_match_results rows of the sql engine carry it
+    run_id = Column(String(32), nullable=False, index=True)
+    trigger = Column(String(255), nullable=True)  # api / upload / ..., comma separated when coalesced
+    status = Column(String(20), nullable=False)  # running / completed / failed / cancelled
+    engine = Column(String(20), nullable=True)
+    rule_id = Column(String(255), nullable=True)  # comma separated for a waterfall
+    rule_version = Column(String(64), nullable=True)  # fingerprint of the rule JSON that ran
+    rule_json = Column(JSON, nullable=True)  # the rule JSON itself, so a resume repeats it
+    shards = Column(Integer, nullable=True)  # shards the ATM rows are partitioned into
+    input_counts = Column(JSON, nullable=True)  # rows per source
+    output_counts = Column(JSON, nullable=True)  # rows per status
+    delta_counts = Column(JSON, nullable=True)  # item transitions since the previous run, per kind
+    rule_stats = Column(JSON, nullable=True)  # per rule of a waterfall: rows evaluated, matches, ms
+    stage_timings = Column(JSON, nullable=True)  # {"loadMs": .., "indexMs": .., "matchMs": .., "persistMs": ..}
+    total_ms = Column(Float, nullable=True)
+    error = Column(Text, nullable=True)
+    # Set from any worker; the run stops at its next batch
+    cancel_requested = Column(Boolean, nullable=False, default=False)
+    started_at = Column(TIMESTAMP, server_default=func.now())
+    finished_at = Column(TIMESTAMP, nullable=True)
@@ -0,0 +1,20 @@
+from sqlalchemy import JSON, TIMESTAMP, BigInteger, Column, Integer, String, UniqueConstraint
+from sqlalchemy.sql import func
+from app.db.database import Base
+
+class ReconRunCheckpoint(Base):
+    __tablename__ = "recon_run_checkpoints"
+    __table_args__ = (UniqueConstraint("recon_run_id", "shard", name="uq_recon_run_checkpoints_run_shard"),)
+
+    id = Column(BigInteger, primary_key=True, index=True, autoincrement=True)
+    recon_run_id = Column(BigInteger, nullable=False, index=True)
+    shard = Column(Integer, nullable=False)  # 0 for an unsharded run
+
+    # Result rows of the shard committed so far; a resume skips them
+    rows_committed = Column(BigInteger, nullable=False, default=0)
+    status = Column(String(20), nullable=False, default="in_progress")
+    # Per-rule counts of a completed waterfall shard, merged again when a resume restores it
+    rule_stats = Column(JSON, nullable=True)
+
+    created_at = Column(TIMESTAMP, server_default=func.now())
+    updated_at = Column(TIMESTAMP, server_default=func.now(), onupdate=func.now())
@@ -0,0 +1,18 @@
+from sqlalchemy import BigInteger, Column, Index, String
+from app.db.database import Base
+
+class ReconRunDelta(Base):
+    __tablename__ = "recon_run_deltas"
+
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    recon_run_id = Column(BigInteger, nullable=False)
+    atm_id = Column(BigInteger, nullable=False)
+    kind = Column(String(20), nullable=False)  # new_break / resolved / partial_to_full / break_changed
+    from_status = Column(String(20), nullable=True)  # None: the item is new in this run
+    to_status = Column(String(20), nullable=False)
+
+    # Keyset pagination of one run's delta, optionally of one kind
+    __table_args__ = (
+        Index("ix_recon_run_deltas_run_id", "recon_run_id", "id"),
+        Index("ix_recon_run_deltas_run_kind_id", "recon_run_id", "kind", "id"),
+    )
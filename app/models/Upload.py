@@ -8,5 +8,7 @@ class UploadedFile(Base):
     file_description = Column(Text, nullable=True)
     uploaded_by = Column(BigInteger, nullable=True)
     status = Column(String(50), nullable=True)
+    content_hash = Column(String(64), nullable=True, unique=True, index=True)
+    upload_result = Column(Text, nullable=True)
     created_at = Column(TIMESTAMP, server_default=func.now())
     updated_at = Column(TIMESTAMP, server_default=func.now(), onupdate=func.now())
@@ -0,0 +1,23 @@
+from sqlalchemy import TIMESTAMP, BigInteger, Column, Integer, String
+from sqlalchemy.sql import func
+from app.db.database import Base
+
+class UploadCheckpoint(Base):
+    __tablename__ = "upload_checkpoints"
+
+    id = Column(BigInteger, primary_key=True, index=True, autoincrement=True)
+    uploaded_file_id = Column(BigInteger, nullable=False, unique=True, index=True)
+    staging_id = Column(String(32), nullable=False, index=True)
+    member_name = Column(String(500), nullable=False)
+    file_type = Column(String(20), nullable=False)
+
+    # Progress committed so far; rows_committed is the row index a resume restarts from
+    rows_committed = Column(BigInteger, nullable=False, default=0)
+    batches_committed = Column(Integer, nullable=False, default=0)
+    records_saved = Column(BigInteger, nullable=False, default=0)
+    duplicate_count = Column(BigInteger, nullable=False, default=0)
+    rejected_count = Column(BigInteger, nullable=False, default=0)
+    status = Column(String(20), nullable=False, default="in_progress")
+
+    created_at = Column(TIMESTAMP, server_default=func.now())
+    updated_at = Column(TIMESTAMP, server_default=func.now(), onupdate=func.now())
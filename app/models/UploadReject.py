@@ -0,0 +1,13 @@
+from sqlalchemy import TIMESTAMP, BigInteger, Column, Text
+from sqlalchemy.sql import func
+from app.db.database import Base
+
+class UploadReject(Base):
+    __tablename__ = "upload_rejects"
+
+    id = Column(BigInteger, primary_key=True, index=True, autoincrement=True)
+    uploaded_file_id = Column(BigInteger, nullable=False, index=True)
+    row_index = Column(BigInteger, nullable=False)
+    reason = Column(Text, nullable=True)
+    row_data = Column(Text, nullable=True)
+    created_at = Column(TIMESTAMP, server_default=func.now())
@@ -1,15 +1,245 @@
 
+import asyncio
 import datetime
 import json
+import logging
+import math
+import random
+import time
+from decimal import Decimal
 from locale import normalize
 from sqlalchemy.orm import Session
-from sqlalchemy import desc, select
+from sqlalchemy import desc, func, insert, select, tuple_, update
 from app.enums.matching_source import MatchingSource
 from app.models.MatchingRule import MatchingRule
 from app.models.ReconMatchingSummary import ReconMatchingSummary
+from app.models.ReconMatchResult import ReconMatchResult
+from app.models.ReconRun import ReconRun
+from app.models.ReconRunCheckpoint import ReconRunCheckpoint
 from app.models.FlexcubeTransaction import FlexcubeTransaction
 from app.models.SwitchTransaction import SwitchTransaction
 from app.models.atm_transaction import ATMTransaction
+from app.core.config import (MATCHING_ENGINE, MATCHING_EXPLAIN_MAX_PAIRS_PER_ROW, MATCHING_EXPLAIN_MAX_PARTNER_ROWS,
+                             MATCHING_EXPLAIN_SAMPLE_ROWS, MATCHING_MEMORY_BUDGET_BYTES, MATCHING_PERSIST_BATCH_ROWS,
+                             MATCHING_SPILL_DIR, MATCHING_STREAM_BATCH_ROWS, MATCHING_WORKERS)
+from app.services.ReconRunService import ReconRunService
+from app.utils.external_matcher import IN_MEMORY_ROW_BYTES, collect_external_match, external_match
+from app.utils.aggregate_matcher import aggregate_pass, aggregate_residue, apply_aggregates
+from app.utils.fuzzy_matcher import fuzzy_pass, residue
+from app.utils.matching_engine import (LINK_SOURCES, SOURCES, MatchingCancelled, MatchPlan, RuleSet, build_plan,
+                                       compact_matches, expand_matches, expand_page, match_rules, pack_source,
+                                       page_ids)
+from app.utils.match_explainer import (explain_rule_json, group_breakdown, key_stats, plan_windows, probe_stats,
+                                       sample_keys)
+from app.utils.matching_runner import get_matching_pool, run_matching_job, shard_count
+from app.utils.rule_sql import compile_match_query, key_columns
+
+SOURCE_MODELS = {"ATM": ATMTransaction, "Switch": SwitchTransaction, "Flexcube": FlexcubeTransaction}
+# Statuses written row by row to recon_match_results; the other summary lists stay in the summary JSON
+RESULT_STATUSES = ("matched", "partially_matched", "unmatched")
+# Summary list -> recon_matching_summary column holding it
+SUMMARY_COLUMNS = {
+    "matched": "matched",
+    "partially_matched": "partially_matched",
+    "unmatched": "un_matched",
+    "fuzzy_candidates": "fuzzy_candidates",
+    "aggregate_matched": "aggregate_matched",
+}
+
+
+def _key_batches(keys, size=1000):
+    keys = list(keys)
+    for start in range(0, len(keys), size):
+        yield keys[start:start + size]
+
+
+def _key_in(columns, keys):
+    # Single-field keys compare as plain values, composite ones as row values
+    if len(columns) == 1:
+        return columns[0].in_([key[0] for key in keys])
+    return tuple_(*columns).in_(keys)
+
+
+def _plain(value):
+    # Same coercion as the getAll* dicts, so keys normalize identically in both engines
+    if isinstance(value, Decimal):
+        return float(value) if value else None
+    return value
+
+
+class MatchResultWriter:
+    """
+    Writes match results to recon_match_results while a run is in progress, one
+    bounded batch at a time. After every batch the run's output_counts show what has
+    been persisted so far.
+
+    For a registered run every shard's progress is checkpointed in
+    recon_run_checkpoints, committed with each batch: a resumed run skips the rows a
+    shard already committed, and restores completed shards from the table instead of
+    matching them again. A set cancel event stops the run after the batch in flight.
+    """
+
+    def __init__(self, db: Session, run_id, recon_run_id=None, batch_rows=MATCHING_PERSIST_BATCH_ROWS, cancel=None):
+        self.db = db
+        self.run_id = run_id
+        self.recon_run_id = recon_run_id
+        self.batch_rows = batch_rows
+        self.cancel = cancel
+        self.buffer = []
+        self.counts = {status: 0 for status in RESULT_STATUSES}
+        self.ms = 0.0
+        self.checkpoints = {}
+        self.checkpoint = None
+        self.skip = 0
+        if recon_run_id is not None:
+            checkpoints = db.query(ReconRunCheckpoint).filter(ReconRunCheckpoint.recon_run_id == recon_run_id).all()
+            self.checkpoints = {checkpoint.shard: checkpoint for checkpoint in checkpoints}
+            if self.checkpoints:
+                # A resumed run: counting continues from what earlier attempts committed
+                self.counts.update(MatchingRuleService.getMatchResultCounts(db, run_id))
+
+    def completed(self, shard):
+        checkpoint = self.checkpoints.get(shard)
+        return checkpoint is not None and checkpoint.status == "completed"
+
+    def begin(self, shard):
+        """Write the results of one shard from here on; rows its checkpoint already committed are skipped."""
+        self.flush()
+        if self.recon_run_id is None:
+            return
+        checkpoint = self.checkpoints.get(shard)
+        if checkpoint is None:
+            checkpoint = ReconRunCheckpoint(recon_run_id=self.recon_run_id, shard=shard, rows_committed=0,
+                                            status="in_progress")
+            self.db.add(checkpoint)
+            self.checkpoints[shard] = checkpoint
+        self.checkpoint, self.skip = checkpoint, checkpoint.rows_committed
+
+    def complete(self):
+        """Flush the current shard and mark its checkpoint completed in the same commit."""
+        if self.checkpoint is not None:
+            self.checkpoint.status = "completed"
+        self.flush()
+        self.checkpoint = None
+
+    def add(self, status, atm_id, switch_id=None, flex_id=None):
+        if self.skip:
+            # Committed by an earlier attempt; results are emitted in the same order every time
+            self.skip -= 1
+            return
+        self.buffer.append({"run_id": self.run_id, "status": status, "atm_id": atm_id,
+                            "switch_id": switch_id, "flexcube_id": flex_id})
+        if len(self.buffer) >= self.batch_rows:
+            self.flush()
+
+    def addIds(self, shard, ids):
+        """Write the matched / partially_matched / unmatched ids of one engine (shard) result."""
+        self.begin(shard)
+        if self.checkpoint is not None and "rules" in ids:
+            # Kept for a resume that restores the shard; committed with its last batch
+            self.checkpoint.rule_stats = ids["rules"]
+        try:
+            for atm_id, switch_id, flex_id in ids["matched"]:
+                self.add("matched", atm_id, switch_id, flex_id)
+            for atm_id, switch_id in ids["partially_matched"]:
+                self.add("partially_matched", atm_id, switch_id)
+            for atm_id in ids["unmatched"]:
+                self.add("unmatched", atm_id)
+            self.complete()
+        except BaseException:
+            # Uncommitted rows of the shard are left to a resume, not to the next shard's flush
+            self.buffer, self.checkpoint = [], None
+            raise
+
+    def restoreIds(self, shard, atm_ids):
+        """The ids a completed shard wrote in an earlier attempt, read back for the given ATM ids; else None."""
+        if not self.completed(shard):
+            return None
+        ids = {"matched": [], "partially_matched": [], "unmatched": []}
+        for start in range(0, len(atm_ids), self.batch_rows):
+            rows = (
+                self.db.query(ReconMatchResult.atm_id, ReconMatchResult.status, ReconMatchResult.switch_id,
+                              ReconMatchResult.flexcube_id)
+                .filter(ReconMatchResult.run_id == self.run_id,
+                        ReconMatchResult.atm_id.in_(atm_ids[start:start + self.batch_rows]))
+            )
+            for atm_id, status, switch_id, flex_id in rows:
+                if status == "matched":
+                    ids["matched"].append((atm_id, switch_id, flex_id))
+                elif switch_id is not None:
+                    # An aggregate_matched row keeps the switch id of the partial match it was
+                    ids["partially_matched"].append((atm_id, switch_id))
+                else:
+                    ids["unmatched"].append(atm_id)
+        if self.checkpoints[shard].rule_stats is not None:
+            ids["rules"] = self.checkpoints[shard].rule_stats
+        return ids
+
+    def markAggregated(self, aggregated):
+        """Move the ATM rows an aggregate match covers out of their written status."""
+        covered = []
+        for one_source, one_id, many_source, many_ids, _ in aggregated:
+            covered += [one_id] if one_source == "ATM" else many_ids if many_source == "ATM" else []
+        self.flush()
+        for start in range(0, len(covered), self.batch_rows):
+            batch = covered[start:start + self.batch_rows]
+            self.db.execute(
+                update(ReconMatchResult)
+                .where(ReconMatchResult.run_id == self.run_id, ReconMatchResult.atm_id.in_(batch))
+                .values(status="aggregate_matched")
+            )
+        self.db.commit()
+
+    def flush(self):
+        started = time.perf_counter()
+        if self.buffer:
+            self.db.execute(insert(ReconMatchResult), self.buffer)
+            for row in self.buffer:
+                self.counts[row["status"]] += 1
+            if self.checkpoint is not None:
+                self.checkpoint.rows_committed += len(self.buffer)
+            if self.recon_run_id is not None:
+                self.db.execute(update(ReconRun).where(ReconRun.id == self.recon_run_id)
+                                .values(output_counts=dict(self.counts)))
+        # Pending checkpoint changes commit with the batch, or on their own
+        self.db.commit()
+        self.buffer = []
+        self.ms += (time.perf_counter() - started) * 1000
+        if self.cancel is not None and self.cancel.is_set():
+            raise MatchingCancelled()
+
+
+def _external_match_worker(matching_json, budget_bytes, spill_dir, progress=None, cancel=None,
+                           run_id=None, recon_run_id=None):
+    """
+    Process pool entry point: streams the sources on a fresh session and sort-merges
+    them. With a run_id the results are persisted as they are emitted and only the
+    counts come back; otherwise the ids are collected.
+    """
+    from app.db.database import SessionLocal
+
+    plan = MatchPlan(matching_json)
+    db = SessionLocal()
+    try:
+        streams = [MatchingRuleService.streamSourceRows(db, source, plan.load_fields(source)) for source in SOURCES]
+        if run_id is None:
+            return collect_external_match(*streams, plan, budget_bytes, spill_dir, progress, cancel)
+        # Source rows stream on db; results are written on a session of their own
+        results_db = SessionLocal()
+        try:
+            writer = MatchResultWriter(results_db, run_id, recon_run_id, cancel=cancel)
+            if not writer.completed(0):
+                # One stream: a resume re-merges the sources and skips the rows already committed
+                writer.begin(0)
+                external_match(*streams, plan, writer.add, budget_bytes, spill_dir, progress, cancel,
+                               progress_key="processed:0")
+                writer.complete()
+            return {"counts": writer.counts, "persistMs": writer.ms}
+        finally:
+            results_db.close()
+    finally:
+        db.close()
+
 
 class MatchingRuleService:
 
@@ -42,8 +272,10 @@ class MatchingRuleService:
             }
         
     @staticmethod
-    def getAllAtmTransactions(db: Session):
-        rows = db.query(ATMTransaction).limit(20).all()  # simpler than db.execute
+    def getAllAtmTransactions(db: Session, ids=None):
+        query = db.query(ATMTransaction)
+        # ids: fetch exactly these rows, e.g. to expand an external matching run
+        rows = query.filter(ATMTransaction.id.in_(ids)).all() if ids is not None else query.limit(20).all()
         return [
             {
                 "id": row.id,
@@ -69,8 +301,10 @@ class MatchingRuleService:
         ]
     
     @staticmethod
-    def getAllSwitchTransactions(db: Session):
-        rows = db.query(SwitchTransaction).limit(20).all()
+    def getAllSwitchTransactions(db: Session, ids=None):
+        query = db.query(SwitchTransaction)
+        # ids: fetch exactly these rows, e.g. to expand an external matching run
+        rows = query.filter(SwitchTransaction.id.in_(ids)).all() if ids is not None else query.limit(20).all()
         return [
             {
                 "id": row.id,
@@ -96,8 +330,10 @@ class MatchingRuleService:
         ]
 
     @staticmethod
-    def getAllFlexcubeTransactions(db: Session):
-        rows = db.query(FlexcubeTransaction).limit(20).all()
+    def getAllFlexcubeTransactions(db: Session, ids=None):
+        query = db.query(FlexcubeTransaction)
+        # ids: fetch exactly these rows, e.g. to expand an external matching run
+        rows = query.filter(FlexcubeTransaction.id.in_(ids)).all() if ids is not None else query.limit(20).all()
         return [
             {
                 "id": row.id,
@@ -106,6 +342,7 @@ class MatchingRuleService:
                 "rrn": row.rrn,
                 "stan": row.stan,
                 "account_masked": row.account_masked,
+                "dr": float(row.dr) if row.dr else None,
                 "currency": row.currency,
                 "status": row.status,
                 "description": row.description,
@@ -143,127 +380,373 @@ class MatchingRuleService:
 
 
     
+    @staticmethod
+    def getMatchingRuleSet(db: Session, userId=10, category=1):
+        """
+        Rule JSON for the engine. Rules whose basic details carry a numeric "sequence"
+        form a waterfall, run in ascending sequence; otherwise the latest rule runs alone.
+        """
+        rules = MatchingRuleService.getMatchingRuleJson(db, userId=userId, category=category)
+
+        def sequence(rule):
+            details = rule["basic_details"]
+            value = details.get("sequence") if isinstance(details, dict) else None
+            return value if isinstance(value, (int, float)) and not isinstance(value, bool) else None
+
+        def as_json(rule):
+            return {"ruleId": rule["id"], "matchCondition": rule["matchcondition"], "tolerance": rule["tolerance"]}
+
+        waterfall = sorted((rule for rule in rules if sequence(rule) is not None),
+                           key=lambda rule: (sequence(rule), rule["id"]))
+        if len(waterfall) > 1:
+            return [as_json(rule) for rule in waterfall]
+        return as_json(rules[0]) if rules else None
+
     async def match_three_way_async(ATM_file, Switch_file, Flexcube_file, matching_json):
-        matched = []
-        partially_matched = []
-        unmatched = []
-
-        matching_groups = matching_json["matchCondition"].get("matchingGroups", [])
-        tolerance_cfg = matching_json.get("tolerance", {})
-
-        def normalize(val):
-            """Normalize values for comparison"""
-            if val is None:
-                return ""
-            return str(val).strip().upper()
-
-        for atm_row in ATM_file:
-            atm_matched = False
-            atm_partial = False
-            last_switch_row = None
-
-            for switch_row in Switch_file:
-                atm_switch_ok = True
-
-                # 🔹 STEP 1: ATM ↔ SWITCH COMPARISON
-                for group in matching_groups:
-                    fields = group.get("fields", [])
-
-                    for f in fields:
-                        a = f.get("matching_fieldA")
-                        b = f.get("matching_fieldB")
-                        c = f.get("matching_fieldC")
-
-                        # Only compare A↔B if both A and B exist (and C doesn't)
-                        if a and b and not c:
-                            if normalize(atm_row.get(a)) != normalize(switch_row.get(b)):
-                                atm_switch_ok = False
-                                break
-
-                    if not atm_switch_ok:
-                        break
-
-                if not atm_switch_ok:
-                    continue
-
-                # ATM matched with Switch
-                atm_partial = True
-                last_switch_row = switch_row
-
-                # 🔹 STEP 2: SWITCH ↔ FLEXCUBE COMPARISON
-                for flex_row in Flexcube_file:
-                    switch_flex_ok = True
-
-                    for group in matching_groups:
-                        fields = group.get("fields", [])
-
-                        for f in fields:
-                            b = f.get("matching_fieldB")
-                            c = f.get("matching_fieldC")
-                            a = f.get("matching_fieldA")
-
-                            # Only compare B↔C if both B and C exist (and A doesn't)
-                            if b and c and not a:
-                                if normalize(switch_row.get(b)) != normalize(flex_row.get(c)):
-                                    switch_flex_ok = False
-                                    break
-
-                        if not switch_flex_ok:
-                            break
-
-                    # 🔹 STEP 3: AMOUNT TOLERANCE CHECK
-                    if switch_flex_ok and tolerance_cfg.get("allowAmountDiff") == "N":
-                        try:
-                            atm_amt = float(atm_row.get("amount", 0) or 0)
-                            flex_amt = float(flex_row.get("DR", 0) or 0)
-                            allowed_diff = float(tolerance_cfg.get("amountDiff", 0))
-
-                            if abs(atm_amt - flex_amt) > allowed_diff:
-                                switch_flex_ok = False
-                        except (ValueError, TypeError):
-                            switch_flex_ok = False
-
-                    # 🔹 FULL MATCH FOUND
-                    if switch_flex_ok:
-                        matched.append({
-                            "ATM": atm_row,
-                            "Switch": switch_row,
-                            "Flexcube": flex_row
-                        })
-                        atm_matched = True
-                        break
-
-                if atm_matched:
-                    break
-
-            # 🔹 FINAL CLASSIFICATION
-            if atm_matched:
-                continue
-
-            if atm_partial:
-                partially_matched.append({
-                    "ATM": atm_row,
-                    "Switch": last_switch_row,
-                    "Flexcube": None
-                })
-            else:
-                unmatched.append({
-                    "ATM": atm_row,
-                    "Switch": None,
-                    "Flexcube": None
-                })
+        # In-process match; runMatchingEngine uses matchThreeWayInPool to keep the event loop free
+        plan = build_plan(matching_json)
+        packed = (
+            pack_source(ATM_file, plan, "ATM"),
+            pack_source(Switch_file, plan, "Switch"),
+            pack_source(Flexcube_file, plan, "Flexcube"),
+        )
+        ids = match_rules(*packed, plan)
+        if plan.aggregate is not None:
+            apply_aggregates(ids, aggregate_pass(aggregate_residue(*packed, ids), plan.aggregate))
+        if plan.fuzzy is not None:
+            ids["fuzzy"] = fuzzy_pass(residue(*packed, ids), plan)
+        return expand_matches(ids, ATM_file, Switch_file, Flexcube_file)
 
-        return {
-            "matched": matched,
-            "partially_matched": partially_matched,
-            "unmatched": unmatched
+    @staticmethod
+    def loadPackedSources(db: Session, plan):
+        """
+        The three sources packed for the engine straight from the cursor: only the id and
+        the columns the rule and its tolerance read are selected, and no row dict outlives
+        its packing. Full rows are fetched by id when a result page is requested.
+        """
+        return tuple(
+            pack_source(MatchingRuleService.streamSourceRows(db, source, plan.load_fields(source)), plan, source)
+            for source in SOURCES
+        )
+
+    async def matchPackedInPool(packed, matching_json, job=None, writer=None, shards=None):
+        """
+        Match packed sources on the matching process pool; the summary lists hold row ids
+        only. With a MatchResultWriter every shard's results are persisted as soon as the
+        shard finishes, shards completed by an earlier attempt are restored instead of
+        matched, and the summary keeps only the fuzzy and aggregate lists. The writer's
+        inserts run on the default thread pool, so its session must be its own.
+        """
+        if writer is None:
+            return compact_matches(await run_matching_job(*packed, matching_json, job, shards))
+        ids = await run_matching_job(*packed, matching_json, job, shards, on_result=writer.addIds,
+                                     restore=writer.restoreIds)
+        await asyncio.get_running_loop().run_in_executor(None, writer.markAggregated, ids.get("aggregated", []))
+        summary = compact_matches(ids)
+        for status in RESULT_STATUSES:
+            summary.pop(status)
+        summary["persistMs"] = writer.ms
+        return summary
+
+    async def matchThreeWayInPool(ATM_file, Switch_file, Flexcube_file, matching_json, job=None):
+        """
+        Same result as match_three_way_async, computed on the matching process pool. Only
+        the packed key columns are sent to the worker and only row ids come back.
+        """
+        plan = build_plan(matching_json)
+        ids = await run_matching_job(
+            pack_source(ATM_file, plan, "ATM"),
+            pack_source(Switch_file, plan, "Switch"),
+            pack_source(Flexcube_file, plan, "Flexcube"),
+            matching_json,
+            job,
+        )
+        return expand_matches(ids, ATM_file, Switch_file, Flexcube_file)
+
+    @staticmethod
+    def countSourceRows(db: Session):
+        return {source: db.query(model).count() for source, model in SOURCE_MODELS.items()}
+
+    @staticmethod
+    def selectMatchingEngine(counts, matching_json=None):
+        """MATCHING_ENGINE, or for "auto" whichever engine fits the sources in the memory budget."""
+        plan = build_plan(matching_json) if matching_json is not None else None
+        if plan is not None and (isinstance(plan, RuleSet) or plan.windows or plan.fuzzy or plan.aggregate):
+            # Waterfalls, tolerance windows and the fuzzy and aggregate passes are evaluated by the in-memory engine only
+            if MATCHING_ENGINE not in ("auto", "memory"):
+                logging.warning("Rule set, tolerance windows, fuzzy or aggregate pass; using the memory engine "
+                                "instead of %s",
+                                MATCHING_ENGINE)
+            return "memory"
+        if MATCHING_ENGINE != "auto":
+            return MATCHING_ENGINE
+        in_memory = sum(counts.values()) * IN_MEMORY_ROW_BYTES
+        return "external" if in_memory > MATCHING_MEMORY_BUDGET_BYTES else "memory"
+
+    @staticmethod
+    def streamSourceRows(db: Session, source, fields, where=()):
+        """Yield id plus the given columns of one source in id order, a batch at a time."""
+        model = SOURCE_MODELS[source]
+        columns = [model.id] + [getattr(model, field) for field in fields if field != "id" and hasattr(model, field)]
+        for row in db.query(*columns).filter(*where).order_by(model.id).yield_per(MATCHING_STREAM_BATCH_ROWS):
+            yield {key: _plain(value) for key, value in row._mapping.items()}
+
+    @staticmethod
+    def sampleSourceRows(db: Session, source, fields, rows, total):
+        """About rows rows of a source spread over its id range: every step-th id from a random offset."""
+        model = SOURCE_MODELS[source]
+        step = max(1, math.ceil(total / rows))
+        return list(MatchingRuleService.streamSourceRows(db, source, fields, [model.id % step == random.randrange(step)]))
+
+    @staticmethod
+    def keyFrequencies(db: Session, source, key_fields, keys):
+        """
+        Rows of a source per key, for the given keys only. Keys are normalized in SQL by
+        rule_sql.key_columns, which renders every column type (amounts, timestamps,
+        integers, text) as the engine packs it, so the counts line up with sampled keys.
+        """
+        columns = key_columns(SOURCE_MODELS[source].__table__, key_fields)
+        counts = {}
+        for batch in _key_batches(keys):
+            query = select(*columns, func.count()).where(_key_in(columns, batch)).group_by(*columns)
+            for row in db.execute(query):
+                counts[tuple(row[:-1])] = row[-1]
+        return counts
+
+    @staticmethod
+    def keyRows(db: Session, source, fields, key_fields, keys):
+        """Id plus the given columns of the source rows whose key, normalized like keyFrequencies', is one of keys."""
+        columns = key_columns(SOURCE_MODELS[source].__table__, key_fields)
+        rows = {}
+        for batch in _key_batches(keys):
+            for row in MatchingRuleService.streamSourceRows(db, source, fields, [_key_in(columns, batch)]):
+                rows[row["id"]] = row
+        return [rows[row_id] for row_id in sorted(rows)]
+
+    @staticmethod
+    def explainMatchingRule(db: Session, data):
+        """
+        Dry run of a rule (a /matching-rule body, or a list of them as a waterfall)
+        against samples of the sources; nothing is written. Per rule: each matching
+        group's key cardinalities and selectivity on its own, and the candidate pairs
+        of its combined keys, counted exactly for the sampled keys. For the whole rule:
+        the engine a run would pick, the outcome of the sampled ATM rows matched against
+        their real candidates scaled to the full volume, and the runtime per stage,
+        extrapolated from that sample and from the stage rates of recent runs.
+        """
+        matching_json = explain_rule_json(data)
+        plan = build_plan(matching_json)
+        rule_jsons = matching_json if isinstance(matching_json, list) else [matching_json]
+        plans = plan.plans if isinstance(plan, RuleSet) else [plan]
+        totals = MatchingRuleService.countSourceRows(db)
+        engine = MatchingRuleService.selectMatchingEngine(totals, matching_json)
+        samples = {
+            source: pack_source(MatchingRuleService.sampleSourceRows(
+                db, source, plan.load_fields(source), MATCHING_EXPLAIN_SAMPLE_ROWS, totals[source]), plan, source)
+            for source in SOURCES
         }
+        warnings, notes = [], []
+
+        rules = []
+        for number, (rule_json, rule_plan) in enumerate(zip(rule_jsons, plans)):
+            label = f"Rule {rule_plan.rule_id if rule_plan.rule_id is not None else number + 1}"
+            groups = [group_breakdown(group, samples, totals)
+                      for group in rule_json["matchCondition"].get("matchingGroups", [])]
+            for index, group in enumerate(groups, 1):
+                if group["ignoredFields"]:
+                    warnings.append(f"{label}, group {index}: {len(group['ignoredFields'])} field mapping(s) "
+                                    f"join neither A-B nor B-C and are not compared")
+            links = {}
+            for link, pairs in (("AB", rule_plan.ab_pairs), ("BC", rule_plan.bc_pairs)):
+                left_source, right_source = LINK_SOURCES[link]
+                left_fields, right_fields = [l for l, _ in pairs], [r for _, r in pairs]
+                left_keys = sample_keys(samples[left_source], left_fields)
+                right_counts = (MatchingRuleService.keyFrequencies(db, right_source, right_fields, set(left_keys))
+                                if pairs else None)
+                stats = probe_stats(left_keys, right_counts, totals[left_source], totals[right_source])
+                links[link] = {"fields": [{left_source: l, right_source: r} for l, r in pairs],
+                               "emptyKeyPct": key_stats(left_keys, totals[left_source])["emptyPct"] if pairs else None,
+                               **stats}
+                if not pairs:
+                    warnings.append(f"{label}: no {left_source}-{right_source} key, every {right_source} row is a "
+                                    f"candidate of every {left_source} row")
+                elif stats["pairsPerRow"] > MATCHING_EXPLAIN_MAX_PAIRS_PER_ROW:
+                    warnings.append(f"{label}: {stats['pairsPerRow']} {right_source} candidates per "
+                                    f"{left_source} row on the {link} key")
+                if pairs and links[link]["emptyKeyPct"] > 5:
+                    warnings.append(f"{label}: {links[link]['emptyKeyPct']}% of {left_source} rows have an empty "
+                                    f"{link} key and share one block")
+            rules.append({"rule": number, "ruleId": rule_plan.rule_id, "groups": groups, "links": links,
+                          "windows": plan_windows(rule_plan), "amountTolerance": rule_plan.check_amount})
+
+        sample_rows = len(samples["ATM"]["ids"])
+        sampled = MatchingRuleService.matchSample(db, plan, samples, totals) if sample_rows else None
+        if sample_rows and sampled is None:
+            warnings.append(f"The sampled ATM rows have more than {MATCHING_EXPLAIN_MAX_PARTNER_ROWS} candidate rows "
+                            f"in one source; outcome and match time are not predicted")
+        input_rows = sum(totals.values())
+        stages, basis = {}, {}
+        for stage, rate in ReconRunService.stageRates(db, engine).items():
+            stages[stage], basis[stage] = rate * input_rows, "history"
+        dry_run = None
+        if sampled is not None:
+            ids, partner_rows = sampled
+            scale = totals["ATM"] / sample_rows
+            dry_run = {"partnerRows": partner_rows,
+                       "predicted": {status: round(len(ids[status]) * scale) for status in RESULT_STATUSES}}
+            if "rules" in ids:
+                dry_run["rules"] = [
+                    {"rule": stats["rule"], "ruleId": stats["ruleId"],
+                     **{key: round(stats[key] * scale) for key in ("atmRows", "matched", "partiallyMatched")}}
+                    for stats in ids["rules"]
+                ]
+            if engine == "memory" or "match" not in stages:
+                # Index builds scale with all rows, probes with ATM rows; shards match in parallel
+                sharded = engine == "memory" and plan.shard_fields()["ATM"] is not None
+                parallel = min(shard_count(totals["ATM"]), MATCHING_WORKERS) if sharded else 1
+                stages["index"] = ids["timings"]["indexMs"] * input_rows / (sample_rows + sum(partner_rows.values()))
+                stages["index"] /= parallel
+                stages["match"] = ids["timings"]["matchMs"] * scale / parallel
+                basis["index"] = basis["match"] = "sample"
+        if "history" not in basis.values():
+            notes.append(f"No completed {engine} run yet: load and persist times are not estimated")
+        for name, spec in (("aggregate", plan.aggregate), ("fuzzy", plan.fuzzy)):
+            if spec is not None:
+                notes.append(f"The {name} pass runs over the residue of the full run and is not simulated")
+        if isinstance(plan, RuleSet):
+            notes.append("Waterfall: Switch and Flexcube rows consumed by unsampled ATM rows are not consumed "
+                         "in the sample")
 
+        return {
+            "engine": engine,
+            "inputCounts": totals,
+            "sampleRows": {source: len(samples[source]["ids"]) for source in SOURCES},
+            "rules": rules,
+            "dryRun": dry_run,
+            "runtime": {
+                "stages": {f"{stage}Ms": round(ms, 1) for stage, ms in stages.items()},
+                "basis": basis,
+                "totalMs": round(sum(stages.values()), 1) if stages else None,
+            },
+            "warnings": warnings,
+            "notes": notes,
+        }
 
+    @staticmethod
+    def matchSample(db: Session, plan, samples, totals):
+        """
+        Match the sampled ATM rows against every Switch and Flexcube row that can be one
+        of their candidates. Within one rule an ATM row's outcome depends on its own
+        candidates only, so these rows get the outcome they would get in a full run.
+        Returns (ids, candidate rows per source), or None when the candidates of a
+        source exceed MATCHING_EXPLAIN_MAX_PARTNER_ROWS.
+        """
+        plans = plan.plans if isinstance(plan, RuleSet) else [plan]
+        packed = {"ATM": samples["ATM"]}
+        for link in ("AB", "BC"):
+            left_source, right_source = LINK_SOURCES[link]
+            keyed = []
+            for rule_plan in plans:
+                pairs = rule_plan.ab_pairs if link == "AB" else rule_plan.bc_pairs
+                keyed.append(([r for _, r in pairs], set(sample_keys(packed[left_source], [l for l, _ in pairs])))
+                             if pairs else None)
+            if None in keyed:
+                # A rule without a key on this link: every row is a candidate
+                if totals[right_source] > MATCHING_EXPLAIN_MAX_PARTNER_ROWS:
+                    return None
+                rows = list(MatchingRuleService.streamSourceRows(db, right_source, plan.load_fields(right_source)))
+            else:
+                expected = sum(sum(MatchingRuleService.keyFrequencies(db, right_source, fields, keys).values())
+                               for fields, keys in keyed)
+                if expected > MATCHING_EXPLAIN_MAX_PARTNER_ROWS:
+                    return None
+                by_id = {}
+                for fields, keys in keyed:
+                    for row in MatchingRuleService.keyRows(db, right_source, plan.load_fields(right_source), fields,
+                                                           keys):
+                        by_id[row["id"]] = row
+                rows = [by_id[row_id] for row_id in sorted(by_id)]
+            packed[right_source] = pack_source(rows, plan, right_source)
+        ids = match_rules(packed["ATM"], packed["Switch"], packed["Flexcube"], plan)
+        return ids, {"Switch": len(packed["Switch"]["ids"]), "Flexcube": len(packed["Flexcube"]["ids"])}
 
+    @staticmethod
+    def getTransactionsByIds(db: Session, source, ids):
+        getter = {
+            "ATM": MatchingRuleService.getAllAtmTransactions,
+            "Switch": MatchingRuleService.getAllSwitchTransactions,
+            "Flexcube": MatchingRuleService.getAllFlexcubeTransactions,
+        }[source]
+        ids = sorted(set(ids))
+        rows = []
+        for start in range(0, len(ids), MATCHING_STREAM_BATCH_ROWS):
+            rows.extend(getter(db, ids=ids[start:start + MATCHING_STREAM_BATCH_ROWS]))
+        return rows
+
+    async def matchThreeWayExternal(db: Session, matching_json, job=None,
+                                    budget_bytes=MATCHING_MEMORY_BUDGET_BYTES, spill_dir=MATCHING_SPILL_DIR,
+                                    reconRun=None):
+        """
+        Disk-backed match for sources larger than memory: a pool worker streams the
+        rule's key columns from the database and sort-merges them through spill files;
+        the summary lists hold row ids, fetched when a result page is requested. For a
+        registered run the worker writes results to recon_match_results as it goes.
+        """
+        progress = job.progress if job is not None else None
+        cancel = job.cancel_event if job is not None else None
+        run_id, recon_run_id = (reconRun.run_id, reconRun.id) if reconRun is not None else (None, None)
+        result = await asyncio.get_running_loop().run_in_executor(
+            get_matching_pool(), _external_match_worker, matching_json, budget_bytes, spill_dir, progress, cancel,
+            run_id, recon_run_id
+        )
+        if reconRun is not None:
+            return {"persistMs": result["persistMs"]}
+        return compact_matches(result)
 
+    @staticmethod
+    def matchThreeWayInDatabase(db: Session, matching_json, run_id, recon_run_id=None):
+        """
+        Reconcile inside the database: the rule is compiled into one INSERT ... SELECT
+        writing every ATM row's classification into recon_match_results under run_id,
+        so no transaction row leaves the database. The statement commits together with
+        the run's checkpoint, so a resumed run does not execute it twice.
+        """
+        checkpoint = None
+        if recon_run_id is not None:
+            checkpoint = db.query(ReconRunCheckpoint).filter(ReconRunCheckpoint.recon_run_id == recon_run_id,
+                                                             ReconRunCheckpoint.shard == 0).first()
+            if checkpoint is not None and checkpoint.status == "completed":
+                return MatchingRuleService.getMatchResultCounts(db, run_id)
+        statement = compile_match_query(
+            MatchPlan(matching_json),
+            ATMTransaction.__table__,
+            SwitchTransaction.__table__,
+            FlexcubeTransaction.__table__,
+            ReconMatchResult.__table__,
+            run_id,
+        )
+        db.execute(statement)
+        counts = MatchingRuleService.getMatchResultCounts(db, run_id)
+        if recon_run_id is not None:
+            if checkpoint is None:
+                checkpoint = ReconRunCheckpoint(recon_run_id=recon_run_id, shard=0)
+                db.add(checkpoint)
+            checkpoint.rows_committed = sum(counts.values())
+            checkpoint.status = "completed"
+        db.commit()
+        return counts
 
-    
+    @staticmethod
+    def getMatchResultCounts(db: Session, run_id):
+        rows = (
+            db.query(ReconMatchResult.status, func.count(ReconMatchResult.id))
+            .filter(ReconMatchResult.run_id == run_id)
+            .group_by(ReconMatchResult.status)
+            .all()
+        )
+        counts = {"matched": 0, "partially_matched": 0, "unmatched": 0}
+        counts.update({status: count for status, count in rows})
+        return counts
 
     def saveReconMatchingSummary(db: Session, reconMatchingData, ref_no):
         result = db.execute(
@@ -273,15 +756,20 @@ class MatchingRuleService:
 
         record = result.scalar_one_or_none()
 
-        matched_json = json.dumps(reconMatchingData["matched"],default=str)
-        partially_json = json.dumps(reconMatchingData["partially_matched"],default=str)
-        unmatched_json = json.dumps(reconMatchingData["unmatched"],default=str)
+        # Streamed runs keep these lists in recon_match_results instead
+        matched_json = json.dumps(reconMatchingData["matched"],default=str) if "matched" in reconMatchingData else None
+        partially_json = json.dumps(reconMatchingData["partially_matched"],default=str) if "partially_matched" in reconMatchingData else None
+        unmatched_json = json.dumps(reconMatchingData["unmatched"],default=str) if "unmatched" in reconMatchingData else None
+        fuzzy_json = json.dumps(reconMatchingData.get("fuzzy_candidates", []),default=str)
+        aggregate_json = json.dumps(reconMatchingData.get("aggregate_matched", []),default=str)
 
         if record:
             # UPDATE
             record.matched = matched_json
             record.partially_matched = partially_json
             record.un_matched = unmatched_json
+            record.fuzzy_candidates = fuzzy_json
+            record.aggregate_matched = aggregate_json
             record.added_by = 10
         else:
             # INSERT
@@ -290,6 +778,8 @@ class MatchingRuleService:
                 matched=matched_json,
                 partially_matched=partially_json,
                 un_matched=unmatched_json,
+                fuzzy_candidates=fuzzy_json,
+                aggregate_matched=aggregate_json,
                 added_by=10
             )
             db.add(record)
@@ -299,14 +789,63 @@ class MatchingRuleService:
 
         return record
     
+    @staticmethod
+    def getResultPage(db: Session, reference, status, offset=0, limit=50):
+        """
+        One page of a run's results with full rows; only the rows of the requested page
+        are loaded. Streamed statuses are read from recon_match_results (also while the
+        run is in progress), the other lists from the summary. None when the run is unknown.
+        """
+        summary = db.execute(
+            select(ReconMatchingSummary).where(ReconMatchingSummary.recon_reference_number == reference)
+        ).scalar_one_or_none()
+        stored = getattr(summary, SUMMARY_COLUMNS[status]) if summary is not None else None
+        if stored is not None:
+            entries = json.loads(stored)
+            total, page = len(entries), entries[offset:offset + limit]
+        else:
+            run = db.query(ReconRun).filter(ReconRun.reference == reference).first()
+            if run is None and summary is None:
+                return None
+            total, page = 0, []
+            if run is not None and status in RESULT_STATUSES:
+                query = db.query(ReconMatchResult).filter(ReconMatchResult.run_id == run.run_id,
+                                                          ReconMatchResult.status == status)
+                total = query.count()
+                page = [
+                    {"ATM": row.atm_id, "Switch": row.switch_id, "Flexcube": row.flexcube_id}
+                    for row in query.order_by(ReconMatchResult.id).offset(offset).limit(limit)
+                ]
+        rows = {source: MatchingRuleService.getTransactionsByIds(db, source, ids)
+                for source, ids in page_ids(page).items() if ids}
+        return {"status": status, "total": total, "offset": offset, "items": expand_page(page, rows)}
+
     def getReconAtmTransactionsSummery(db: Session):
-        result = db.execute(
+        """
+        Per-status counts of the latest run, with its reference. The lists themselves are
+        paged from /recon-runs/{reference}/results; streamed runs keep matched, partially
+        matched and unmatched in recon_match_results, so they are counted there.
+        """
+        summary = db.execute(
             select(ReconMatchingSummary)
             .order_by(desc(ReconMatchingSummary.id))
             .limit(1)
-        )
+        ).scalar_one_or_none()
+        if summary is None:
+            return None
 
-        return result.scalar_one_or_none()
+        run = db.query(ReconRun).filter(ReconRun.reference == summary.recon_reference_number).first()
+        streamed = MatchingRuleService.getMatchResultCounts(db, run.run_id) if run is not None else {}
+        counts = {}
+        for status, column in SUMMARY_COLUMNS.items():
+            stored = getattr(summary, column)
+            counts[status] = len(json.loads(stored)) if stored is not None else streamed.get(status, 0)
+        return {
+            "reference": summary.recon_reference_number,
+            "counts": counts,
+            "createdAt": summary.created_at,
+            "updatedAt": summary.updated_at,
+        }
     
     def saveMatchingRule(db: Session, reconMatchingData):
         # If reconMatchingData is a Pydantic model, convert to dict
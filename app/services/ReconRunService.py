@@ -0,0 +1,309 @@
+import datetime
+import hashlib
+import json
+import statistics
+import uuid
+from sqlalchemy.orm import Session
+from sqlalchemy import and_, case, delete, desc, exists, func, insert, literal, or_, select, update
+from app.core.config import RECON_RUN_RETENTION_COUNT, RECON_RUN_RETENTION_DAYS
+from app.models.atm_transaction import ATMTransaction
+from app.models.ReconItemState import ReconItemState
+from app.models.ReconMatchingSummary import ReconMatchingSummary
+from app.models.ReconMatchResult import ReconMatchResult
+from app.models.ReconRun import ReconRun
+from app.models.ReconRunCheckpoint import ReconRunCheckpoint
+from app.models.ReconRunDelta import ReconRunDelta
+
+# Summary lists counted into a run's output counts
+OUTPUT_STATUSES = ("matched", "partially_matched", "unmatched", "aggregate_matched", "fuzzy_candidates")
+
+BREAK_STATUSES = ("partially_matched", "unmatched")
+MATCH_STATUSES = ("matched", "aggregate_matched")
+
+
+def new_reference() -> str:
+    """RECON + timestamp + random suffix: sortable by time and unique across workers."""
+    return f"RECON{datetime.datetime.now():%y%m%d%H%M%S}{uuid.uuid4().hex[:6].upper()}"
+
+
+def rule_identity(matching_json):
+    """(rule id, rule version) of a rule JSON or waterfall; the version fingerprints the JSON that ran."""
+    rules = matching_json if isinstance(matching_json, list) else [matching_json]
+    rule_id = ",".join(str(rule.get("ruleId")) for rule in rules if rule.get("ruleId") is not None)
+    canonical = json.dumps(matching_json, sort_keys=True, default=str)
+    return rule_id or None, hashlib.sha256(canonical.encode("utf-8")).hexdigest()[:16]
+
+
+def output_counts(reconMatchingData):
+    return {status: len(reconMatchingData[status]) for status in OUTPUT_STATUSES if status in reconMatchingData}
+
+
+def transition(old, new):
+    """
+    SQL expression of the delta kind of an item going from status old (NULL: new item)
+    to new; NULL when ops need not see it.
+    """
+    return case(
+        (and_(new.in_(BREAK_STATUSES), or_(old.is_(None), old.in_(MATCH_STATUSES))), "new_break"),
+        (and_(new.in_(BREAK_STATUSES), old != new), "break_changed"),
+        (and_(new.in_(MATCH_STATUSES), old == "partially_matched"), "partial_to_full"),
+        (and_(new.in_(MATCH_STATUSES), old == "unmatched"), "resolved"),
+        else_=None,
+    )
+
+
+class ReconRunService:
+
+    @staticmethod
+    def startRun(db: Session, run_id, trigger, engine, matching_json, input_counts, shards=1):
+        rule_id, rule_version = rule_identity(matching_json)
+        record = ReconRun(
+            reference=new_reference(),
+            run_id=run_id,
+            trigger=trigger,
+            status="running",
+            engine=engine,
+            rule_id=rule_id,
+            rule_version=rule_version,
+            rule_json=matching_json,
+            shards=shards,
+            input_counts=input_counts,
+        )
+        db.add(record)
+        db.commit()
+        db.refresh(record)
+        return record
+
+    @staticmethod
+    def finishRun(db: Session, record: ReconRun, status, timings, counts=None, error=None, rule_stats=None):
+        # A failed engine call may have left the session mid-transaction
+        db.rollback()
+        record.status = status
+        if counts is not None:
+            # Otherwise keep what the result writer last reported as persisted
+            record.output_counts = counts
+        if rule_stats is not None:
+            record.rule_stats = rule_stats
+        record.stage_timings = timings.to_dict()
+        record.total_ms = round(sum(timings.stages.values()), 3)
+        record.error = error
+        record.finished_at = datetime.datetime.now()
+        db.commit()
+        db.refresh(record)
+        ReconRunService.pruneRuns(db)
+        return record
+
+    @staticmethod
+    def resumeRun(db: Session, record: ReconRun):
+        """Mark an interrupted run running again; its checkpoints tell the engine what is already done."""
+        record.status = "running"
+        record.cancel_requested = False
+        record.error = None
+        record.finished_at = None
+        db.commit()
+        db.refresh(record)
+        return record
+
+    @staticmethod
+    def requestCancel(db: Session, record: ReconRun):
+        record.cancel_requested = True
+        db.commit()
+        db.refresh(record)
+        return record
+
+    @staticmethod
+    def isCancelRequested(db: Session, record_id):
+        return bool(db.query(ReconRun.cancel_requested).filter(ReconRun.id == record_id).scalar())
+
+    @staticmethod
+    def getCheckpoints(db: Session, record: ReconRun):
+        rows = db.query(ReconRunCheckpoint).filter(ReconRunCheckpoint.recon_run_id == record.id) \
+            .order_by(ReconRunCheckpoint.shard).all()
+        return [
+            {"shard": row.shard, "status": row.status, "rowsCommitted": row.rows_committed,
+             "updatedAt": row.updated_at}
+            for row in rows
+        ]
+
+    @staticmethod
+    def recordDelta(db: Session, record: ReconRun):
+        """
+        Persist the item transitions since the previous run and move the item state
+        baseline forward. Both are set-based statements joining the run's
+        recon_match_results to recon_item_states inside the database, so nothing is
+        loaded into the application and only changed items are written. A resumed run
+        whose delta an earlier attempt already recorded keeps that one.
+        """
+        if record.delta_counts is not None:
+            return record.delta_counts
+        results = select(ReconMatchResult.atm_id, ReconMatchResult.status) \
+            .where(ReconMatchResult.run_id == record.run_id).subquery()
+        kind = transition(ReconItemState.status, results.c.status)
+        db.execute(insert(ReconRunDelta).from_select(
+            ["recon_run_id", "atm_id", "kind", "from_status", "to_status"],
+            select(literal(record.id), results.c.atm_id, kind, ReconItemState.status, results.c.status)
+            .select_from(results.outerjoin(ReconItemState, ReconItemState.atm_id == results.c.atm_id))
+            .where(kind.is_not(None)),
+        ))
+
+        # Items that no longer exist in the sources, then changed items, then new ones
+        db.execute(delete(ReconItemState).where(~exists().where(
+            ReconMatchResult.run_id == record.run_id, ReconMatchResult.atm_id == ReconItemState.atm_id
+        )))
+        db.execute(
+            update(ReconItemState)
+            .where(ReconMatchResult.run_id == record.run_id, ReconMatchResult.atm_id == ReconItemState.atm_id,
+                   ReconMatchResult.status != ReconItemState.status)
+            .values(status=ReconMatchResult.status, recon_run_id=record.id)
+            .execution_options(synchronize_session=False)
+        )
+        db.execute(insert(ReconItemState).from_select(
+            ["atm_id", "status", "recon_run_id"],
+            select(ReconMatchResult.atm_id, ReconMatchResult.status, literal(record.id))
+            .where(ReconMatchResult.run_id == record.run_id,
+                   ~exists().where(ReconItemState.atm_id == ReconMatchResult.atm_id)),
+        ))
+
+        counts = db.query(ReconRunDelta.kind, func.count()).filter(ReconRunDelta.recon_run_id == record.id) \
+            .group_by(ReconRunDelta.kind)
+        record.delta_counts = {delta_kind: count for delta_kind, count in counts}
+        db.commit()
+        return record.delta_counts
+
+    @staticmethod
+    def pruneRuns(db: Session):
+        """Apply the retention settings: drop expired runs with their summaries and match results."""
+        expired = []
+        if RECON_RUN_RETENTION_DAYS > 0:
+            cutoff = datetime.datetime.now() - datetime.timedelta(days=RECON_RUN_RETENTION_DAYS)
+            expired += db.query(ReconRun).filter(ReconRun.started_at < cutoff).all()
+        if RECON_RUN_RETENTION_COUNT > 0:
+            expired += db.query(ReconRun).order_by(desc(ReconRun.id)).offset(RECON_RUN_RETENTION_COUNT).all()
+        if not expired:
+            return 0
+        runs = {record.id: record for record in expired}.values()
+        references = [record.reference for record in runs]
+        run_ids = [record.run_id for record in runs]
+        db.query(ReconMatchingSummary).filter(ReconMatchingSummary.recon_reference_number.in_(references)) \
+            .delete(synchronize_session=False)
+        db.query(ReconMatchResult).filter(ReconMatchResult.run_id.in_(run_ids)).delete(synchronize_session=False)
+        db.query(ReconRunDelta).filter(ReconRunDelta.recon_run_id.in_([record.id for record in runs])) \
+            .delete(synchronize_session=False)
+        db.query(ReconRunCheckpoint).filter(ReconRunCheckpoint.recon_run_id.in_([record.id for record in runs])) \
+            .delete(synchronize_session=False)
+        db.query(ReconRun).filter(ReconRun.id.in_([record.id for record in runs])).delete(synchronize_session=False)
+        db.commit()
+        return len(references)
+
+    @staticmethod
+    def serialize(record: ReconRun):
+        return {
+            "id": record.id,
+            "reference": record.reference,
+            "runId": record.run_id,
+            "trigger": record.trigger,
+            "status": record.status,
+            "engine": record.engine,
+            "ruleId": record.rule_id,
+            "ruleVersion": record.rule_version,
+            "shards": record.shards,
+            "cancelRequested": bool(record.cancel_requested),
+            "inputCounts": record.input_counts or {},
+            "outputCounts": record.output_counts or {},
+            "deltaCounts": record.delta_counts or {},
+            "ruleStats": record.rule_stats or [],
+            "timings": record.stage_timings or {},
+            "totalMs": record.total_ms,
+            "error": record.error,
+            "startedAt": record.started_at,
+            "finishedAt": record.finished_at,
+        }
+
+    @staticmethod
+    def stageRates(db: Session, engine, limit=10):
+        """Median milliseconds per input row of every stage, over the latest completed runs of an engine."""
+        rows = (db.query(ReconRun).filter(ReconRun.status == "completed", ReconRun.engine == engine)
+                .order_by(desc(ReconRun.id)).limit(limit).all())
+        rates = {}
+        for row in rows:
+            input_rows = sum((row.input_counts or {}).values())
+            for stage, ms in (row.stage_timings or {}).items():
+                if input_rows:
+                    rates.setdefault(stage[:-2], []).append(ms / input_rows)
+        return {stage: statistics.median(values) for stage, values in rates.items()}
+
+    @staticmethod
+    def getRuns(db: Session, offset=0, limit=20):
+        rows = db.query(ReconRun).order_by(desc(ReconRun.id)).offset(offset).limit(limit or 20).all()
+        return [ReconRunService.serialize(row) for row in rows]
+
+    @staticmethod
+    def getRunByReference(db: Session, reference):
+        """A run by its reference, or by its numeric id."""
+        query = db.query(ReconRun)
+        if reference.isdigit():
+            return query.filter(ReconRun.id == int(reference)).first()
+        return query.filter(ReconRun.reference == reference).first()
+
+    @staticmethod
+    def getRunDelta(db: Session, record: ReconRun, kind=None, after=0, limit=100):
+        """One page of a run's delta in id order; pass the returned nextCursor as after for the next one."""
+        query = (
+            db.query(ReconRunDelta, ATMTransaction.rrn, ATMTransaction.terminalid, ATMTransaction.amount,
+                     ATMTransaction.datetime)
+            .outerjoin(ATMTransaction, ATMTransaction.id == ReconRunDelta.atm_id)
+            .filter(ReconRunDelta.recon_run_id == record.id, ReconRunDelta.id > (after or 0))
+        )
+        if kind:
+            query = query.filter(ReconRunDelta.kind == kind)
+        rows = query.order_by(ReconRunDelta.id).limit(limit).all()
+        items = [
+            {"id": delta.id, "atmId": delta.atm_id, "kind": delta.kind, "from": delta.from_status,
+             "to": delta.to_status, "rrn": rrn, "terminalid": terminalid,
+             "amount": float(amount) if amount is not None else None, "datetime": when}
+            for delta, rrn, terminalid, amount, when in rows
+        ]
+        return {
+            "reference": record.reference,
+            "counts": record.delta_counts or {},
+            "items": items,
+            "nextCursor": items[-1]["id"] if len(items) == limit else None,
+        }
+
+    @staticmethod
+    def compareRuns(db: Session, references=None, limit=10):
+        """
+        Stage timings of the given runs (default: the latest completed ones), newest
+        first. Each run is normalized per thousand ATM rows, so runs over different
+        volumes compare, and carries its change per stage against the run after it.
+        """
+        query = db.query(ReconRun)
+        if references:
+            query = query.filter(ReconRun.reference.in_(references))
+        else:
+            query = query.filter(ReconRun.status == "completed")
+        rows = query.order_by(desc(ReconRun.id)).limit(len(references) if references else limit or 10).all()
+
+        runs, stages = [], []
+        for row in rows:
+            timings = row.stage_timings or {}
+            stages += [stage for stage in timings if stage not in stages]
+            atm_rows = (row.input_counts or {}).get("ATM") or 0
+            runs.append({
+                "reference": row.reference,
+                "startedAt": row.started_at,
+                "engine": row.engine,
+                "ruleVersion": row.rule_version,
+                "atmRows": atm_rows,
+                "timings": timings,
+                "totalMs": row.total_ms,
+                "ruleStats": row.rule_stats or [],
+                "msPer1kRows": round(row.total_ms * 1000 / atm_rows, 3) if atm_rows and row.total_ms else None,
+            })
+        for run, previous in zip(runs, runs[1:]):
+            # Percent change against the older run, per stage both of them recorded
+            run["changePct"] = {
+                stage: round((ms - previous["timings"][stage]) * 100 / previous["timings"][stage], 1)
+                for stage, ms in run["timings"].items() if previous["timings"].get(stage)
+            }
+        return {"stages": stages, "runs": runs}
@@ -3,9 +3,12 @@ import json
 import pandas as pd
 from app.models.atm_transaction import ATMTransaction
 from app.models.Upload import UploadedFile
+from app.models.UploadCheckpoint import UploadCheckpoint
+from app.models.UploadReject import UploadReject
 from app.models.SwitchTransaction import SwitchTransaction
 from app.models.FlexcubeTransaction import FlexcubeTransaction
 from sqlalchemy.orm import Session
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
 from sqlalchemy import func, cast, String, select, text, union_all, case
 from sqlalchemy.orm import aliased
 import numpy as np
@@ -13,12 +16,13 @@ from app.services.MatchingRuleService import MatchingRuleService
 
 class BulkUploadService:
     @staticmethod
-    async def saveUploadedFile(db: Session, uploadFileData):
+    async def saveUploadedFile(db: Session, uploadFileData, content_hash=None):
         try:
             new_file = UploadedFile(
                 file_description= json.dumps(uploadFileData),
                 uploaded_by= 1,
                 status=1,
+                content_hash=content_hash,
             )
 
             db.add(new_file)
@@ -29,6 +33,14 @@ class BulkUploadService:
                 "insertedId": new_file.id,
             }
 
+        except IntegrityError as e:
+            db.rollback()
+            # A concurrent upload of the same content claimed the hash first
+            existing = BulkUploadService.getUploadedFileByHash(db, content_hash) if content_hash else None
+            if existing is None:
+                return {"status": "error", "message": str(e)}
+            return {"status": "duplicate", "existingId": existing.id}
+
         except Exception as e:
             db.rollback()
             return {
@@ -36,21 +48,128 @@ class BulkUploadService:
                 "message": str(e)
             }
 
+    @staticmethod
+    async def updateUploadedFileDescription(db: Session, uploaded_file_id, uploadFileData):
+        record = db.query(UploadedFile).filter(UploadedFile.id == uploaded_file_id).first()
+        if record:
+            record.file_description = json.dumps(uploadFileData)
+            db.commit()
+        return record
+
 
     @staticmethod
-    async def saveATMFileData(db: Session, mapped_df, uploaded_file_id):
+    def getUploadedFileByHash(db: Session, content_hash):
+        return db.query(UploadedFile).filter(UploadedFile.content_hash == content_hash).first()
+
+    @staticmethod
+    async def saveUploadResult(db: Session, uploaded_file_id, result):
+        record = db.query(UploadedFile).filter(UploadedFile.id == uploaded_file_id).first()
+        if record:
+            record.upload_result = json.dumps(result, default=str)
+            db.commit()
+        return record
+
+    @staticmethod
+    async def releaseUploadHash(db: Session, uploaded_file_id):
+        """Drop the content hash of a failed upload so the same file can be uploaded again."""
+        record = db.query(UploadedFile).filter(UploadedFile.id == uploaded_file_id).first()
+        if record:
+            record.content_hash = None
+            db.commit()
+        return record
+
+    @staticmethod
+    def createUploadCheckpoint(db: Session, uploaded_file_id, staging_id, member_name, file_type):
+        checkpoint = UploadCheckpoint(
+            uploaded_file_id=uploaded_file_id,
+            staging_id=staging_id,
+            member_name=member_name,
+            file_type=file_type,
+            rows_committed=0,
+            batches_committed=0,
+            records_saved=0,
+            duplicate_count=0,
+            rejected_count=0,
+            status="in_progress",
+        )
+        db.add(checkpoint)
+        db.commit()
+        db.refresh(checkpoint)
+        return checkpoint
+
+    @staticmethod
+    def getUploadCheckpoints(db: Session, staging_id):
+        """Checkpoints of every data file of a staged upload, by member name."""
+        checkpoints = db.query(UploadCheckpoint).filter(UploadCheckpoint.staging_id == staging_id).all()
+        return {checkpoint.member_name: checkpoint for checkpoint in checkpoints}
+
+    @staticmethod
+    def completeUploadCheckpoint(db: Session, checkpoint):
+        checkpoint.status = "completed"
+        db.commit()
+        return checkpoint
+
+    @staticmethod
+    def commitRecords(db: Session, records, rows, uploaded_file_id, checkpoint=None, batchRows=0, duplicateCount=0):
+        """
+        Commit one batch of new records together with its checkpoint. When the batch is
+        refused, each row is retried in its own savepoint and the rows the database
+        rejects go to upload_rejects instead of failing the upload. Returns the rejects.
+        """
+        rejects = []
+        try:
+            db.add_all(records)
+            BulkUploadService._advanceCheckpoint(checkpoint, batchRows, len(records), duplicateCount, 0)
+            db.commit()
+            return rejects
+        except SQLAlchemyError:
+            db.rollback()
+
+        rowOffset = checkpoint.rows_committed if checkpoint is not None else 0
+        for (index, row), record in zip(rows, records):
+            try:
+                with db.begin_nested():
+                    db.add(record)
+            except SQLAlchemyError as e:
+                rejects.append(UploadReject(
+                    uploaded_file_id=uploaded_file_id,
+                    row_index=rowOffset + index,
+                    reason=str(getattr(e, "orig", None) or e),
+                    row_data=json.dumps(row, default=str),
+                ))
+
+        db.add_all(rejects)
+        BulkUploadService._advanceCheckpoint(checkpoint, batchRows, len(records) - len(rejects), duplicateCount, len(rejects))
+        db.commit()
+        return rejects
+
+    @staticmethod
+    def _advanceCheckpoint(checkpoint, batchRows, saved, duplicateCount, rejected):
+        if checkpoint is None:
+            return
+        checkpoint.rows_committed += batchRows
+        checkpoint.batches_committed += 1
+        checkpoint.records_saved += saved
+        checkpoint.duplicate_count += duplicateCount
+        checkpoint.rejected_count += rejected
+
+    @staticmethod
+    async def saveATMFileData(db: Session, mapped_df, uploaded_file_id, checkpoint=None):
         duplicates = []
         new_records = []
+        new_rows = []
         # print('mapped_df',mapped_df)
-        for row in mapped_df:
+        for index, row in enumerate(mapped_df):
             existing_record = db.query(ATMTransaction).filter(
                 ATMTransaction.rrn == row["rrn"],
-                ATMTransaction.terminalid == row["terminalid"]
+                ATMTransaction.terminalid == row["terminalid"],
+                ATMTransaction.uploaded_by.is_distinct_from(uploaded_file_id)
             ).first()
 
             if existing_record:
                 duplicates.append(row)
                 continue
+            new_rows.append((index, row))
             new_records.append(ATMTransaction(
                 datetime= (row.get("datetime") or "").strip() or None,
                 terminalid=(row.get("terminalid") or "").strip() or None,
@@ -88,27 +207,30 @@ class BulkUploadService:
             #     uploaded_by= uploaded_file_id,
             # ))
 
-        if new_records:
-            db.add_all(new_records)
-            db.commit()
+        rejects = BulkUploadService.commitRecords(db, new_records, new_rows, uploaded_file_id, checkpoint,
+                                                  len(mapped_df), len(duplicates))
+        recordsSaved = len(new_records) - len(rejects)
 
         return {
             "status": "success",
-            "message": f"{len(new_records)} records inserted, {len(duplicates)} duplicates skipped",
-            "recordsSaved": len(new_records),
-            "duplicateRecords": duplicates
+            "message": f"{recordsSaved} records inserted, {len(duplicates)} duplicates skipped, {len(rejects)} rejected",
+            "recordsSaved": recordsSaved,
+            "duplicateRecords": duplicates,
+            "rejectedRecords": len(rejects),
         }
     
 
     @staticmethod
-    async def saveSwitchFileData(db: Session, mapped_df, uploaded_file_id):
+    async def saveSwitchFileData(db: Session, mapped_df, uploaded_file_id, checkpoint=None):
         duplicates = []
         new_records = []
+        new_rows = []
         # print('mapped_df',mapped_df)
-        for row in mapped_df:
+        for index, row in enumerate(mapped_df):
             existing_record = db.query(SwitchTransaction).filter(
                 # ATMTransaction.rrn == row["rrn"],
-                SwitchTransaction.terminalid == row["terminalid"]
+                SwitchTransaction.terminalid == row["terminalid"],
+                SwitchTransaction.uploaded_by.is_distinct_from(uploaded_file_id)
             ).first()
             
             if existing_record:
@@ -116,6 +238,7 @@ class BulkUploadService:
                 continue
             # new_records.append(SwitchTransaction(datetime=row.get("datetime"), direction=(row.get("direction") or "").strip() or None, mti=(row.get("mti") or "").strip() or None, pan_masked=(row.get("pan_masked") or "").strip() or None, processingcode=(row.get("processingcode") or "").strip() or None, amountminor=row.get("amountminor") if row.get("amountminor") not in ("", None) else None, currency=(row.get("currency") or "").strip() or None, terminalid=(row.get("terminalid") or "").strip() or None, stan=(row.get("stan") or "").strip() or None, rrn=(row.get("rrn") or "").strip().replace(" ", "") or None, source=(row.get("source") or "").strip() or None, destination=(row.get("destination") or "").strip() or None, uploaded_by=uploaded_file_id))
 
+            new_rows.append((index, row))
             new_records.append(SwitchTransaction(
                 datetime=row["datetime"],
                 direction=row["direction"],
@@ -134,27 +257,30 @@ class BulkUploadService:
                 uploaded_by= uploaded_file_id,
             ))
 
-        if new_records:
-            db.add_all(new_records)
-            db.commit()
+        rejects = BulkUploadService.commitRecords(db, new_records, new_rows, uploaded_file_id, checkpoint,
+                                                  len(mapped_df), len(duplicates))
+        recordsSaved = len(new_records) - len(rejects)
 
         return {
             "status": "success",
-            "message": f"{len(new_records)} records inserted, {len(duplicates)} duplicates skipped",
-            "recordsSaved": len(new_records),
-            "duplicateRecords": duplicates
+            "message": f"{recordsSaved} records inserted, {len(duplicates)} duplicates skipped, {len(rejects)} rejected",
+            "recordsSaved": recordsSaved,
+            "duplicateRecords": duplicates,
+            "rejectedRecords": len(rejects),
         }
     
 
     @staticmethod
-    async def saveFlexCubeFileData(db: Session, mapped_df, uploaded_file_id):
+    async def saveFlexCubeFileData(db: Session, mapped_df, uploaded_file_id, checkpoint=None):
         duplicates = []
         new_records = []
+        new_rows = []
         # print('mapped_df',mapped_df)
-        for row in mapped_df:
+        for index, row in enumerate(mapped_df):
             existing_record = db.query(FlexcubeTransaction).filter(
                 # ATMTransaction.rrn == row["rrn"],
-                FlexcubeTransaction.fc_txn_id == row["fc_txn_id"]
+                FlexcubeTransaction.fc_txn_id == row["fc_txn_id"],
+                FlexcubeTransaction.uploaded_by.is_distinct_from(uploaded_file_id)
             ).first()
             
             if existing_record:
@@ -162,6 +288,7 @@ class BulkUploadService:
                 continue
             # new_records.append(FlexcubeTransaction(fc_txn_id=(row.get("fc_txn_id") or "").strip() or None, rrn=(row.get("rrn") or "").strip().replace(" ", "") or None, stan=(row.get("stan") or "").strip() or None, account_masked=(row.get("account_masked") or "").strip() or None, dr=row.get("dr") if row.get("dr") not in ("", None) else None, currency=(row.get("currency") or "").strip() or None, status=(row.get("status") or "").strip() or None, description=(row.get("description") or "").strip() or None, uploaded_by=uploaded_file_id))
 
+            new_rows.append((index, row))
             new_records.append(FlexcubeTransaction(
                 posted_datetime=row["posteddatetime"],
                 fc_txn_id=row["fc_txn_id"],
@@ -186,15 +313,16 @@ class BulkUploadService:
                 # uploaded_by= uploaded_file_id
             ))
 
-        if new_records:
-            db.add_all(new_records)
-            db.commit()
+        rejects = BulkUploadService.commitRecords(db, new_records, new_rows, uploaded_file_id, checkpoint,
+                                                  len(mapped_df), len(duplicates))
+        recordsSaved = len(new_records) - len(rejects)
 
         return {
             "status": "success",
-            "message": f"{len(new_records)} records inserted, {len(duplicates)} duplicates skipped",
-            "recordsSaved": len(new_records),
-            "duplicateRecords": duplicates
+            "message": f"{recordsSaved} records inserted, {len(duplicates)} duplicates skipped, {len(rejects)} rejected",
+            "recordsSaved": recordsSaved,
+            "duplicateRecords": duplicates,
+            "rejectedRecords": len(rejects),
         }
     
     
@@ -0,0 +1,148 @@
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.utils.fuzzy_matcher import subset_packed
+from app.utils.matching_engine import LINK_SOURCES, AggregateGroup, AggregatePlan, build_plan
+
+
+def _cents(amount: Optional[float]) -> Optional[int]:
+    # Sums are compared in integer cents, so 0.10 + 0.20 adds up to exactly 0.30
+    return None if amount is None else int(round(amount * 100))
+
+
+def aggregate_residue(atm: Dict[str, Any], switch: Dict[str, Any], flex: Dict[str, Any],
+                      ids: Dict[str, List]) -> Dict[str, Any]:
+    """
+    What the aggregate pass looks at, per source: ATM rows without a full match, and
+    Switch and Flexcube rows no full match uses.
+    """
+    matched_atm = {a for a, _, _ in ids["matched"]}
+    used_switch = {s for _, s, _ in ids["matched"]}
+    used_flex = {f for _, _, f in ids["matched"]}
+    return {
+        "ATM": subset_packed(atm, [p for p, i in enumerate(atm["ids"]) if i not in matched_atm]),
+        "Switch": subset_packed(switch, [p for p, i in enumerate(switch["ids"]) if i not in used_switch]),
+        "Flexcube": subset_packed(flex, [p for p, i in enumerate(flex["ids"]) if i not in used_flex]),
+    }
+
+
+def _side_rows(packed: Dict[str, Any], group: AggregateGroup, source: str,
+               consumed: set) -> List[Tuple[int, Tuple, int]]:
+    """(position, block key, amount in cents) of the source's rows usable by the group."""
+    side = "left" if source == LINK_SOURCES[group.link][0] else "right"
+    block_columns = [packed["columns"][f.column(getattr(f, side))] for f in group.block]
+    amounts = packed["columns"][group.amount.column(getattr(group.amount, side))]
+    rows = []
+    for pos, row_id in enumerate(packed["ids"]):
+        if row_id in consumed:
+            continue
+        key = tuple(column[pos] for column in block_columns)
+        amount = _cents(amounts[pos])
+        # Rows missing a block value cannot be grouped; only positive amounts are summed
+        if amount is None or amount <= 0 or any(value is None or value == "" for value in key):
+            continue
+        rows.append((pos, key, amount))
+    return rows
+
+
+def find_subset(items: List[Tuple[int, int]], target: int, diff: int, min_items: int,
+                max_items: int, max_nodes: int) -> Optional[List[int]]:
+    """
+    Indices of min_items..max_items items whose amounts sum to target within diff, or
+    None. items are (amount, position) sorted by amount descending; the search is a
+    depth-first subset sum pruned by running totals:
+
+    - an item that would overshoot target + diff is skipped (smaller ones may still fit);
+    - a branch stops once the running total plus every remaining amount (the suffix
+      sum) cannot reach target - diff;
+    - equal amounts are tried once per depth, and at most max_nodes branches are
+      explored, so a pathological group gives up instead of stalling the run.
+    """
+    low, high = target - diff, target + diff
+    suffix = [0] * (len(items) + 1)
+    for i in range(len(items) - 1, -1, -1):
+        suffix[i] = suffix[i + 1] + items[i][0]
+    if suffix[0] < low:
+        return None
+
+    chosen: List[int] = []
+    nodes = 0
+
+    def search(start: int, total: int) -> bool:
+        nonlocal nodes
+        previous = None
+        for i in range(start, len(items)):
+            amount = items[i][0]
+            if total + suffix[i] < low:
+                return False
+            if amount == previous or total + amount > high:
+                continue
+            nodes += 1
+            if nodes > max_nodes:
+                return False
+            previous = amount
+            chosen.append(i)
+            if total + amount >= low and len(chosen) >= min_items:
+                return True
+            if len(chosen) < max_items and search(i + 1, total + amount):
+                return True
+            chosen.pop()
+        return False
+
+    return list(chosen) if search(0, 0) else None
+
+
+def aggregate_pass(rest: Dict[str, Any], aggregate: AggregatePlan) -> List[Tuple]:
+    """
+    Many-to-one matches over the residue, group by group: every row of a group's "one"
+    side, in source order, is matched to a subset of the "many" rows of its block whose
+    amounts sum to its own. Rows are consumed by the first match using them.
+    Returns (one source, one id, many source, [many ids], total).
+    """
+    diff = _cents(aggregate.amount_diff)
+    consumed = {source: set() for source in rest}
+    aggregated = []
+    for group in aggregate.groups:
+        one, many = rest[group.one_source], rest[group.many_source]
+        blocks = defaultdict(list)
+        for pos, key, amount in _side_rows(many, group, group.many_source, consumed[group.many_source]):
+            blocks[key].append((amount, pos))
+        for items in blocks.values():
+            # Stable: equal amounts keep source order
+            items.sort(key=lambda item: -item[0])
+
+        for pos, key, target in _side_rows(one, group, group.one_source, consumed[group.one_source]):
+            items = blocks.get(key)
+            if not items or len(items) < 2:
+                continue
+            picked = find_subset(items, target, diff, 2, aggregate.max_items, aggregate.max_nodes)
+            if picked is None:
+                continue
+            many_positions = sorted(items[i][1] for i in picked)
+            many_ids = [many["ids"][p] for p in many_positions]
+            total = sum(items[i][0] for i in picked) / 100
+            taken = set(picked)
+            blocks[key] = [item for i, item in enumerate(items) if i not in taken]
+            consumed[group.one_source].add(one["ids"][pos])
+            consumed[group.many_source].update(many_ids)
+            aggregated.append((group.one_source, one["ids"][pos], group.many_source, many_ids, total))
+    return aggregated
+
+
+def run_aggregate_pass(rest: Dict[str, Any], matching_json: Dict[str, Any]) -> List[Tuple]:
+    """Process pool entry point: the plan is rebuilt from the rule JSON in the worker."""
+    return aggregate_pass(rest, build_plan(matching_json).aggregate)
+
+
+def apply_aggregates(ids: Dict[str, List], aggregated: List[Tuple]) -> Dict[str, List]:
+    """Record aggregate matches in the ids; ATM rows they cover leave the other statuses."""
+    covered = set()
+    for one_source, one_id, many_source, many_ids, _ in aggregated:
+        if one_source == "ATM":
+            covered.add(one_id)
+        elif many_source == "ATM":
+            covered.update(many_ids)
+    ids["aggregated"] = aggregated
+    ids["partially_matched"] = [pair for pair in ids["partially_matched"] if pair[0] not in covered]
+    ids["unmatched"] = [a for a in ids["unmatched"] if a not in covered]
+    return ids
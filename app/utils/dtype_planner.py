@@ -0,0 +1,138 @@
+import logging
+from typing import Any, Dict, List
+
+import pandas as pd
+import pyarrow as pa
+
+from app.config.dtype_plans import DTYPE_PLANS, CATEGORY_MAX_UNIQUE_RATIO
+
+ARROW_STRING = "string[pyarrow]"
+
+
+def frame_memory_bytes(df: pd.DataFrame) -> int:
+    """Deep memory footprint of a frame, object payloads included."""
+    return int(df.memory_usage(deep=True).sum())
+
+
+class FrameMemoryReport:
+    """
+    Collects the memory footprint of the upload frames at each stage of the pipeline.
+    Batched uploads record every batch; a stage reports total and peak bytes across batches.
+    """
+
+    def __init__(self):
+        self.stages = []
+
+    def record(self, stage: str, df: pd.DataFrame) -> int:
+        size = frame_memory_bytes(df)
+        self.add(stage, len(df), size)
+        return size
+
+    def add(self, stage: str, rows: int, size: int):
+        entry = next((s for s in self.stages if s["stage"] == stage), None)
+        if entry is None:
+            entry = {"stage": stage, "rows": 0, "bytes": 0, "peakBytes": 0}
+            self.stages.append(entry)
+        entry["rows"] += rows
+        entry["bytes"] += size
+        entry["peakBytes"] = max(entry["peakBytes"], size)
+        logging.debug("upload frame %s: %d rows, %d bytes", stage, rows, size)
+
+    def merge(self, stats):
+        """Add (stage, rows, bytes) measurements taken elsewhere, e.g. in a parse worker."""
+        for stage, rows, size in stats:
+            self.add(stage, rows, size)
+
+    def to_dict(self) -> Dict[str, Any]:
+        reduction = None
+        if len(self.stages) > 1 and self.stages[-1]["bytes"]:
+            reduction = round(self.stages[0]["bytes"] / self.stages[-1]["bytes"], 2)
+        return {"stages": self.stages, "reduction": reduction}
+
+
+def _blank_to_na(series: pd.Series) -> pd.Series:
+    if series.dtype == object:
+        series = series.map(lambda v: (v.strip() or None) if isinstance(v, str) else v)
+    return series
+
+
+def _to_integer(series: pd.Series, dtype: str) -> pd.Series:
+    values = _blank_to_na(series)
+    numeric = pd.to_numeric(values, errors="coerce")
+    # Leave the column alone rather than silently dropping values that don't parse
+    if numeric.isna().sum() != values.isna().sum():
+        return series
+    try:
+        return numeric.astype(dtype)
+    except (TypeError, ValueError, OverflowError):
+        return series
+
+
+def _to_decimal(series: pd.Series, precision: int, scale: int) -> pd.Series:
+    values = _blank_to_na(series)
+    decimal_type = pa.decimal128(precision, scale)
+    strings = [None if pd.isna(v) else str(v) for v in values]
+    try:
+        array = pa.array(strings, type=pa.string()).cast(decimal_type)
+    except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+        return series
+    return pd.Series(array, index=series.index, dtype=pd.ArrowDtype(decimal_type), name=series.name)
+
+
+def _to_category(series: pd.Series) -> pd.Series:
+    values = _blank_to_na(series)
+    if len(values) and values.nunique(dropna=True) > len(values) * CATEGORY_MAX_UNIQUE_RATIO:
+        return values.astype(ARROW_STRING) if values.dtype == object else series
+    return values.astype("category")
+
+
+def apply_dtype_plan(df: pd.DataFrame, file_type: str) -> pd.DataFrame:
+    """
+    Convert the columns of an uploaded frame to the compact dtypes planned for its source.
+    Columns that are not in the plan, or whose values don't fit the planned type, are kept as-is.
+    """
+    plan = DTYPE_PLANS.get(file_type)
+    if not plan:
+        return df
+
+    compact = df.copy()
+    for col in plan["category"]:
+        if col in compact.columns:
+            compact[col] = _to_category(compact[col])
+
+    for col, dtype in plan["integer"].items():
+        if col in compact.columns:
+            compact[col] = _to_integer(compact[col], dtype)
+
+    for col, (precision, scale) in plan["decimal"].items():
+        if col in compact.columns:
+            compact[col] = _to_decimal(compact[col], precision, scale)
+
+    for col in plan["string"]:
+        if col in compact.columns and compact[col].dtype == object:
+            compact[col] = _blank_to_na(compact[col]).astype(ARROW_STRING)
+
+    return compact
+
+
+def frame_to_records(df: pd.DataFrame) -> List[Dict[str, Any]]:
+    """
+    Row dicts with plain Python values (str, int, Decimal, None) for the save services.
+    """
+    plain = df.astype(object)
+    plain = plain.where(plain.notna(), None)
+    return plain.to_dict(orient="records")
+
+
+def normalize_batch(rows: List[Dict[str, Any]], file_type: str):
+    """
+    Normalize one batch of parsed rows for the save services: lower-case headers,
+    apply the source's dtype plan and convert back to plain records.
+    Returns the records and the (stage, rows, bytes) footprint of each step.
+    """
+    df = pd.DataFrame(rows)
+    stats = [("parsed", len(df), frame_memory_bytes(df))]
+    df.columns = [str(col).strip().lower() for col in df.columns]
+    df = apply_dtype_plan(df, file_type)
+    stats.append(("compacted", len(df), frame_memory_bytes(df)))
+    return frame_to_records(df), stats
@@ -0,0 +1,238 @@
+import heapq
+import os
+import pickle
+import sys
+import tempfile
+import uuid
+from itertools import groupby
+from operator import itemgetter
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from app.core.config import MATCHING_MEMORY_BUDGET_BYTES, MATCHING_SPILL_DIR
+from app.utils.matching_engine import PROGRESS_EVERY, MatchingCancelled, MatchPlan, normalize, to_amount
+
+# Records pickled per chunk in spill files
+SPILL_CHUNK_RECORDS = 1000
+# Approximate footprint of one fully loaded transaction dict in the in-memory engine
+IN_MEMORY_ROW_BYTES = 2048
+# Record sizes are measured on every Nth record and assumed for the ones in between
+SIZE_SAMPLE_EVERY = 64
+
+_sort_key = itemgetter(0, 1)
+
+
+def _record_bytes(record: Tuple) -> int:
+    """Rough in-memory size of a spill record: the tuple plus its direct members."""
+    size = sys.getsizeof(record)
+    for item in record:
+        size += sys.getsizeof(item)
+        if isinstance(item, tuple):
+            size += sum(sys.getsizeof(part) for part in item)
+    return size
+
+
+class SpillSorter:
+    """
+    Sorts records of the form (key, seq, ...) by (key, seq) within a memory budget:
+    records are buffered until the budget is reached, then sorted and written to a run
+    file; sorted() k-way merges the runs, holding one chunk per run in memory.
+    """
+
+    def __init__(self, budget_bytes: int, spill_dir: str):
+        self.budget = max(budget_bytes, 1)
+        self.spill_dir = spill_dir
+        self.buffer: List[Tuple] = []
+        self.buffered = 0
+        self.runs: List[str] = []
+        self.count = 0
+        self.record_size = 0
+
+    def add(self, record: Tuple):
+        if self.count % SIZE_SAMPLE_EVERY == 0:
+            self.record_size = _record_bytes(record)
+        self.buffer.append(record)
+        self.buffered += self.record_size
+        self.count += 1
+        if self.buffered >= self.budget:
+            self._spill()
+
+    def _spill(self):
+        self.buffer.sort(key=_sort_key)
+        path = os.path.join(self.spill_dir, f"run-{uuid.uuid4().hex}.pkl")
+        with open(path, "wb") as fh:
+            for start in range(0, len(self.buffer), SPILL_CHUNK_RECORDS):
+                pickle.dump(self.buffer[start:start + SPILL_CHUNK_RECORDS], fh, protocol=pickle.HIGHEST_PROTOCOL)
+        self.runs.append(path)
+        self.buffer, self.buffered = [], 0
+
+    @staticmethod
+    def _read_run(path: str) -> Iterator[Tuple]:
+        with open(path, "rb") as fh:
+            while True:
+                try:
+                    chunk = pickle.load(fh)
+                except EOFError:
+                    return
+                yield from chunk
+
+    def sorted(self) -> Iterator[Tuple]:
+        if not self.runs:
+            # Everything fit in the budget: no disk round trip
+            self.buffer.sort(key=_sort_key)
+            yield from self.buffer
+            return
+        if self.buffer:
+            self._spill()
+        yield from heapq.merge(*(self._read_run(path) for path in self.runs), key=_sort_key)
+
+    def close(self):
+        for path in self.runs:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        self.runs, self.buffer = [], []
+
+
+def _key(row: Dict[str, Any], fields: List[str]) -> Tuple[str, ...]:
+    return tuple(normalize(row.get(field)) for field in fields)
+
+
+def external_match(atm_rows: Iterable[Dict[str, Any]], switch_rows: Iterable[Dict[str, Any]],
+                   flex_rows: Iterable[Dict[str, Any]], plan: MatchPlan,
+                   emit: Callable[[str, Any, Any, Any], None],
+                   budget_bytes: int = MATCHING_MEMORY_BUDGET_BYTES, spill_dir: str = MATCHING_SPILL_DIR,
+                   progress=None, cancel=None, progress_key: str = "processed") -> Dict[str, int]:
+    """
+    Disk-backed three-way match with the same classification as match_three_way:
+
+    1. Switch and Flexcube are sorted by their B-C key and merge-joined, so every Switch
+       row is annotated with its Flexcube candidates (source order; only the first one
+       when no amount tolerance applies).
+    2. The annotated Switch rows and the ATM rows are sorted by their A-B key and
+       merge-joined; each ATM row is classified against its key group of Switch rows.
+
+    Sorting spills to disk whenever the in-memory runs reach the budget, so memory use is
+    bounded by budget_bytes plus the largest single key group, whatever the input size.
+    Results go to emit(status, atm_id, switch_id, flex_id) in key order, not ATM order.
+    """
+    os.makedirs(spill_dir, exist_ok=True)
+    ab_atm = [a for a, _ in plan.ab_pairs]
+    ab_switch = [b for _, b in plan.ab_pairs]
+    bc_switch = [b for b, _ in plan.bc_pairs]
+    bc_flex = [c for _, c in plan.bc_pairs]
+    check_amount, allowed_diff = plan.check_amount, plan.amount_diff
+    atm_amount, flex_amount = plan.amount_field("ATM"), plan.amount_field("Flexcube")
+
+    # Three sorters are filled at once in phase 1, so each gets a third of the budget
+    share = budget_bytes // 3
+    with tempfile.TemporaryDirectory(dir=spill_dir) as run_dir:
+        atm_sorter = SpillSorter(share, run_dir)
+        switch_sorter = SpillSorter(share, run_dir)
+        flex_sorter = SpillSorter(share, run_dir)
+        annotated = SpillSorter(budget_bytes // 2, run_dir)
+        try:
+            for seq, row in enumerate(atm_rows):
+                amount = to_amount(row.get(atm_amount, 0)) if check_amount else None
+                atm_sorter.add((_key(row, ab_atm), seq, row["id"], amount))
+            if progress is not None:
+                progress["total"] = atm_sorter.count
+            for seq, row in enumerate(switch_rows):
+                switch_sorter.add((_key(row, bc_switch), seq, row["id"], _key(row, ab_switch)))
+            for seq, row in enumerate(flex_rows):
+                amount = to_amount(row.get(flex_amount, 0)) if check_amount else None
+                flex_sorter.add((_key(row, bc_flex), seq, row["id"], amount))
+
+            # Phase 1: Switch x Flexcube on the B-C key
+            flex_groups = groupby(flex_sorter.sorted(), key=itemgetter(0))
+            flex_key, flex_group = next(flex_groups, (None, None))
+            for bc_key, switch_group in groupby(switch_sorter.sorted(), key=itemgetter(0)):
+                while flex_key is not None and flex_key < bc_key:
+                    flex_key, flex_group = next(flex_groups, (None, None))
+                candidates: Tuple = ()
+                if flex_key == bc_key:
+                    if not check_amount:
+                        candidates = (next(flex_group)[2:],)
+                    elif allowed_diff is not None:
+                        # Rows without an amount can never pass the tolerance
+                        candidates = tuple(record[2:] for record in flex_group if record[3] is not None)
+                for _, seq, switch_id, ab_key in switch_group:
+                    annotated.add((ab_key, seq, switch_id, candidates))
+            switch_sorter.close()
+            flex_sorter.close()
+
+            # Phase 2: ATM x annotated Switch on the A-B key
+            counts = {"matched": 0, "partially_matched": 0, "unmatched": 0}
+            processed = 0
+            switch_groups = groupby(annotated.sorted(), key=itemgetter(0))
+            switch_key, switch_group = next(switch_groups, (None, None))
+            for ab_key, atm_group in groupby(atm_sorter.sorted(), key=itemgetter(0)):
+                while switch_key is not None and switch_key < ab_key:
+                    switch_key, switch_group = next(switch_groups, (None, None))
+                switches = list(switch_group) if switch_key == ab_key else []
+                if switch_key == ab_key:
+                    # Consumed; keep the list for the rest of this ATM key group
+                    switch_key, switch_group = next(switch_groups, (None, None))
+
+                for _, _, atm_id, atm_amt in atm_group:
+                    processed += 1
+                    if processed % PROGRESS_EVERY == 0:
+                        if cancel is not None and cancel.is_set():
+                            raise MatchingCancelled()
+                        if progress is not None:
+                            progress[progress_key] = processed
+
+                    if not switches:
+                        counts["unmatched"] += 1
+                        emit("unmatched", atm_id, None, None)
+                        continue
+                    full = _first_full_match(switches, atm_amt, check_amount, allowed_diff)
+                    if full:
+                        counts["matched"] += 1
+                        emit("matched", atm_id, full[0], full[1])
+                    else:
+                        counts["partially_matched"] += 1
+                        emit("partially_matched", atm_id, switches[-1][2], None)
+
+            if progress is not None:
+                progress[progress_key] = processed
+            counts["spilledRuns"] = len(atm_sorter.runs) + len(annotated.runs)
+            return counts
+        finally:
+            for sorter in (atm_sorter, switch_sorter, flex_sorter, annotated):
+                sorter.close()
+
+
+def _first_full_match(switches, atm_amt, check_amount: bool, allowed_diff: Optional[float]):
+    for _, _, switch_id, candidates in switches:
+        for flex_id, flex_amt in candidates:
+            if check_amount:
+                if atm_amt is None or flex_amt is None or allowed_diff is None:
+                    continue
+                if abs(atm_amt - flex_amt) > allowed_diff:
+                    continue
+            return switch_id, flex_id
+    return None
+
+
+def collect_external_match(atm_rows, switch_rows, flex_rows, plan: MatchPlan,
+                           budget_bytes: int = MATCHING_MEMORY_BUDGET_BYTES, spill_dir: str = MATCHING_SPILL_DIR,
+                           progress=None, cancel=None) -> Dict[str, List]:
+    """external_match gathered into match_three_way's id format, each list in ATM source order."""
+    ids: Dict[str, List] = {"matched": [], "partially_matched": [], "unmatched": []}
+
+    def emit(status, atm_id, switch_id, flex_id):
+        if status == "matched":
+            ids[status].append((atm_id, switch_id, flex_id))
+        elif status == "partially_matched":
+            ids[status].append((atm_id, switch_id))
+        else:
+            ids[status].append(atm_id)
+
+    external_match(atm_rows, switch_rows, flex_rows, plan, emit, budget_bytes, spill_dir,
+                   progress, cancel, progress_key="processed:0")
+    # Sources stream in id order, so sorting by ATM id restores source order
+    ids["matched"].sort()
+    ids["partially_matched"].sort()
+    ids["unmatched"].sort()
+    return ids
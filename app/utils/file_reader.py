@@ -1,46 +1,262 @@
 import csv
+import datetime
+import gzip
 import io
 import json
 import os
+import zipfile
+from itertools import islice
+from typing import Any, Dict, Iterator, List, Optional, Tuple
 import pandas as pd
+from openpyxl import load_workbook
+from app.core.config import UPLOAD_BATCH_ROWS
+from app.utils.json_stream import iter_json_records
+from app.utils.switch_log_parser import build_switch_log_parser, layout_for_filename
+from app.utils.upload_staging import StagedUpload, iter_mmap_lines, stage_upload
+
+JSON_EXTENSIONS = (".json", ".ndjson", ".jsonl")
+# Extensions of the archive members that are parsed; other members are skipped
+DATA_EXTENSIONS = (".csv", ".txt", ".xlsx", ".xls") + JSON_EXTENSIONS
 
 async def read_file_by_extension(file):
-    filename = file.filename
-    extension = os.path.splitext(filename)[1].lower()
+    # Spill the upload to disk, then parse it from the staged copy
+    staged = await stage_upload(file)
+    return read_staged_file(staged)
+
+
+def read_staged_file(staged: StagedUpload):
+    """Parse a whole staged file into memory. Prefer iter_staged_batches for large files."""
+    data = [row for batch in iter_staged_batches(staged) for row in batch]
+    columns = list(data[0].keys()) if data else []
+
+    return {
+        "filename": staged.filename,
+        "extension": staged.extension,
+        "columns": columns,
+        "data": data,
+        "staging_id": staged.staging_id,
+    }
+
+
+def split_extension(filename: str) -> Tuple[str, str]:
+    """
+    (data extension, compression) of an upload name: "atm.csv.gz" -> (".csv", "gzip"),
+    "day.zip" -> ("", "zip"), "atm.csv" -> (".csv", "").
+    """
+    root, extension = os.path.splitext(filename.lower())
+    if extension == ".gz":
+        return os.path.splitext(root)[1], "gzip"
+    if extension == ".zip":
+        return "", "zip"
+    return extension, ""
+
+
+def _batched(rows, batch_size: int) -> Iterator[List[Dict[str, Any]]]:
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            break
+        yield batch
 
-    # Read file content
-    content = await file.read()
+
+def iter_staged_batches(staged: StagedUpload, batch_size: int = UPLOAD_BATCH_ROWS) -> Iterator[List[Dict[str, Any]]]:
+    """
+    Yield the rows of a staged file as lists of dicts, batch_size rows at a time.
+    Every reader produces the same row shape, so all formats share one ingestion pipeline.
+    """
+    extension = staged.extension
+
+    if staged.size == 0:
+        raise ValueError("Uploaded file is empty")
 
     # Convert based on extension
     if extension == ".csv":
-        decoded_content = content.decode("utf-8", errors="ignore")
-        reader = csv.reader(io.StringIO(decoded_content))
-        rows = list(reader)
+        rows = _iter_csv_rows(staged)
+    elif extension == ".xlsx":
+        rows = _iter_xlsx_rows(staged.path)
+    elif extension == ".xls":
+        rows = _iter_xls_rows(staged.path)
+    elif extension in JSON_EXTENSIONS:
+        rows = _iter_json_rows(staged.path)
+    elif extension == ".txt":
+        rows = _iter_txt_rows(staged)
+    else:
+        raise ValueError("Unsupported file extension")
 
-        columns = rows[0]
-        data = [dict(zip(columns, row)) for row in rows[1:]]
+    yield from _batched(rows, batch_size)
 
-    elif extension in [".xlsx", ".xls"]:
-        df = pd.read_excel(io.BytesIO(content))
-        columns = list(df.columns)
-        data = df.to_dict(orient="records")
 
-    elif extension == ".json":
-        data = json.loads(content.decode("utf-8", errors="ignore"))
-        columns = list(data[0].keys()) if data else []
+def iter_switch_log_batches(staged: StagedUpload, layout_name: str, batch_size: int = UPLOAD_BATCH_ROWS):
+    """Row batches of a native switch journal (fixed-width or ISO 8583) parsed with a declared layout."""
+    parser = build_switch_log_parser(layout_name)
+    with staged.open_mmap() as mm:
+        rows = parser.iter_rows(mm)
+        try:
+            yield from _batched(rows, batch_size)
+        finally:
+            rows.close()
 
-    elif extension == ".txt":
-        decoded_content = content.decode("utf-8", errors="ignore")
-        lines = decoded_content.splitlines()
-        columns = ["line"]
-        data = [{"line": line} for line in lines]
+
+def iter_upload_members(staged: StagedUpload, batch_size: int = UPLOAD_BATCH_ROWS, layout: Optional[str] = None):
+    """
+    Yield (name, batches) for every data file in an upload: the file itself, the
+    content of a .gz, or each member of a .zip. Compressed content is decompressed
+    as a stream while it is parsed; it is never inflated in memory or on disk.
+    Each member's batches must be consumed before moving on to the next member.
+    Switch journals are parsed with the given layout, or the layout matching their extension.
+    Zip members that are not data files (documents, nested archives) come with batches
+    None, so the caller can list them as skipped.
+    """
+    extension, compression = split_extension(staged.filename)
+    layout = layout or layout_for_filename(staged.filename)
+
+    if layout:
+        if compression or staged.size == 0:
+            raise ValueError("Switch logs must be uploaded uncompressed and non-empty")
+        yield staged.filename, iter_switch_log_batches(staged, layout, batch_size)
+
+    elif not compression:
+        yield staged.filename, iter_staged_batches(staged, batch_size)
+
+    elif compression == "gzip":
+        name = staged.filename[:-len(".gz")]
+        rows = _iter_stream_rows(lambda: gzip.open(staged.path, "rb"), extension)
+        yield name, _batched(rows, batch_size)
 
     else:
-        raise ValueError("Unsupported file extension")
+        with zipfile.ZipFile(staged.path) as archive:
+            for info in archive.infolist():
+                basename = os.path.basename(info.filename)
+                if info.is_dir() or info.filename.startswith("__MACOSX/") or basename.startswith("."):
+                    continue
+                member_extension, member_compression = split_extension(info.filename)
+                if member_compression or member_extension not in DATA_EXTENSIONS:
+                    yield info.filename, None
+                    continue
+                rows = _iter_stream_rows(lambda info=info: archive.open(info), member_extension)
+                yield info.filename, _batched(rows, batch_size)
 
-    return {
-        "filename": filename,
-        "extension": extension,
-        "columns": columns,
-        "data": data
-    }
+
+def _iter_stream_rows(open_stream, extension: str):
+    """Rows of a (decompressing) binary stream."""
+    with open_stream() as stream:
+        if not extension:
+            # Bare .gz: sniff JSON by its first significant byte, CSV otherwise
+            stream = io.BufferedReader(stream) if not hasattr(stream, "peek") else stream
+            head = stream.peek(64).lstrip()
+            extension = ".json" if head[:1] in (b"[", b"{") else ".csv"
+
+        if extension in (".csv", ".txt"):
+            text = io.TextIOWrapper(stream, encoding="utf-8", errors="ignore", newline="")
+            if extension == ".csv":
+                reader = csv.reader(text)
+                columns = next(reader, [])
+                for row in reader:
+                    yield dict(zip(columns, row))
+            else:
+                for line in text:
+                    yield {"line": line.rstrip("\r\n")}
+        elif extension == ".xlsx":
+            yield from _iter_xlsx_rows(stream)
+        elif extension == ".xls":
+            yield from _iter_xls_rows(stream)
+        elif extension in JSON_EXTENSIONS:
+            yield from _iter_json_rows(stream)
+        else:
+            raise ValueError("Unsupported file extension")
+
+
+def _iter_csv_rows(staged: StagedUpload):
+    with staged.open_mmap() as mm:
+        lines = iter_mmap_lines(mm)
+        try:
+            reader = csv.reader(lines)
+            columns = next(reader, [])
+            for row in reader:
+                yield dict(zip(columns, row))
+        finally:
+            # Release the memoryview before the map is closed
+            lines.close()
+
+
+def excel_cell_to_str(value) -> str:
+    """
+    Render an Excel cell the way it would appear in a CSV export. Whole numbers
+    (RRNs, STANs, account numbers) keep every digit instead of becoming floats.
+    """
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return str(value).upper()
+    if isinstance(value, int):
+        return str(value)
+    if isinstance(value, float):
+        return str(int(value)) if value.is_integer() else repr(value)
+    if isinstance(value, datetime.datetime):
+        return value.strftime("%Y-%m-%d %H:%M:%S")
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    return str(value)
+
+
+def _iter_xlsx_rows(source):
+    # read_only streams the sheet XML instead of building the whole workbook model
+    workbook = load_workbook(source, read_only=True, data_only=True)
+    try:
+        sheet = workbook.worksheets[0]
+        rows = sheet.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        columns = [excel_cell_to_str(c) for c in header]
+        for values in rows:
+            if values is None or all(v is None for v in values):
+                continue
+            yield dict(zip(columns, (excel_cell_to_str(v) for v in values)))
+    finally:
+        workbook.close()
+
+
+def _iter_xls_rows(source):
+    # Legacy BIFF workbooks are not supported by openpyxl; read them through pandas
+    df = pd.read_excel(source, dtype=object)
+    columns = [excel_cell_to_str(c) for c in df.columns]
+    for values in df.itertuples(index=False, name=None):
+        yield dict(zip(columns, (excel_cell_to_str(None if pd.isna(v) else v) for v in values)))
+
+
+def json_value_to_str(value) -> str:
+    """Render a JSON scalar the way it would appear in a CSV export."""
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, (dict, list)):
+        return json.dumps(value)
+    return excel_cell_to_str(value)
+
+
+def _iter_json_rows(source):
+    # Top-level arrays are decoded element by element, other documents as NDJSON
+    if isinstance(source, str):
+        with open(source, "r", encoding="utf-8", errors="ignore") as fh:
+            yield from _json_records_to_rows(iter_json_records(fh))
+    else:
+        yield from _json_records_to_rows(iter_json_records(io.TextIOWrapper(source, encoding="utf-8", errors="ignore")))
+
+
+def _json_records_to_rows(records):
+    for record in records:
+        if not isinstance(record, dict):
+            raise ValueError("JSON uploads must contain objects, one per transaction")
+        yield {str(key): json_value_to_str(value) for key, value in record.items()}
+
+
+def _iter_txt_rows(staged: StagedUpload):
+    with staged.open_mmap() as mm:
+        lines = iter_mmap_lines(mm)
+        try:
+            for line in lines:
+                yield {"line": line.rstrip("\r\n")}
+        finally:
+            lines.close()
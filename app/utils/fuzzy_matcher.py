@@ -0,0 +1,137 @@
+from collections import defaultdict
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from app.utils.matching_engine import FuzzyField, FuzzyPlan, MatchPlan, build_plan
+
+
+def bounded_distance(a: str, b: str, limit: int) -> Optional[int]:
+    """
+    Optimal string alignment distance (insertions, deletions, substitutions and
+    adjacent transpositions) between a and b, or None when it exceeds limit. Only the
+    diagonal band of width 2 * limit + 1 is computed, and it stops as soon as a whole
+    row is over the limit.
+    """
+    if a == b:
+        return 0
+    la, lb = len(a), len(b)
+    if abs(la - lb) > limit:
+        return None
+    over = limit + 1
+    before, prev = None, [j if j <= limit else over for j in range(lb + 1)]
+    for i in range(1, la + 1):
+        cur = [over] * (lb + 1)
+        if i <= limit:
+            cur[0] = i
+        best = cur[0]
+        for j in range(max(1, i - limit), min(lb, i + limit) + 1):
+            value = min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + (a[i - 1] != b[j - 1]))
+            if before is not None and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                value = min(value, before[j - 2] + 1)
+            cur[j] = min(value, over)
+            best = min(best, cur[j])
+        if best > limit:
+            return None
+        before, prev = prev, cur
+    return prev[lb] if prev[lb] <= limit else None
+
+
+def subset_packed(packed: Dict[str, Any], positions: Sequence[int]) -> Dict[str, Any]:
+    """The rows of a packed source at the given positions, in that order."""
+    return {
+        "ids": [packed["ids"][pos] for pos in positions],
+        "columns": {name: [column[pos] for pos in positions] for name, column in packed["columns"].items()},
+        "amounts": [packed["amounts"][pos] for pos in positions] if packed["amounts"] else [],
+    }
+
+
+def residue(atm: Dict[str, Any], switch: Dict[str, Any], flex: Dict[str, Any],
+            ids: Dict[str, List]) -> Dict[str, Any]:
+    """
+    What the fuzzy pass looks at: unmatched ATM rows against Switch rows no result
+    uses, and the Switch rows of partial matches against Flexcube rows no match uses.
+    """
+    used_switch = {s for _, s, _ in ids["matched"]} | {s for _, s in ids["partially_matched"]}
+    partial_switch = {s for _, s in ids["partially_matched"]}
+    used_flex = {f for _, _, f in ids["matched"]}
+    # Rows an aggregate match took are settled as well
+    for one_source, one_id, many_source, many_ids, _ in ids.get("aggregated", ()):
+        for source, row_ids in ((one_source, [one_id]), (many_source, many_ids)):
+            if source == "Switch":
+                used_switch.update(row_ids)
+            elif source == "Flexcube":
+                used_flex.update(row_ids)
+    unmatched = set(ids["unmatched"])
+    return {
+        "atm": subset_packed(atm, [p for p, i in enumerate(atm["ids"]) if i in unmatched]),
+        "switch": subset_packed(switch, [p for p, i in enumerate(switch["ids"]) if i not in used_switch]),
+        "partial_switch": subset_packed(switch, [p for p, i in enumerate(switch["ids"]) if i in partial_switch]),
+        "flex": subset_packed(flex, [p for p, i in enumerate(flex["ids"]) if i not in used_flex]),
+        "partially_matched": ids["partially_matched"],
+    }
+
+
+def _block_keys(packed: Dict[str, Any], fields: List[FuzzyField], side: str) -> List[Optional[Tuple]]:
+    columns = [packed["columns"][f.column(getattr(f, side))] for f in fields]
+    keys = []
+    for values in zip(*columns):
+        # A row missing any block value cannot be blocked, so it is never compared
+        keys.append(None if any(value is None or value == "" for value in values) else values)
+    return keys
+
+
+def _fuzzy_link(left: Dict[str, Any], right: Dict[str, Any], block: List[FuzzyField],
+                compare: List[FuzzyField], fuzzy: FuzzyPlan) -> Iterator[Tuple[Any, Any, float, Dict[str, int]]]:
+    """(left id, right id, score, distances) of the best candidates of every left row."""
+    blocks = defaultdict(list)
+    for pos, key in enumerate(_block_keys(right, block, "right")):
+        if key is not None:
+            blocks[key].append(pos)
+
+    pairs = [(f.left, left["columns"][f.column(f.left)], right["columns"][f.column(f.right)]) for f in compare]
+    for pos, key in enumerate(_block_keys(left, block, "left")):
+        scored = []
+        for candidate in blocks.get(key, ()) if key is not None else ():
+            similarity, distances = 0.0, {}
+            for name, left_values, right_values in pairs:
+                lv, rv = left_values[pos], right_values[candidate]
+                if not lv or not rv:
+                    continue
+                distance = bounded_distance(lv, rv, fuzzy.max_distance)
+                if distance is not None:
+                    distances[name] = distance
+                    similarity += 1 - distance / max(len(lv), len(rv))
+            if distances:
+                scored.append((-round(similarity / len(pairs), 4), candidate, distances))
+        scored.sort(key=lambda item: (item[0], item[1]))
+        for score, candidate, distances in scored[:fuzzy.candidates]:
+            yield left["ids"][pos], right["ids"][candidate], -score, distances
+
+
+def fuzzy_pass(rest: Dict[str, Any], plan: MatchPlan) -> List[Tuple]:
+    """
+    Scored candidate pairs for review, best first per residue row:
+    (atm id, switch id, flexcube id or None, score, {field: edit distance}).
+    """
+    fuzzy = plan.fuzzy
+    candidates = []
+
+    block, compare = fuzzy.fields_for("AB")
+    if compare:
+        for atm_id, switch_id, score, distances in _fuzzy_link(rest["atm"], rest["switch"], block, compare, fuzzy):
+            candidates.append((atm_id, switch_id, None, score, distances))
+
+    block, compare = fuzzy.fields_for("BC")
+    if compare:
+        atm_by_switch = defaultdict(list)
+        for atm_id, switch_id in rest["partially_matched"]:
+            atm_by_switch[switch_id].append(atm_id)
+        for switch_id, flex_id, score, distances in _fuzzy_link(
+                rest["partial_switch"], rest["flex"], block, compare, fuzzy):
+            for atm_id in atm_by_switch[switch_id]:
+                candidates.append((atm_id, switch_id, flex_id, score, distances))
+    return candidates
+
+
+def run_fuzzy_pass(rest: Dict[str, Any], matching_json: Dict[str, Any]) -> List[Tuple]:
+    """Process pool entry point: the plan is rebuilt from the rule JSON in the worker."""
+    return fuzzy_pass(rest, build_plan(matching_json))
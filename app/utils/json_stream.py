@@ -0,0 +1,129 @@
+import json
+from typing import Any, Iterator, TextIO
+
+JSON_READ_CHARS = 1024 * 1024
+
+_decoder = json.JSONDecoder()
+_WHITESPACE = " \t\r\n"
+
+
+class _TextBuffer:
+    """Sliding window over a text stream; consumed text is dropped as parsing advances."""
+
+    def __init__(self, stream: TextIO, read_chars: int):
+        self.stream = stream
+        self.read_chars = read_chars
+        self.text = ""
+        self.pos = 0
+        self.eof = False
+
+    def fill(self) -> bool:
+        if self.eof:
+            return False
+        chunk = self.stream.read(self.read_chars)
+        if not chunk:
+            self.eof = True
+            return False
+        # Compact before growing, so the buffer only ever holds unparsed text
+        self.text = self.text[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self) -> str:
+        """Next non-whitespace character, or "" at end of stream."""
+        while True:
+            while self.pos < len(self.text) and self.text[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.text):
+                return self.text[self.pos]
+            if not self.fill():
+                return ""
+
+    def decode(self) -> Any:
+        """Decode the next complete JSON value, reading more text until it is complete."""
+        if not self.peek():
+            raise ValueError("Unexpected end of JSON document")
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.text, self.pos)
+                # A bare number at the end of the buffer may continue in the next chunk
+                if end < len(self.text) or self.eof or isinstance(value, (dict, list, str)):
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            if not self.fill():
+                value, self.pos = _decoder.raw_decode(self.text, self.pos)
+                return value
+
+
+def iter_json_array(stream: TextIO, read_chars: int = JSON_READ_CHARS) -> Iterator[Any]:
+    """
+    Yield the elements of a top-level JSON array one at a time. Only the element being
+    decoded (plus one read chunk) is held in memory, whatever the size of the array.
+    """
+    buf = _TextBuffer(stream, read_chars)
+    if buf.peek() != "[":
+        raise ValueError("Expected a top-level JSON array")
+    buf.pos += 1
+
+    if buf.peek() == "]":
+        return
+    while True:
+        yield buf.decode()
+        separator = buf.peek()
+        buf.pos += 1
+        if separator == "]":
+            return
+        if separator != ",":
+            raise ValueError("Malformed JSON array")
+
+
+def iter_ndjson(stream: TextIO) -> Iterator[Any]:
+    """Yield one value per line of newline-delimited JSON, skipping blank lines."""
+    for line_no, line in enumerate(stream, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Invalid JSON on line {line_no}: {e.msg}")
+
+
+def iter_json_records(stream: TextIO, read_chars: int = JSON_READ_CHARS) -> Iterator[Any]:
+    """
+    Records from either layout: a top-level array when the document starts with "[",
+    newline-delimited JSON otherwise.
+    """
+    first = stream.read(1)
+    while first and first in _WHITESPACE:
+        first = stream.read(1)
+    if not first:
+        return
+    if first == "[":
+        yield from iter_json_array(_Prepend(first, stream), read_chars)
+    else:
+        yield from iter_ndjson(_Prepend(first, stream))
+
+
+class _Prepend:
+    """Put back text already read from a stream."""
+
+    def __init__(self, head: str, stream: TextIO):
+        self.head = head
+        self.stream = stream
+
+    def read(self, size: int = -1) -> str:
+        head, self.head = self.head, ""
+        if size is not None and size >= 0:
+            return head + self.stream.read(max(size - len(head), 0)) if head else self.stream.read(size)
+        return head + self.stream.read()
+
+    def __iter__(self):
+        head, self.head = self.head, ""
+        lines = iter(self.stream)
+        if head:
+            yield head + next(lines, "")
+        yield from lines
@@ -0,0 +1,146 @@
+import math
+from collections import Counter
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from app.utils.matching_engine import LINK_SOURCES, WINDOW_WIDTHS, MatchPlan
+
+
+def _pct(part: float, whole: float) -> float:
+    return round(part * 100 / whole, 2) if whole else 0.0
+
+
+def explain_rule_json(data):
+    """
+    Engine rule JSON of a rule in the /matching-rule body format (basic, matchCondition,
+    tolerance), or of a list of them, explained as a waterfall in list order.
+    """
+    rules = data if isinstance(data, list) else [data]
+    if not rules:
+        raise ValueError("No rule to explain")
+    matching_jsons = []
+    for rule in rules:
+        if not isinstance(rule, dict) or not isinstance(rule.get("matchCondition"), dict):
+            raise ValueError("Every rule needs a matchCondition object")
+        matching_jsons.append({"ruleId": rule.get("ruleId", rule.get("id")),
+                               "matchCondition": rule["matchCondition"], "tolerance": rule.get("tolerance")})
+    return matching_jsons[0] if len(matching_jsons) == 1 else matching_jsons
+
+
+def group_pairs(group: Dict[str, Any]) -> Tuple[Dict[str, List[Tuple[str, str]]], List[Dict[str, Any]]]:
+    """A matching group's field pairs per link, classified as MatchPlan does, and the mappings it ignores."""
+    pairs, ignored = {"AB": [], "BC": []}, []
+    for f in group.get("fields", []):
+        a, b, c = f.get("matching_fieldA"), f.get("matching_fieldB"), f.get("matching_fieldC")
+        if a and b and not c:
+            pairs["AB"].append((a, b))
+        elif b and c and not a:
+            pairs["BC"].append((b, c))
+        else:
+            ignored.append(f)
+    return pairs, ignored
+
+
+def sample_keys(packed: Dict[str, Any], fields: Sequence[str]) -> List[Tuple[str, ...]]:
+    if not fields:
+        return [()] * len(packed["ids"])
+    return list(zip(*(packed["columns"][field] for field in fields)))
+
+
+def distinct_estimate(keys: Sequence[Tuple], total_rows: int) -> int:
+    """
+    Distinct keys among total_rows rows, from a uniform sample of them, with the GEE
+    estimator: keys seen once in the sample are scaled by sqrt(N / n), keys seen more
+    often are counted once.
+    """
+    if not keys:
+        return 0
+    frequencies = Counter(Counter(keys).values())
+    estimate = math.sqrt(total_rows / len(keys)) * frequencies.get(1, 0)
+    estimate += sum(count for frequency, count in frequencies.items() if frequency > 1)
+    return int(round(min(max(estimate, sum(frequencies.values())), total_rows)))
+
+
+def key_stats(keys: Sequence[Tuple], total_rows: int) -> Dict[str, Any]:
+    """Cardinality of one side of a key: estimated distinct keys, empty keys, share of the most frequent key."""
+    counts = Counter(keys)
+    empty = sum(count for key, count in counts.items() if all(value == "" for value in key))
+    return {
+        "sampleRows": len(keys),
+        "distinct": distinct_estimate(keys, total_rows),
+        "emptyPct": _pct(empty, len(keys)),
+        "topKeyPct": _pct(max(counts.values()), len(keys)) if counts else 0.0,
+    }
+
+
+def join_selectivity(left: Sequence[Tuple], right: Sequence[Tuple], left_total: int, right_total: int) -> float:
+    """
+    Share of left x right row pairs with equal keys, from a uniform sample of each side.
+    Keys frequent in one sample and present in both are joined on their sample
+    frequencies; the other keys assume containment (every key of the side with fewer
+    distinct keys exists on the other), like a query planner's equi-join estimate.
+    """
+    if not left or not right:
+        return 0.0
+    left_counts, right_counts = Counter(left), Counter(right)
+    common = {key for key in left_counts
+              if key in right_counts and (left_counts[key] > 1 or right_counts[key] > 1)}
+    frequent = sum(left_counts[key] / len(left) * right_counts[key] / len(right) for key in common)
+    left_rest = [key for key in left if key not in common]
+    right_rest = [key for key in right if key not in common]
+    distinct = max(distinct_estimate(left_rest, round(left_total * len(left_rest) / len(left))),
+                   distinct_estimate(right_rest, round(right_total * len(right_rest) / len(right))), 1)
+    rest = len(left_rest) / len(left) * len(right_rest) / len(right) / distinct
+    return frequent + rest
+
+
+def group_breakdown(group: Dict[str, Any], samples: Dict[str, Dict[str, Any]],
+                    totals: Dict[str, int]) -> Dict[str, Any]:
+    """Per link of one matching group on its own: key cardinalities, selectivity and candidate pairs."""
+    pairs, ignored = group_pairs(group)
+    links = {}
+    for link, link_pairs in pairs.items():
+        if not link_pairs:
+            continue
+        left_source, right_source = LINK_SOURCES[link]
+        left = sample_keys(samples[left_source], [l for l, _ in link_pairs])
+        right = sample_keys(samples[right_source], [r for _, r in link_pairs])
+        selectivity = join_selectivity(left, right, totals[left_source], totals[right_source])
+        links[link] = {
+            "fields": [{left_source: l, right_source: r} for l, r in link_pairs],
+            left_source: key_stats(left, totals[left_source]),
+            right_source: key_stats(right, totals[right_source]),
+            "selectivity": float(f"{selectivity:.6g}"),
+            "estimatedPairs": round(selectivity * totals[left_source] * totals[right_source]),
+        }
+    return {"links": links, "ignoredFields": ignored}
+
+
+def probe_stats(left_keys: Sequence[Tuple], right_counts: Optional[Dict[Tuple, int]], left_total: int,
+                right_total: int) -> Dict[str, Any]:
+    """
+    Candidate pairs of a link, as the engine probes it: sampled left rows against the
+    exact count of right rows sharing each of their keys (None: the link has no key,
+    so every right row is a candidate). Tolerance windows narrow these further.
+    """
+    if not left_keys:
+        return {"keyPairs": 0, "pairsPerRow": 0.0, "coveragePct": 0.0, "maxBlock": 0}
+    if right_counts is None:
+        frequencies = [right_total] * len(left_keys)
+    else:
+        frequencies = [right_counts.get(key, 0) for key in left_keys]
+    return {
+        "keyPairs": round(sum(frequencies) * left_total / len(left_keys)),
+        "pairsPerRow": round(sum(frequencies) / len(left_keys), 2),
+        "coveragePct": _pct(sum(1 for frequency in frequencies if frequency), len(left_keys)),
+        "maxBlock": max(frequencies),
+    }
+
+
+def plan_windows(plan: MatchPlan) -> List[Dict[str, Any]]:
+    windows = []
+    for window in plan.windows:
+        left_source, right_source = LINK_SOURCES[window.link]
+        width = window.width / 60 if window.kind == "datetime" else window.width
+        windows.append({"type": window.kind, "link": window.link, left_source: window.left,
+                        right_source: window.right, WINDOW_WIDTHS[window.kind]: width})
+    return windows
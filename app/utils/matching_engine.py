@@ -0,0 +1,787 @@
+import time
+import zlib
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+SOURCES = ("ATM", "Switch", "Flexcube")
+
+# Amount columns compared by the amount tolerance (ATM amount against the Flexcube debit)
+AMOUNT_FIELDS = {"ATM": "amount", "Flexcube": "dr"}
+
+# ATM rows between progress updates and cancel checks
+PROGRESS_EVERY = 2000
+
+
+# Tolerance window kinds and the JSON key holding each one's width
+WINDOW_WIDTHS = {"datetime": "minutes", "amount": "band", "stan": "within"}
+# How fuzzy block fields compare: normalized text, calendar day, or amount
+BLOCK_KINDS = ("text", "date", "amount")
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+class MatchingCancelled(Exception):
+    pass
+
+
+def normalize(val) -> str:
+    """Normalize values for comparison"""
+    if val is None:
+        return ""
+    return str(val).strip().upper()
+
+
+def to_amount(val) -> Optional[float]:
+    """Amount as compared by the tolerance check; None when it cannot be read as a number."""
+    try:
+        return float(val or 0)
+    except (ValueError, TypeError):
+        return None
+
+
+def _seconds(val) -> Optional[float]:
+    if isinstance(val, str):
+        text = val.strip()
+        try:
+            val = datetime.fromisoformat(text)
+        except ValueError:
+            try:
+                # ATM file format: 12/1/2025 9:17
+                val = datetime.strptime(text, "%m/%d/%Y %H:%M")
+            except ValueError:
+                return None
+    if not isinstance(val, datetime):
+        return None
+    if val.tzinfo is not None:
+        val = val.astimezone(timezone.utc).replace(tzinfo=None)
+    return (val - _EPOCH).total_seconds()
+
+
+def window_value(kind: str, val) -> Optional[float]:
+    """Position of a value on a window's axis; None when it cannot be placed."""
+    if val is None or val == "":
+        return None
+    if kind == "datetime":
+        return _seconds(val)
+    if kind == "date":
+        seconds = _seconds(val)
+        return seconds // 86400 if seconds is not None else None
+    try:
+        return float(str(val).strip())
+    except ValueError:
+        return None
+
+
+# Source of each side of a link: "AB" joins ATM (left) to Switch (right), and so on
+LINK_SOURCES = {"AB": ("ATM", "Switch"), "BC": ("Switch", "Flexcube"), "AC": ("ATM", "Flexcube")}
+
+
+def _link(spec: Dict[str, Any], what: str, links: Sequence[str] = ("AB", "BC")) -> Tuple[str, str, str]:
+    """(link, left field, right field) of a fieldA/fieldB or fieldB/fieldC mapping."""
+    a, b, c = spec.get("fieldA"), spec.get("fieldB"), spec.get("fieldC")
+    if a and b and not c:
+        link, left, right = "AB", a, b
+    elif b and c and not a:
+        link, left, right = "BC", b, c
+    elif a and c and not b and "AC" in links:
+        link, left, right = "AC", a, c
+    else:
+        link = None
+    if link not in links:
+        raise ValueError(f"A {what} maps " + " or ".join(f"field{l[0]}/field{l[1]}" for l in links))
+    return link, left, right
+
+
+def _source_field(link: str, left: str, right: str, source: str) -> Optional[str]:
+    """The field a source contributes to a link, if it takes part in it."""
+    left_source, right_source = LINK_SOURCES[link]
+    return {left_source: left, right_source: right}.get(source)
+
+
+class Window:
+    """
+    One tolerance window of a rule, e.g. {"type": "datetime", "fieldA": "datetime",
+    "fieldB": "datetime", "minutes": 10}: the two mapped values may differ by at most
+    the width (minutes, an amount band, or a STAN distance). Like the match fields, it
+    links ATM to Switch (fieldA/fieldB) or Switch to Flexcube (fieldB/fieldC).
+    """
+
+    def __init__(self, spec: Dict[str, Any]):
+        self.kind = spec.get("type")
+        if self.kind not in WINDOW_WIDTHS:
+            raise ValueError(f"Unknown tolerance window type: {self.kind!r}")
+        self.link, self.left, self.right = _link(spec, "tolerance window")
+        try:
+            width = float(spec[WINDOW_WIDTHS[self.kind]])
+        except (KeyError, ValueError, TypeError):
+            raise ValueError(f"Tolerance window {self.kind!r} needs a numeric {WINDOW_WIDTHS[self.kind]!r}")
+        self.width = width * 60 if self.kind == "datetime" else width
+
+    def column(self, field: str) -> str:
+        """Packed column holding this window's values of a field."""
+        return f"{self.kind}:{field}"
+
+
+class FuzzyField:
+    """A block or compare mapping of the fuzzy pass, e.g. {"fieldA": "rrn", "fieldB": "rrn"}."""
+
+    def __init__(self, spec: Dict[str, Any], what: str, kinds: Sequence[str] = ("text",),
+                 links: Sequence[str] = ("AB", "BC")):
+        self.link, self.left, self.right = _link(spec, what, links)
+        self.kind = spec.get("type", "text")
+        if self.kind not in kinds:
+            raise ValueError(f"Unknown {what} type: {self.kind!r}")
+
+    def column(self, field: str) -> str:
+        # Text values share the normalized key columns
+        return field if self.kind == "text" else f"{self.kind}:{field}"
+
+
+class FuzzyPlan:
+    """
+    Optional fuzzy pass over the residue, from the tolerance JSON:
+
+        "fuzzy": {"maxDistance": 1, "candidates": 3,
+                  "block": [{"fieldA": "terminalid", "fieldB": "terminalid"},
+                            {"type": "date", "fieldA": "datetime", "fieldB": "datetime"},
+                            {"type": "amount", "fieldA": "amount", "fieldB": "amountminor"}],
+                  "compare": [{"fieldA": "rrn", "fieldB": "rrn"}, {"fieldA": "stan", "fieldB": "stan"}]}
+
+    Residue rows are only compared within equal block values; a pair is a candidate
+    when some compare field is within maxDistance edits (adjacent transpositions
+    included). Every link with compare fields needs block fields.
+    """
+
+    def __init__(self, spec: Dict[str, Any]):
+        try:
+            self.max_distance = int(spec.get("maxDistance", 1))
+            self.candidates = int(spec.get("candidates", 3))
+        except (ValueError, TypeError):
+            raise ValueError("Fuzzy maxDistance and candidates must be integers")
+        self.block = [FuzzyField(f, "fuzzy block field", BLOCK_KINDS) for f in spec.get("block") or []]
+        self.compare = [FuzzyField(f, "fuzzy compare field") for f in spec.get("compare") or []]
+        for link in {field.link for field in self.compare}:
+            if not self.fields_for(link)[0]:
+                raise ValueError(f"Fuzzy matching on the {link} link needs at least one block field")
+
+    def fields_for(self, link: str) -> Tuple[List[FuzzyField], List[FuzzyField]]:
+        return ([f for f in self.block if f.link == link], [f for f in self.compare if f.link == link])
+
+
+class AggregateGroup:
+    """
+    One aggregate mapping: a single row of one source against several rows of another
+    in the same block, e.g. one Flexcube posting covering several ATM dispenses:
+
+        {"one": "C", "block": [{"fieldA": "account_masked", "fieldC": "account_masked"},
+                               {"type": "date", "fieldA": "datetime", "fieldC": "posted_datetime"}],
+         "amount": {"fieldA": "amount", "fieldC": "dr"}}
+    """
+
+    def __init__(self, spec: Dict[str, Any]):
+        self.amount = FuzzyField({**(spec.get("amount") or {}), "type": "amount"}, "aggregate amount",
+                                 ("amount",), LINK_SOURCES)
+        self.link = self.amount.link
+        self.block = [FuzzyField(f, "aggregate block field", BLOCK_KINDS, (self.link,)) for f in spec.get("block") or []]
+        if not self.block:
+            raise ValueError("An aggregate group needs at least one block field")
+        one = {"A": "ATM", "B": "Switch", "C": "Flexcube"}.get(spec.get("one"))
+        if one not in LINK_SOURCES[self.link]:
+            raise ValueError(f"Aggregate 'one' must be one of the sources of its {self.link} link")
+        self.one_source = one
+        self.many_source = next(source for source in LINK_SOURCES[self.link] if source != one)
+
+
+class AggregatePlan:
+    """
+    Optional aggregate pass over rows the exact match left unmatched, from the tolerance JSON:
+
+        "aggregate": {"amountDiff": 1, "maxItems": 8, "maxNodes": 20000, "groups": [...]}
+
+    A row of the "one" side is matched to 2..maxItems rows of the "many" side whose
+    amounts sum to its amount within amountDiff; maxNodes bounds the subset search
+    per row.
+    """
+
+    def __init__(self, spec: Dict[str, Any]):
+        try:
+            self.amount_diff = float(spec.get("amountDiff", 0))
+            self.max_items = int(spec.get("maxItems", 8))
+            self.max_nodes = int(spec.get("maxNodes", 20000))
+        except (ValueError, TypeError):
+            raise ValueError("Aggregate amountDiff, maxItems and maxNodes must be numbers")
+        self.groups = [AggregateGroup(group) for group in spec.get("groups") or []]
+
+    def mappings(self) -> List[FuzzyField]:
+        return [field for group in self.groups for field in group.block + [group.amount]]
+
+
+class BlockIndex:
+    """
+    Exact-key blocks of row positions, in source order. When the link has tolerance
+    windows, every block is also sorted on the first window's values, so the rows
+    within that window are found by bisection and only those are checked against the
+    other windows: O(log n) per probe instead of a scan of the block.
+    """
+
+    def __init__(self, keys: List[Tuple[str, ...]], windows: Sequence[Window] = (),
+                 values: Sequence[List[Optional[float]]] = ()):
+        self.blocks = _index(keys)
+        self.windows = list(windows)
+        self.values = list(values)
+        self.sorted = {}
+        if self.windows:
+            primary = self.values[0]
+            for key, positions in self.blocks.items():
+                ordered = sorted((primary[pos], pos) for pos in positions if primary[pos] is not None)
+                self.sorted[key] = ([value for value, _ in ordered], [pos for _, pos in ordered])
+
+    def get(self, key: Tuple[str, ...], probe: Sequence[Optional[float]] = ()) -> Sequence[int]:
+        if not self.windows:
+            return self.blocks.get(key, ())
+        block = self.sorted.get(key)
+        if block is None or any(value is None for value in probe):
+            return ()
+        values, positions = block
+        width = self.windows[0].width
+        found = positions[bisect_left(values, probe[0] - width):bisect_right(values, probe[0] + width)]
+        for window, column, value in zip(self.windows[1:], self.values[1:], probe[1:]):
+            found = [pos for pos in found if column[pos] is not None and abs(column[pos] - value) <= window.width]
+        # Candidates are tried in source order, as without windows
+        return sorted(found)
+
+
+class MatchPlan:
+    """
+    The parts of a matching rule the engine evaluates. Fields mapped on A and B only
+    join ATM to Switch, fields mapped on B and C only join Switch to Flexcube; other
+    mappings are not compared.
+    """
+
+    def __init__(self, matching_json: Dict[str, Any]):
+        self.rule_id = matching_json.get("ruleId")
+        self.ab_pairs: List[Tuple[str, str]] = []
+        self.bc_pairs: List[Tuple[str, str]] = []
+        for group in matching_json["matchCondition"].get("matchingGroups", []):
+            for f in group.get("fields", []):
+                a = f.get("matching_fieldA")
+                b = f.get("matching_fieldB")
+                c = f.get("matching_fieldC")
+                if a and b and not c:
+                    self.ab_pairs.append((a, b))
+                elif b and c and not a:
+                    self.bc_pairs.append((b, c))
+
+        tolerance = matching_json.get("tolerance") or {}
+        self.windows: List[Window] = [Window(spec) for spec in tolerance.get("windows") or []]
+        self.fuzzy = FuzzyPlan(tolerance["fuzzy"]) if tolerance.get("fuzzy") else None
+        self.aggregate = AggregatePlan(tolerance["aggregate"]) if tolerance.get("aggregate") else None
+        self.check_amount = tolerance.get("allowAmountDiff") == "N"
+        try:
+            self.amount_diff = float(tolerance.get("amountDiff", 0))
+        except (ValueError, TypeError):
+            # An unreadable allowance fails every tolerance check, as before
+            self.amount_diff = None
+
+    def key_fields(self, source: str) -> List[str]:
+        if source == "ATM":
+            return list(dict.fromkeys(a for a, _ in self.ab_pairs))
+        if source == "Flexcube":
+            return list(dict.fromkeys(c for _, c in self.bc_pairs))
+        fields = [b for _, b in self.ab_pairs] + [b for b, _ in self.bc_pairs]
+        return list(dict.fromkeys(fields))
+
+    def amount_field(self, source: str) -> Optional[str]:
+        return AMOUNT_FIELDS.get(source) if self.check_amount else None
+
+    def windows_for(self, link: str) -> List[Window]:
+        return [window for window in self.windows if window.link == link]
+
+    def derived_columns(self, source: str) -> List[Tuple[str, str, str]]:
+        """
+        (kind, field, column) of every packed column besides the key fields: window
+        positions and fuzzy block/compare values. A column shared by several windows or
+        fuzzy fields appears once.
+        """
+        mappings = list(self.windows) + ((self.fuzzy.block + self.fuzzy.compare) if self.fuzzy else [])
+        mappings += self.aggregate.mappings() if self.aggregate else []
+        columns = {}
+        for mapping in mappings:
+            field = _source_field(mapping.link, mapping.left, mapping.right, source)
+            if field is not None:
+                columns.setdefault(mapping.column(field), (mapping.kind, field, mapping.column(field)))
+        return list(columns.values())
+
+    def load_fields(self, source: str) -> List[str]:
+        """Every column of the source the rule reads: key fields, derived columns and the tolerance amount."""
+        amount_field = self.amount_field(source)
+        fields = self.key_fields(source) + [field for _, field, _ in self.derived_columns(source)]
+        return list(dict.fromkeys(fields + ([amount_field] if amount_field else [])))
+
+    def shard_fields(self) -> Dict[str, Optional[str]]:
+        """
+        Per-source field to hash-partition on. Every candidate pair must land in the same
+        shard, so ATM and Switch shard on the first A-B pair; Flexcube shards on its side
+        of a B-C pair that reuses that Switch field (RRN-style chained keys), and is
+        copied to every shard when there is none. No A-B pair means no partitioning.
+        """
+        if not self.ab_pairs:
+            return {"ATM": None, "Switch": None, "Flexcube": None}
+        a, b = self.ab_pairs[0]
+        c = next((c for bc_b, c in self.bc_pairs if bc_b == b), None)
+        return {"ATM": a, "Switch": b, "Flexcube": c}
+
+
+class RuleSet:
+    """
+    An ordered waterfall of rules run as one reconciliation (see match_waterfall).
+    Packs and shards like a single MatchPlan: its columns are the union of its rules'.
+    """
+
+    def __init__(self, matching_jsons: List[Dict[str, Any]]):
+        self.plans = [MatchPlan(matching_json) for matching_json in matching_jsons]
+        self.windows = [window for plan in self.plans for window in plan.windows]
+        # Residue passes run once on the final residue, so the last rule defining one wins
+        self.fuzzy = next((plan.fuzzy for plan in reversed(self.plans) if plan.fuzzy), None)
+        self.aggregate = next((plan.aggregate for plan in reversed(self.plans) if plan.aggregate), None)
+        self.check_amount = any(plan.check_amount for plan in self.plans)
+
+    def key_fields(self, source: str) -> List[str]:
+        return list(dict.fromkeys(field for plan in self.plans for field in plan.key_fields(source)))
+
+    def amount_field(self, source: str) -> Optional[str]:
+        return AMOUNT_FIELDS.get(source) if self.check_amount else None
+
+    def derived_columns(self, source: str) -> List[Tuple[str, str, str]]:
+        columns = {}
+        for plan in self.plans:
+            for kind, field, column in plan.derived_columns(source):
+                columns.setdefault(column, (kind, field, column))
+        return list(columns.values())
+
+    def load_fields(self, source: str) -> List[str]:
+        return MatchPlan.load_fields(self, source)
+
+    def shard_fields(self) -> Dict[str, Optional[str]]:
+        # Partitioning is only safe when every rule would partition the same way, and
+        # Flexcube is partitioned too: a copy in every shard could be consumed twice
+        fields = [plan.shard_fields() for plan in self.plans]
+        if any(f != fields[0] for f in fields) or fields[0]["Flexcube"] is None:
+            return {"ATM": None, "Switch": None, "Flexcube": None}
+        return fields[0]
+
+
+def build_plan(matching_json) -> Union[MatchPlan, RuleSet]:
+    """A rule JSON gives a MatchPlan, a list of them a RuleSet."""
+    if isinstance(matching_json, list):
+        return RuleSet(matching_json)
+    return MatchPlan(matching_json)
+
+
+def pack_source(rows: Iterable[Dict[str, Any]], plan: MatchPlan, source: str) -> Dict[str, Any]:
+    """
+    Compact columnar form of one source for the engine: the row ids, one list of
+    normalized values per key field the rule uses, one list per derived column (window
+    positions, fuzzy block values), and the tolerance amounts. Only this crosses the
+    process boundary, never the full row dicts.
+    """
+    fields = plan.key_fields(source)
+    # Text columns already packed as key fields are not packed twice
+    derived = [(kind, field, column) for kind, field, column in plan.derived_columns(source)
+               if kind != "text" or column not in fields]
+    amount_field = plan.amount_field(source)
+    ids, columns, amounts = [], {field: [] for field in fields}, []
+    columns.update({column: [] for _, _, column in derived})
+    for row in rows:
+        ids.append(row["id"])
+        for field in fields:
+            columns[field].append(normalize(row.get(field)))
+        for kind, field, column in derived:
+            value = row.get(field)
+            columns[column].append(normalize(value) if kind == "text" else window_value(kind, value))
+        if amount_field:
+            amounts.append(to_amount(row.get(amount_field, 0)))
+    return {"ids": ids, "columns": columns, "amounts": amounts}
+
+
+def _keys(packed: Dict[str, Any], fields: List[str]) -> List[Tuple[str, ...]]:
+    if not fields:
+        return [()] * len(packed["ids"])
+    return list(zip(*(packed["columns"][field] for field in fields)))
+
+
+def _index(keys: List[Tuple[str, ...]]) -> Dict[Tuple[str, ...], List[int]]:
+    """Key -> row positions, in source order."""
+    index = defaultdict(list)
+    for pos, key in enumerate(keys):
+        index[key].append(pos)
+    return index
+
+
+class IndexCache:
+    """
+    Key tuples, block indexes and window probes over one set of packed sources, built
+    on first use and shared by every rule pass that needs the same ones.
+    """
+
+    def __init__(self, atm: Dict[str, Any], switch: Dict[str, Any], flex: Dict[str, Any]):
+        self.sources = {"ATM": atm, "Switch": switch, "Flexcube": flex}
+        self._cache: Dict[Tuple, Any] = {}
+        # Milliseconds spent building, reported as the index stage of a run
+        self.build_ms = 0.0
+        self._building = False
+
+    def _get(self, key: Tuple, build):
+        if key not in self._cache:
+            if self._building:
+                # Nested build (an index over its keys): the outer one is already timed
+                self._cache[key] = build()
+            else:
+                started, self._building = time.perf_counter(), True
+                try:
+                    self._cache[key] = build()
+                finally:
+                    self._building = False
+                    self.build_ms += (time.perf_counter() - started) * 1000
+        return self._cache[key]
+
+    def keys(self, source: str, fields: List[str]) -> List[Tuple[str, ...]]:
+        return self._get(("keys", source, tuple(fields)), lambda: _keys(self.sources[source], fields))
+
+    def index(self, source: str, fields: List[str], windows: List[Window]) -> BlockIndex:
+        signature = tuple((w.kind, w.right, w.width) for w in windows)
+        columns = self.sources[source]["columns"]
+        return self._get(("index", source, tuple(fields), signature), lambda: BlockIndex(
+            self.keys(source, fields), windows, [columns[w.column(w.right)] for w in windows]))
+
+    def probes(self, source: str, windows: List[Window]) -> Optional[List[Tuple]]:
+        """Values each row of the source probes the other side's windows with."""
+        if not windows:
+            return None
+        columns = self.sources[source]["columns"]
+        return self._get(("probes", source, tuple(w.column(w.left) for w in windows)),
+                         lambda: list(zip(*(columns[w.column(w.left)] for w in windows))))
+
+
+def _match_pass(cache: IndexCache, plan: MatchPlan, atm_positions: Iterable[int],
+                switch_alive: Optional[List[bool]] = None, flex_alive: Optional[List[bool]] = None,
+                progress=None, cancel=None, progress_key: str = "processed",
+                offset: int = 0) -> Dict[str, List]:
+    """
+    One rule over the given ATM rows, skipping Switch/Flexcube rows no longer alive.
+    Returns positions: matched (atm, switch, flex), partially_matched (atm, switch), unmatched atm.
+    """
+    ab_atm = [a for a, _ in plan.ab_pairs]
+    ab_switch = [b for _, b in plan.ab_pairs]
+    bc_switch = [b for b, _ in plan.bc_pairs]
+    bc_flex = [c for _, c in plan.bc_pairs]
+
+    ab_windows, bc_windows = plan.windows_for("AB"), plan.windows_for("BC")
+    switch_by_ab = cache.index("Switch", ab_switch, ab_windows)
+    switch_bc_keys = cache.keys("Switch", bc_switch)
+    flex_by_bc = cache.index("Flexcube", bc_flex, bc_windows)
+    atm_keys = cache.keys("ATM", ab_atm)
+    atm_probes = cache.probes("ATM", ab_windows)
+    switch_probes = cache.probes("Switch", bc_windows)
+
+    atm_amounts, flex_amounts = cache.sources["ATM"]["amounts"], cache.sources["Flexcube"]["amounts"]
+    check_amount, allowed_diff = plan.check_amount, plan.amount_diff
+
+    matched, partially_matched, unmatched = [], [], []
+    done = 0
+
+    for done, pos in enumerate(atm_positions, 1):
+        if done % PROGRESS_EVERY == 0:
+            if cancel is not None and cancel.is_set():
+                raise MatchingCancelled()
+            if progress is not None:
+                progress[progress_key] = offset + done
+
+        candidates = switch_by_ab.get(atm_keys[pos], atm_probes[pos] if atm_probes else ())
+        if switch_alive is not None:
+            candidates = [s for s in candidates if switch_alive[s]]
+        if not candidates:
+            unmatched.append(pos)
+            continue
+
+        full = None
+        atm_amt = atm_amounts[pos] if check_amount else None
+        for s in candidates:
+            for f in flex_by_bc.get(switch_bc_keys[s], switch_probes[s] if switch_probes else ()):
+                if flex_alive is not None and not flex_alive[f]:
+                    continue
+                if check_amount:
+                    flex_amt = flex_amounts[f]
+                    if atm_amt is None or flex_amt is None or allowed_diff is None:
+                        continue
+                    if abs(atm_amt - flex_amt) > allowed_diff:
+                        continue
+                full = (s, f)
+                break
+            if full:
+                break
+
+        if full:
+            matched.append((pos, full[0], full[1]))
+        else:
+            partially_matched.append((pos, candidates[-1]))
+
+    if progress is not None:
+        progress[progress_key] = offset + done
+    return {"matched": matched, "partially_matched": partially_matched, "unmatched": unmatched}
+
+
+def _to_ids(result: Dict[str, List], atm: Dict[str, Any], switch: Dict[str, Any], flex: Dict[str, Any]):
+    atm_ids, switch_ids, flex_ids = atm["ids"], switch["ids"], flex["ids"]
+    return {
+        "matched": [(atm_ids[a], switch_ids[s], flex_ids[f]) for a, s, f in result["matched"]],
+        "partially_matched": [(atm_ids[a], switch_ids[s]) for a, s in result["partially_matched"]],
+        "unmatched": [atm_ids[a] for a in result["unmatched"]],
+    }
+
+
+def match_three_way(atm: Dict[str, Any], switch: Dict[str, Any], flex: Dict[str, Any], plan: MatchPlan,
+                    progress=None, cancel=None, progress_key: str = "processed") -> Dict[str, List]:
+    """
+    Three-way match over packed sources. Same semantics as the original nested loops:
+    for each ATM row the Switch rows with an equal A-B key are tried in source order,
+    and for each of them the Flexcube rows with an equal B-C key, also in order; the
+    first Flexcube row passing the amount tolerance gives a full match. An ATM row with
+    Switch candidates but no full match is partial, paired with its last candidate.
+    Candidates come from hash indexes instead of scanning every pair; with tolerance
+    windows they must also fall within every window of their link.
+    Returns ids: matched (atm, switch, flex), partially_matched (atm, switch), unmatched atm,
+    and the index build / match split of the time taken under "timings".
+    """
+    started = time.perf_counter()
+    cache = IndexCache(atm, switch, flex)
+    result = _match_pass(cache, plan, range(len(atm["ids"])),
+                         progress=progress, cancel=cancel, progress_key=progress_key)
+    ids = _to_ids(result, atm, switch, flex)
+    ids["timings"] = _timings(cache, started)
+    return ids
+
+
+def _timings(cache: IndexCache, started: float) -> Dict[str, float]:
+    total = (time.perf_counter() - started) * 1000
+    return {"indexMs": round(cache.build_ms, 3), "matchMs": round(total - cache.build_ms, 3)}
+
+
+def match_waterfall(atm: Dict[str, Any], switch: Dict[str, Any], flex: Dict[str, Any], rules: "RuleSet",
+                    progress=None, cancel=None, progress_key: str = "processed") -> Dict[str, List]:
+    """
+    Run the rules in order, each over the residue of the ones before it: ATM rows
+    fully matched by an earlier rule are not evaluated again, and the Switch and
+    Flexcube rows of those matches are no longer candidates. Indexes are shared by
+    rules using the same keys. An ATM row no rule fully matches is partial with the
+    candidate of the first rule that found one, else unmatched. Per-rule counts and
+    timings come back under "rules".
+    """
+    run_started = time.perf_counter()
+    cache = IndexCache(atm, switch, flex)
+    switch_alive = [True] * len(switch["ids"])
+    flex_alive = [True] * len(flex["ids"])
+    remaining = list(range(len(atm["ids"])))
+    matched_by, partial_by, stats = {}, {}, []
+    offset = 0
+
+    for number, plan in enumerate(rules.plans):
+        started = time.perf_counter()
+        if remaining:
+            result = _match_pass(cache, plan, remaining, switch_alive, flex_alive, progress, cancel, progress_key,
+                                 offset)
+        else:
+            # Nothing left for this rule: skip building its indexes
+            result = {"matched": [], "partially_matched": [], "unmatched": []}
+        offset += len(remaining)
+        for a, s, f in result["matched"]:
+            matched_by[a] = (s, f)
+            switch_alive[s] = False
+            flex_alive[f] = False
+        for a, s in result["partially_matched"]:
+            partial_by.setdefault(a, s)
+        stats.append({
+            "rule": number,
+            "ruleId": plan.rule_id,
+            "atmRows": len(remaining),
+            "matched": len(result["matched"]),
+            "partiallyMatched": len(result["partially_matched"]),
+            "ms": round((time.perf_counter() - started) * 1000, 1),
+        })
+        remaining = [a for a in remaining if a not in matched_by]
+
+    merged = {"matched": [], "partially_matched": [], "unmatched": []}
+    for a in range(len(atm["ids"])):
+        if a in matched_by:
+            merged["matched"].append((a, *matched_by[a]))
+        elif a in partial_by:
+            merged["partially_matched"].append((a, partial_by[a]))
+        else:
+            merged["unmatched"].append(a)
+    ids = _to_ids(merged, atm, switch, flex)
+    ids["rules"] = stats
+    ids["timings"] = _timings(cache, run_started)
+    return ids
+
+
+def match_rules(atm, switch, flex, plan, progress=None, cancel=None, progress_key: str = "processed"):
+    if isinstance(plan, RuleSet):
+        return match_waterfall(atm, switch, flex, plan, progress, cancel, progress_key)
+    return match_three_way(atm, switch, flex, plan, progress, cancel, progress_key)
+
+
+def run_packed_match(atm, switch, flex, matching_json, progress=None, cancel=None,
+                     progress_key: str = "processed") -> Dict[str, List]:
+    """Process pool entry point: the plan is rebuilt from the rule JSON in the worker."""
+    return match_rules(atm, switch, flex, build_plan(matching_json), progress, cancel, progress_key)
+
+
+def shard_of(value: str, shards: int) -> int:
+    # crc32 rather than hash(): str hashes are salted per process, shards must agree across nodes
+    return zlib.crc32(value.encode("utf-8")) % shards
+
+
+def partition_packed(packed: Dict[str, Any], field: Optional[str], shards: int) -> List[Dict[str, Any]]:
+    """
+    Split a packed source into shards by the hash of one of its key columns, keeping
+    source order inside each shard. Without a field the source is copied to every shard.
+    """
+    if field is None:
+        return [packed] * shards
+    parts = [{"ids": [], "columns": {name: [] for name in packed["columns"]}, "amounts": []} for _ in range(shards)]
+    names = list(packed["columns"])
+    columns = [packed["columns"][name] for name in names]
+    amounts = packed["amounts"]
+    for pos, value in enumerate(packed["columns"][field]):
+        part = parts[shard_of(value, shards)]
+        part["ids"].append(packed["ids"][pos])
+        for name, column in zip(names, columns):
+            part["columns"][name].append(column[pos])
+        if amounts:
+            part["amounts"].append(amounts[pos])
+    return parts
+
+
+def build_shard_jobs(atm, switch, flex, plan: MatchPlan, shards: int) -> List[Tuple[Dict, Dict, Dict]]:
+    """
+    Self-contained (atm, switch, flex) inputs, one per shard, each reconcilable on its
+    own by run_packed_match. Falls back to a single job when the rule has no key that
+    can partition all candidate pairs.
+    """
+    fields = plan.shard_fields()
+    if shards <= 1 or fields["ATM"] is None:
+        return [(atm, switch, flex)]
+    return list(zip(
+        partition_packed(atm, fields["ATM"], shards),
+        partition_packed(switch, fields["Switch"], shards),
+        partition_packed(flex, fields["Flexcube"], shards),
+    ))
+
+
+def merge_shard_results(results: List[Dict[str, List]], atm_ids: List[Any]) -> Dict[str, List]:
+    """Concatenate per-shard ids back into ATM source order."""
+    order = {atm_id: pos for pos, atm_id in enumerate(atm_ids)}
+    merged = {}
+    for status in ("matched", "partially_matched", "unmatched"):
+        items = [item for result in results for item in result[status]]
+        if status == "unmatched":
+            items.sort(key=order.__getitem__)
+        else:
+            items.sort(key=lambda item: order[item[0]])
+        merged[status] = items
+    # Shards restored from an earlier attempt of a resumed run carry their ids and rule
+    # counts, but no timings of this attempt
+    ruled = [result for result in results if "rules" in result]
+    if ruled:
+        # Shards run the rules side by side: counts add up, a rule took as long as its slowest shard
+        merged["rules"] = [
+            {**stats[0], **{key: sum(s[key] for s in stats) for key in ("atmRows", "matched", "partiallyMatched")},
+             "ms": max(s["ms"] for s in stats)}
+            for stats in zip(*(result["rules"] for result in ruled))
+        ]
+    ran = [result for result in results if "timings" in result]
+    if ran:
+        merged["timings"] = {stage: max(result["timings"][stage] for result in ran)
+                             for stage in ran[0]["timings"]}
+    return merged
+
+
+def _shape_matches(ids: Dict[str, List], row) -> Dict[str, List[Dict[str, Any]]]:
+    """Summary lists of engine ids, each id of a source replaced by row(source, id)."""
+    shaped = {
+        "matched": [
+            {"ATM": row("ATM", a), "Switch": row("Switch", s), "Flexcube": row("Flexcube", f)}
+            for a, s, f in ids["matched"]
+        ],
+        "partially_matched": [
+            {"ATM": row("ATM", a), "Switch": row("Switch", s), "Flexcube": None}
+            for a, s in ids["partially_matched"]
+        ],
+        "unmatched": [
+            {"ATM": row("ATM", a), "Switch": None, "Flexcube": None}
+            for a in ids["unmatched"]
+        ],
+    }
+    if "fuzzy" in ids:
+        shaped["fuzzy_candidates"] = [
+            {"ATM": row("ATM", a), "Switch": row("Switch", s), "Flexcube": row("Flexcube", f) if f is not None else None,
+             "score": score, "distances": distances}
+            for a, s, f, score, distances in ids["fuzzy"]
+        ]
+    if "aggregated" in ids:
+        shaped["aggregate_matched"] = []
+        for one_source, one_id, many_source, many_ids, total in ids["aggregated"]:
+            entry = {"ATM": [], "Switch": [], "Flexcube": [], "total": total}
+            entry[one_source].append(row(one_source, one_id))
+            entry[many_source].extend(row(many_source, i) for i in many_ids)
+            shaped["aggregate_matched"].append(entry)
+    for key in ("rules", "timings"):
+        if key in ids:
+            shaped[key] = ids[key]
+    return shaped
+
+
+def expand_matches(ids: Dict[str, List], atm_rows, switch_rows, flex_rows) -> Dict[str, List[Dict[str, Any]]]:
+    """Turn engine ids back into the ATM/Switch/Flexcube row triples stored in the summary."""
+    by_id = {
+        "ATM": {row["id"]: row for row in atm_rows},
+        "Switch": {row["id"]: row for row in switch_rows},
+        "Flexcube": {row["id"]: row for row in flex_rows},
+    }
+    return _shape_matches(ids, lambda source, row_id: by_id[source][row_id])
+
+
+def compact_matches(ids: Dict[str, List]) -> Dict[str, List[Dict[str, Any]]]:
+    """The summary lists with row ids in place of rows; expand_page fills in a page of them on demand."""
+    return _shape_matches(ids, lambda source, row_id: row_id)
+
+
+def page_ids(entries: List[Dict[str, Any]]) -> Dict[str, List[Any]]:
+    """Row ids per source referenced by compact summary entries."""
+    ids = {source: [] for source in SOURCES}
+    for entry in entries:
+        for source in SOURCES:
+            value = entry.get(source)
+            if isinstance(value, list):
+                ids[source].extend(value)
+            elif value is not None:
+                ids[source].append(value)
+    return ids
+
+
+def expand_page(entries: List[Dict[str, Any]], rows: Dict[str, List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+    """Compact summary entries with their ids replaced by the given rows (None for rows since deleted)."""
+    by_id = {source: {row["id"]: row for row in rows.get(source, [])} for source in SOURCES}
+    expanded = []
+    for entry in entries:
+        entry = dict(entry)
+        for source in SOURCES:
+            value = entry.get(source)
+            if isinstance(value, list):
+                entry[source] = [by_id[source].get(row_id) for row_id in value]
+            elif value is not None:
+                entry[source] = by_id[source].get(value)
+        expanded.append(entry)
+    return expanded
@@ -0,0 +1,149 @@
+import asyncio
+import multiprocessing
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+from app.core.config import MATCHING_PARTITION_MIN_ROWS, MATCHING_SHARDS, MATCHING_WORKERS
+from app.utils.aggregate_matcher import aggregate_residue, apply_aggregates, run_aggregate_pass
+from app.utils.fuzzy_matcher import residue, run_fuzzy_pass
+from app.utils.matching_engine import RuleSet, build_plan, build_shard_jobs, merge_shard_results, run_packed_match
+
+_matching_pool: Optional[ProcessPoolExecutor] = None
+_manager = None
+
+
+def get_matching_pool() -> ProcessPoolExecutor:
+    """Process pool dedicated to matching, so a large run never blocks the event loop."""
+    global _matching_pool
+    if _matching_pool is None:
+        # spawn: workers must not inherit the parent's DB connections or event loop
+        _matching_pool = ProcessPoolExecutor(
+            max_workers=MATCHING_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _matching_pool
+
+
+def _get_manager():
+    global _manager
+    if _manager is None:
+        _manager = multiprocessing.get_context("spawn").Manager()
+    return _manager
+
+
+class MatchingJob:
+    """Progress counters and cancel flag of one engine run, shared with its pool workers."""
+
+    def __init__(self):
+        manager = _get_manager()
+        self.progress = manager.dict(total=0)
+        self.cancel_event = manager.Event()
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self.cancel_event.is_set()
+
+    def snapshot(self) -> Dict[str, Any]:
+        progress = dict(self.progress)
+        shards = [value for key, value in progress.items() if key.startswith("processed:")]
+        return {"processed": sum(shards), "total": progress.get("total", 0), "shards": len(shards)}
+
+
+def shard_count(atm_rows: int) -> int:
+    """Shards a run over atm_rows ATM rows is partitioned into."""
+    return MATCHING_SHARDS if atm_rows >= MATCHING_PARTITION_MIN_ROWS else 1
+
+
+async def run_matching_job(atm: Dict[str, List], switch: Dict[str, List], flex: Dict[str, List],
+                           matching_json: Dict[str, Any], job: Optional[MatchingJob] = None,
+                           shards: Optional[int] = None, executor: Optional[Executor] = None,
+                           on_result: Optional[Callable[[int, Dict[str, List]], None]] = None,
+                           restore: Optional[Callable[[int, List], Optional[Dict[str, List]]]] = None
+                           ) -> Dict[str, List]:
+    """
+    Run the engine over packed sources and await its ids. Large runs are hash-partitioned
+    into shards reconciled in parallel and merged back into one result. Shard jobs are
+    self-contained and picklable, so any concurrent.futures executor (the local matching
+    pool by default, or one backed by other worker nodes) can run them. on_result, if
+    given, receives each shard's index and ids as soon as that shard finishes, e.g. to
+    persist them while the other shards are still matching. It runs on the default
+    thread pool, one shard at a time, so a blocking writer never stalls the event loop.
+
+    restore, if given, is asked for every shard (index, ATM ids) before matching starts
+    and returns the ids an earlier attempt of the run already produced for it, or None;
+    restored shards are not matched again. Partitioning is deterministic, so a resume
+    with the same shard count sees the same shards.
+    """
+    loop = asyncio.get_running_loop()
+    plan = build_plan(matching_json)
+    if shards is None:
+        shards = shard_count(len(atm["ids"]))
+    jobs = await loop.run_in_executor(None, build_shard_jobs, atm, switch, flex, plan, shards)
+
+    restored = {}
+    if restore is not None:
+        for index, shard in enumerate(jobs):
+            ids = await loop.run_in_executor(None, restore, index, shard[0]["ids"])
+            if ids is not None:
+                restored[index] = ids
+
+    progress = job.progress if job is not None else None
+    cancel = job.cancel_event if job is not None else None
+    if progress is not None:
+        # A waterfall evaluates the ATM rows once per rule at most
+        progress["total"] = len(atm["ids"]) * (len(plan.plans) if isinstance(plan, RuleSet) else 1)
+
+    executor = executor or get_matching_pool()
+    persist_lock = asyncio.Lock()
+    persisting = []
+
+    async def run_shard(index, shard):
+        if index in restored:
+            return restored[index]
+        result = await loop.run_in_executor(executor, run_packed_match, *shard, matching_json, progress, cancel,
+                                            f"processed:{index}")
+        if on_result is not None:
+            async with persist_lock:
+                persist = loop.run_in_executor(None, on_result, index, result)
+                persisting.append(persist)
+                # Shielded: a cancelled shard still lets its write finish (see below)
+                await asyncio.shield(persist)
+        return result
+
+    tasks = [asyncio.ensure_future(run_shard(index, shard)) for index, shard in enumerate(jobs)]
+    try:
+        results = await asyncio.gather(*tasks)
+    except BaseException:
+        # One shard failed or was cancelled: stop the others before the run is recorded as ended
+        if cancel is not None:
+            cancel.set()
+        for task in tasks:
+            task.cancel()
+        # A write in flight stops after its batch; wait for it, so the caller may close its session
+        await asyncio.gather(*persisting, return_exceptions=True)
+        raise
+
+    merged = results[0] if len(results) == 1 else merge_shard_results(results, atm["ids"])
+    merged["shards"] = [
+        {"shard": index, "atmRows": len(shard[0]["ids"]), "matched": len(result["matched"]),
+         "partiallyMatched": len(result["partially_matched"]), "unmatched": len(result["unmatched"])}
+        for index, (shard, result) in enumerate(zip(jobs, results))
+    ]
+    timings = merged.setdefault("timings", {})
+    if plan.aggregate is not None:
+        # After the merge, like the fuzzy pass: a group's rows need not share a shard
+        started = time.perf_counter()
+        rest = await loop.run_in_executor(None, aggregate_residue, atm, switch, flex, merged)
+        apply_aggregates(merged, await loop.run_in_executor(executor, run_aggregate_pass, rest, matching_json))
+        timings["aggregateMs"] = round((time.perf_counter() - started) * 1000, 3)
+    if plan.fuzzy is not None:
+        # After the merge: a corrupted key may have hashed its row into another shard
+        started = time.perf_counter()
+        rest = await loop.run_in_executor(None, residue, atm, switch, flex, merged)
+        merged["fuzzy"] = await loop.run_in_executor(executor, run_fuzzy_pass, rest, matching_json)
+        timings["fuzzyMs"] = round((time.perf_counter() - started) * 1000, 3)
+    return merged
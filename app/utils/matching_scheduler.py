@@ -0,0 +1,185 @@
+import asyncio
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from sqlalchemy import text
+
+from app.core.config import (
+    MATCHING_ADVISORY_LOCK_KEY,
+    MATCHING_DEBOUNCE_MAX_SECONDS,
+    MATCHING_DEBOUNCE_SECONDS,
+    MATCHING_RUN_HISTORY,
+)
+
+
+class MatchingRun:
+    """One scheduled matching run and every trigger that was folded into it."""
+
+    def __init__(self, trigger: str, resume: Optional[str] = None):
+        self.id = uuid.uuid4().hex
+        self.triggers: List[str] = [trigger]
+        # Reference of an interrupted recon run this run continues, instead of starting afresh
+        self.resume = resume
+        self.status = "pending"
+        self.requested_at = time.time()
+        self.last_trigger_at = self.requested_at
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.result: Any = None
+        self.job = None
+        self.cancel_requested = False
+        self.done = asyncio.get_running_loop().create_future()
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "runId": self.id,
+            "status": self.status,
+            "triggers": self.triggers,
+            "resume": self.resume,
+            "requestedAt": self.requested_at,
+            "startedAt": self.started_at,
+            "finishedAt": self.finished_at,
+            "progress": self.job.snapshot() if self.job is not None else None,
+        }
+
+
+class MatchingScheduler:
+    """
+    Coalesces matching triggers within one worker process. At most one run is pending
+    and one running; a trigger joins the pending run if there is one (a resume only
+    when it resumes the same run), otherwise it queues a new run behind the running one. A pending run starts once no trigger has
+    arrived for debounce seconds (and at most max_delay seconds after it was requested).
+    """
+
+    def __init__(self, runner: Callable[[MatchingRun], Awaitable[Any]],
+                 debounce: float = MATCHING_DEBOUNCE_SECONDS, max_delay: float = MATCHING_DEBOUNCE_MAX_SECONDS):
+        self.runner = runner
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self.pending: Optional[MatchingRun] = None
+        self.running: Optional[MatchingRun] = None
+        self.runs: "OrderedDict[str, MatchingRun]" = OrderedDict()
+        self._worker: Optional[asyncio.Task] = None
+
+    def trigger(self, source: str, resume: Optional[str] = None) -> Optional[MatchingRun]:
+        """
+        Request a run; returns the run that will include data committed before this call.
+        With resume (a recon run reference) the run continues that interrupted run. A
+        resume only joins a pending resume of the same run; while any other run is pending
+        it is refused and None is returned. A regular trigger joining a pending resume turns
+        it into a fresh run, since the interrupted run's checkpoints predate the new data.
+        """
+        if self.pending is not None:
+            if resume is not None and self.pending.resume != resume:
+                return None
+            self.pending.triggers.append(source)
+            self.pending.last_trigger_at = time.time()
+            if resume is None:
+                self.pending.resume = None
+            return self.pending
+
+        run = MatchingRun(source, resume)
+        self.pending = run
+        self._remember(run)
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.get_running_loop().create_task(self._drain())
+        return run
+
+    def get(self, run_id: str) -> Optional[MatchingRun]:
+        return self.runs.get(run_id)
+
+    def cancel(self, run_id: str) -> Optional[MatchingRun]:
+        """Cancel a pending run outright, or ask a running one to stop at its next check."""
+        run = self.runs.get(run_id)
+        if run is None:
+            return None
+        if run is self.pending:
+            self.pending = None
+            run.finished_at = time.time()
+            self._cancelled(run)
+        elif run is self.running:
+            run.cancel_requested = True
+            if run.job is not None:
+                run.job.cancel()
+        return run
+
+    def _remember(self, run: MatchingRun):
+        self.runs[run.id] = run
+        while len(self.runs) > MATCHING_RUN_HISTORY:
+            self.runs.popitem(last=False)
+
+    async def _drain(self):
+        try:
+            while self.pending is not None:
+                run = self.pending
+                # Trailing debounce, capped so a steady stream of triggers cannot starve the run
+                while True:
+                    now = time.time()
+                    wait = min(run.last_trigger_at + self.debounce, run.requested_at + self.max_delay) - now
+                    if wait <= 0:
+                        break
+                    await asyncio.sleep(wait)
+                if run is not self.pending:
+                    # Cancelled while waiting out the debounce window
+                    continue
+
+                self.pending, self.running = None, run
+                run.status, run.started_at = "running", time.time()
+                try:
+                    run.result = await self.runner(run)
+                    failed = isinstance(run.result, dict) and run.result.get("success") is False
+                    run.status = "cancelled" if failed and run.cancel_requested else "failed" if failed else "completed"
+                except Exception as e:
+                    run.status = "failed"
+                    run.result = {"error": str(e)}
+                finally:
+                    # Also on CancelledError, so waiters shielding run.done never hang
+                    if not run.done.done():
+                        if run.status == "running":
+                            self._cancelled(run)
+                        else:
+                            run.done.set_result(run.result)
+                    run.finished_at = time.time()
+                    self.running = None
+        finally:
+            # The worker itself was cancelled (shutdown) while a run was still pending
+            if self.pending is not None and not self.pending.done.done():
+                self._cancelled(self.pending)
+                self.pending.finished_at = time.time()
+                self.pending = None
+
+    @staticmethod
+    def _cancelled(run: MatchingRun):
+        run.status = "cancelled"
+        run.result = {"success": False, "status_code": 409, "message": "Matching run cancelled"}
+        run.done.set_result(run.result)
+
+
+@asynccontextmanager
+async def advisory_lock(engine, key: int = MATCHING_ADVISORY_LOCK_KEY):
+    """
+    Hold a Postgres session-level advisory lock for the duration of the block, so runs
+    started by different worker processes never overlap. Waiting for the lock happens on
+    an executor thread. Other databases (local sqlite setups) are not locked.
+    """
+    if engine.dialect.name != "postgresql":
+        yield
+        return
+
+    loop = asyncio.get_running_loop()
+    conn = await loop.run_in_executor(None, engine.connect)
+    try:
+        await loop.run_in_executor(None, lambda: conn.execute(text("SELECT pg_advisory_lock(:key)"), {"key": key}))
+        # End the autobegun transaction: the session-level lock survives it, and the connection
+        # is not left idle in transaction (and killed by idle_in_transaction_session_timeout)
+        await loop.run_in_executor(None, conn.commit)
+        try:
+            yield
+        finally:
+            conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": key})
+            conn.commit()
+    finally:
+        conn.close()
@@ -0,0 +1,124 @@
+import csv
+import mmap
+import multiprocessing
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional, Tuple
+
+from app.core.config import UPLOAD_BATCH_ROWS, UPLOAD_PARALLEL_CHUNK_BYTES, UPLOAD_PARSE_WORKERS
+from app.utils.dtype_planner import normalize_batch
+from app.utils.upload_staging import StagedUpload, iter_mmap_lines
+
+_parse_pool: Optional[ProcessPoolExecutor] = None
+_parse_pool_lock = threading.Lock()
+
+
+def get_parse_pool() -> ProcessPoolExecutor:
+    """
+    Process pool shared by all parallel parses in this worker, created on first use.
+    Batch uploads reach it from several ingest threads at once, so creation is locked.
+    """
+    global _parse_pool
+    with _parse_pool_lock:
+        if _parse_pool is None:
+            # spawn: parse workers must not inherit the parent's DB connections or event loop
+            _parse_pool = ProcessPoolExecutor(
+                max_workers=UPLOAD_PARSE_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _parse_pool
+
+
+def _count_quotes(mm: mmap.mmap, start: int, end: int, window: int = 1024 * 1024) -> int:
+    # mmap has no count(); scan in bounded windows so no large copy is ever made
+    quotes = 0
+    for pos in range(start, end, window):
+        quotes += mm[pos:min(pos + window, end)].count(b'"')
+    return quotes
+
+
+def _header_end(mm: mmap.mmap) -> int:
+    """Offset just past the header record (quote-aware)."""
+    return _record_boundary(mm, 0, 0)
+
+
+def _record_boundary(mm: mmap.mmap, pos: int, quotes: int) -> int:
+    """
+    First offset at or after pos that starts a new record. quotes is the number of
+    quote characters between the start of the current record and pos; a newline only
+    ends a record when the quotes seen so far are balanced ("" escapes count twice).
+    """
+    size = len(mm)
+    while True:
+        nl = mm.find(b"\n", pos)
+        if nl == -1:
+            return size
+        quotes += _count_quotes(mm, pos, nl)
+        pos = nl + 1
+        if quotes % 2 == 0:
+            return pos
+
+
+def split_csv_ranges(mm: mmap.mmap, start: int, chunk_bytes: int) -> List[Tuple[int, int]]:
+    """Split [start, EOF) into byte ranges of roughly chunk_bytes that begin and end on record boundaries."""
+    size = len(mm)
+    ranges = []
+    pos = start
+    while pos < size:
+        target = pos + chunk_bytes
+        if target >= size:
+            ranges.append((pos, size))
+            break
+        end = _record_boundary(mm, target, _count_quotes(mm, pos, target))
+        ranges.append((pos, end))
+        pos = end
+    return ranges
+
+
+def _parse_range(path: str, start: int, end: int, columns: List[str], file_type: str):
+    """Worker: parse and normalize the records in one byte range of a staged CSV."""
+    with open(path, "rb") as fh:
+        mm = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            lines = iter_mmap_lines(mm, start, end)
+            try:
+                rows = [dict(zip(columns, row)) for row in csv.reader(lines)]
+            finally:
+                lines.close()
+        finally:
+            mm.close()
+    if not rows:
+        return [], []
+    return normalize_batch(rows, file_type)
+
+
+def iter_parallel_csv_batches(staged: StagedUpload, file_type: str, workers: int = UPLOAD_PARSE_WORKERS,
+                              chunk_bytes: int = UPLOAD_PARALLEL_CHUNK_BYTES, batch_size: int = UPLOAD_BATCH_ROWS,
+                              pool: Optional[ProcessPoolExecutor] = None):
+    """
+    Parse a staged CSV across a process pool. Each worker parses and normalizes one
+    byte range; results are yielded in file order as (records, stats) batches, with at
+    most 2 x workers ranges in flight so memory stays bounded on very large files.
+    """
+    with staged.open_mmap() as mm:
+        header_end = _header_end(mm)
+        lines = iter_mmap_lines(mm, 0, header_end)
+        try:
+            columns = next(csv.reader(lines), [])
+        finally:
+            lines.close()
+        ranges = split_csv_ranges(mm, header_end, chunk_bytes)
+
+    pool = pool or get_parse_pool()
+    pending = deque()
+    next_range = 0
+    while next_range < len(ranges) or pending:
+        while next_range < len(ranges) and len(pending) < workers * 2:
+            start, end = ranges[next_range]
+            pending.append(pool.submit(_parse_range, staged.path, start, end, columns, file_type))
+            next_range += 1
+
+        records, stats = pending.popleft().result()
+        for i in range(0, len(records), batch_size):
+            yield records[i:i + batch_size], stats if i == 0 else []
@@ -0,0 +1,127 @@
+from sqlalchemy import (BigInteger, Date, DateTime, Float, Integer, Numeric, String, Table, Text, and_, case, cast,
+                        exists, false, func, literal, null, select, true, union_all)
+from sqlalchemy.sql import Insert
+
+from app.utils.matching_engine import AMOUNT_FIELDS, MatchPlan
+
+RESULT_COLUMNS = ["run_id", "status", "atm_id", "switch_id", "flexcube_id"]
+
+# Every character str.strip() removes
+WHITESPACE = "".join(chr(code) for code in range(0x3001) if chr(code).isspace())
+
+
+def _text(column):
+    """
+    A column as the text the engine compares, str() of the value it loads (see
+    MatchingRuleService._plain): integers as is, numerics as the shortest float text
+    with at least one decimal and zero as empty (exact up to 15 significant digits),
+    timestamps with six fractional digits when they have any. Text output assumes
+    Postgres' ISO DateStyle.
+    """
+    column_type = column.type
+    text = cast(column, Text)
+    if isinstance(column_type, String):
+        return text
+    if isinstance(column_type, Integer):
+        return text
+    if isinstance(column_type, Numeric) and not isinstance(column_type, Float):
+        digits = case((text.like("%.%"), func.rtrim(text, "0")), else_=text + ".")
+        return case((column == 0, literal("")), (digits.like("%."), digits + "0"), else_=digits)
+    if isinstance(column_type, DateTime):
+        return case(
+            # SQLite stores zero microseconds, which str() drops
+            (text.like("%.000000"), func.substr(text, 1, 19)),
+            (text.like("%.%"), func.substr(text + "00000", 1, 26)),
+            else_=text,
+        )
+    if isinstance(column_type, Date):
+        return text
+    raise ValueError(f"Column {column.name} of type {column_type} cannot be used as a key in SQL")
+
+
+def _norm(table, field: str):
+    """SQL counterpart of matching_engine.normalize; unknown columns compare as empty."""
+    if field not in table.c:
+        return literal("")
+    return func.upper(func.trim(func.coalesce(_text(table.c[field]), ""), WHITESPACE))
+
+
+def key_columns(table, fields):
+    """SQL expressions of a key as the engine packs it: one normalized value per field."""
+    return [_norm(table, field) for field in fields]
+
+
+def _amount(table, source: str):
+    # NULL amounts read as 0, like to_amount()
+    field = AMOUNT_FIELDS[source]
+    if field not in table.c:
+        return literal(0)
+    return func.coalesce(table.c[field], 0)
+
+
+def _join_on(pairs, left, right):
+    conditions = [_norm(left, l) == _norm(right, r) for l, r in pairs]
+    return and_(*conditions) if conditions else true()
+
+
+def compile_match_query(plan: MatchPlan, atm: Table, switch: Table, flex: Table,
+                        results: Table, run_id: str) -> Insert:
+    """
+    Compile a matching rule into one INSERT ... SELECT that classifies every ATM row
+    into `results` inside the database, with the engine's semantics (source order being
+    id order):
+
+    - candidates: ATM x Switch on the A-B key, left-joined to Flexcube on the B-C key,
+      each triple flagged by the amount tolerance;
+    - matched: per ATM row the first passing triple by (switch id, flexcube id);
+    - partially_matched: ATM rows with candidates but no passing triple, paired with
+      their last Switch candidate;
+    - unmatched: ATM rows without any Switch candidate.
+    """
+    a, s, f = atm.alias("a"), switch.alias("s"), flex.alias("f")
+
+    if not plan.check_amount:
+        tolerance = true()
+    elif plan.amount_diff is None:
+        tolerance = false()
+    else:
+        tolerance = func.abs(_amount(a, "ATM") - _amount(f, "Flexcube")) <= plan.amount_diff
+
+    candidates = (
+        select(
+            a.c.id.label("atm_id"),
+            s.c.id.label("switch_id"),
+            f.c.id.label("flexcube_id"),
+            case((and_(f.c.id.isnot(None), tolerance), 1), else_=0).label("ok"),
+        )
+        .select_from(a.join(s, _join_on(plan.ab_pairs, a, s)).outerjoin(f, _join_on(plan.bc_pairs, s, f)))
+        .cte("candidates")
+    )
+    ranked = (
+        select(
+            candidates.c.atm_id,
+            candidates.c.switch_id,
+            candidates.c.flexcube_id,
+            func.row_number().over(
+                partition_by=candidates.c.atm_id,
+                order_by=(candidates.c.switch_id, candidates.c.flexcube_id),
+            ).label("candidate_rank"),
+        )
+        .where(candidates.c.ok == 1)
+        .cte("ranked")
+    )
+
+    run = literal(run_id, String)
+    no_id = cast(null(), BigInteger)
+    matched = select(run, literal("matched", String), ranked.c.atm_id, ranked.c.switch_id, ranked.c.flexcube_id) \
+        .where(ranked.c.candidate_rank == 1)
+    partially_matched = (
+        select(run, literal("partially_matched", String), candidates.c.atm_id, func.max(candidates.c.switch_id), no_id)
+        .group_by(candidates.c.atm_id)
+        .having(func.max(candidates.c.ok) == 0)
+    )
+    u, us = atm.alias("u"), switch.alias("us")
+    unmatched = select(run, literal("unmatched", String), u.c.id, no_id, no_id) \
+        .where(~exists().where(_join_on(plan.ab_pairs, u, us)).select_from(us))
+
+    return results.insert().from_select(RESULT_COLUMNS, union_all(matched, partially_matched, unmatched))
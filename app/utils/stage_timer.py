@@ -0,0 +1,41 @@
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator
+
+
+class StageTimings:
+    """Wall-clock milliseconds accumulated per named stage (parse, load, matching, ...)."""
+
+    def __init__(self):
+        self.stages: Dict[str, float] = {}
+
+    def add(self, stage: str, ms: float):
+        self.stages[stage] = self.stages.get(stage, 0.0) + ms
+
+    @contextmanager
+    def measure(self, stage: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage, (time.perf_counter() - start) * 1000)
+
+    def iterate(self, stage: str, iterable: Iterable) -> Iterator:
+        """Yield from iterable, charging the time spent producing each item to stage."""
+        items = iter(iterable)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(items)
+            except StopIteration:
+                self.add(stage, (time.perf_counter() - start) * 1000)
+                return
+            self.add(stage, (time.perf_counter() - start) * 1000)
+            yield item
+
+    def merge(self, other: "StageTimings"):
+        for stage, ms in other.stages.items():
+            self.add(stage, ms)
+
+    def to_dict(self) -> Dict[str, float]:
+        return {f"{stage}Ms": round(ms, 3) for stage, ms in self.stages.items()}
@@ -0,0 +1,224 @@
+import datetime
+import mmap
+import struct
+from typing import Any, Dict, Iterator, Optional
+
+from app.config.switch_log_layouts import ISO8583_ELEMENT_FORMATS, SWITCH_COLUMNS, SWITCH_LOG_LAYOUTS
+
+_LENGTH_BINARY2 = struct.Struct(">H")
+_BITMAP_HALF = struct.Struct(">Q")
+
+
+def layout_for_filename(filename: str) -> Optional[str]:
+    """Name of the switch-log layout whose extensions match an upload, if any."""
+    lowered = filename.lower()
+    for name, layout in SWITCH_LOG_LAYOUTS.items():
+        if any(lowered.endswith(ext) for ext in layout.get("extensions", [])):
+            return name
+    return None
+
+
+class _SwitchLogParser:
+    """Shared post-processing of the columns sliced out of one switch-log record."""
+
+    def __init__(self, layout: Dict[str, Any]):
+        self.encoding = layout.get("encoding", "ascii")
+        self.datetime_format = layout.get("datetime_format")
+        self.mask_pan = layout.get("mask_pan", False)
+        self.template = {col: "" for col in SWITCH_COLUMNS}
+        self.template.update(layout.get("constants", {}))
+        self.uploaded_at = datetime.datetime.now()
+
+    def _finish(self, row: Dict[str, str]) -> Dict[str, str]:
+        if self.datetime_format and row.get("datetime"):
+            row["datetime"] = self._format_datetime(row["datetime"])
+        if self.mask_pan and row.get("pan_masked"):
+            row["pan_masked"] = mask_pan(row["pan_masked"])
+        return row
+
+    def _format_datetime(self, value: str) -> str:
+        fmt = self.datetime_format
+        try:
+            if "%Y" in fmt or "%y" in fmt:
+                parsed = datetime.datetime.strptime(value, fmt)
+            else:
+                parsed = self._parse_without_year(value, fmt)
+            return parsed.strftime("%Y-%m-%d %H:%M:%S")
+        except ValueError:
+            return value
+
+    def _parse_without_year(self, value: str, fmt: str) -> datetime.datetime:
+        """
+        ISO 8583 transmission times carry no year. Take the upload's year, or the year
+        before when that would put the time more than a day after the upload (a December
+        journal uploaded in January). The year is parsed with the value so Feb 29 works.
+        """
+        year = self.uploaded_at.year
+        try:
+            parsed = datetime.datetime.strptime(f"{year}{value}", f"%Y{fmt}")
+            if parsed <= self.uploaded_at + datetime.timedelta(days=1):
+                return parsed
+        except ValueError:
+            pass
+        return datetime.datetime.strptime(f"{year - 1}{value}", f"%Y{fmt}")
+
+
+def mask_pan(pan: str) -> str:
+    if len(pan) <= 10 or "*" in pan:
+        return pan
+    return pan[:6] + "*" * (len(pan) - 10) + pan[-4:]
+
+
+class FixedWidthParser(_SwitchLogParser):
+    """
+    Newline-terminated fixed-width records. The field layout is compiled into one
+    struct format (with pad bytes for unused columns), and every record is unpacked
+    straight out of the memory map, so no per-line copy is made.
+    """
+
+    def __init__(self, layout: Dict[str, Any]):
+        super().__init__(layout)
+        fmt = ">"
+        cursor = 0
+        self.columns = []
+        for column, offset, length in sorted(layout["fields"], key=lambda f: f[1]):
+            if offset < cursor:
+                raise ValueError(f"Overlapping fixed-width field: {column}")
+            if offset > cursor:
+                fmt += f"{offset - cursor}x"
+            fmt += f"{length}s"
+            cursor = offset + length
+            self.columns.append(column)
+        self.record = struct.Struct(fmt)
+
+    def iter_rows(self, mm: mmap.mmap) -> Iterator[Dict[str, str]]:
+        size = len(mm)
+        record_size = self.record.size
+        pos = 0
+        while pos < size:
+            nl = mm.find(b"\n", pos)
+            end = size if nl == -1 else nl
+            if end - pos >= record_size:
+                values = self.record.unpack_from(mm, pos)
+            elif mm[pos:end].strip():
+                # Trailing blanks trimmed by the exporter
+                values = self.record.unpack(mm[pos:end].ljust(record_size))
+            else:
+                pos = end + 1
+                continue
+
+            row = dict(self.template)
+            for column, value in zip(self.columns, values):
+                row[column] = value.decode(self.encoding, "ignore").strip()
+            yield self._finish(row)
+            pos = end + 1
+
+
+class Iso8583Parser(_SwitchLogParser):
+    """
+    ASCII ISO 8583 messages. The bitmap is read with struct; present data elements are
+    walked in order, elements that are not mapped to a column are skipped by length and
+    only mapped ones are decoded from the memoryview.
+    """
+
+    def __init__(self, layout: Dict[str, Any]):
+        super().__init__(layout)
+        self.length_prefix = layout.get("length_prefix", "binary2")
+        self.hex_bitmap = layout.get("bitmap", "binary") == "hex"
+        self.elements = layout["elements"]
+
+    def _frames(self, mm: mmap.mmap):
+        size = len(mm)
+        pos = 0
+        while pos < size:
+            if self.length_prefix == "binary2":
+                length = _LENGTH_BINARY2.unpack_from(mm, pos)[0]
+                pos += 2
+            elif self.length_prefix == "ascii4":
+                length = int(mm[pos:pos + 4])
+                pos += 4
+            else:
+                nl = mm.find(b"\n", pos)
+                end = size if nl == -1 else nl
+                length = end - pos
+                if length and mm[end - 1:end] == b"\r":
+                    length -= 1
+                if length:
+                    yield pos, pos + length
+                pos = end + 1
+                continue
+            if pos + length > size:
+                raise ValueError("Truncated ISO 8583 message at end of file")
+            yield pos, pos + length
+            pos += length
+
+    def iter_rows(self, mm: mmap.mmap) -> Iterator[Dict[str, str]]:
+        view = memoryview(mm)
+        try:
+            for start, end in self._frames(mm):
+                yield self._parse_message(mm, view, start, end)
+        finally:
+            view.release()
+
+    def _read_bitmap(self, mm: mmap.mmap, view: memoryview, off: int):
+        if self.hex_bitmap:
+            bits = int(str(view[off:off + 16], "ascii"), 16)
+            off += 16
+            if bits >> 63:
+                bits = (bits << 64) | int(str(view[off:off + 16], "ascii"), 16)
+                off += 16
+            else:
+                bits <<= 64
+        else:
+            bits = _BITMAP_HALF.unpack_from(mm, off)[0]
+            off += 8
+            if bits >> 63:
+                bits = (bits << 64) | _BITMAP_HALF.unpack_from(mm, off)[0]
+                off += 8
+            else:
+                bits <<= 64
+        # Element 1 only flags the secondary bitmap
+        return bits & ~(1 << 127), off
+
+    def _parse_message(self, mm: mmap.mmap, view: memoryview, start: int, end: int) -> Dict[str, str]:
+        encoding = self.encoding
+        row = dict(self.template)
+        row["mti"] = str(view[start:start + 4], encoding)
+        bits, off = self._read_bitmap(mm, view, start + 4)
+
+        while bits:
+            # Highest remaining bit is the lowest-numbered present element
+            element = 129 - bits.bit_length()
+            bits &= ~(1 << (128 - element))
+
+            fmt = ISO8583_ELEMENT_FORMATS.get(element)
+            if fmt is None:
+                raise ValueError(f"Unsupported ISO 8583 data element {element}")
+            if fmt == "LL":
+                length = int(view[off:off + 2])
+                off += 2
+            elif fmt == "LLL":
+                length = int(view[off:off + 3])
+                off += 3
+            else:
+                length = fmt
+
+            if off + length > end:
+                raise ValueError(f"ISO 8583 data element {element} runs past the end of its message")
+            column = self.elements.get(element)
+            if column:
+                row[column] = str(view[off:off + length], encoding, "ignore").strip()
+            off += length
+
+        return self._finish(row)
+
+
+def build_switch_log_parser(layout_name: str):
+    layout = SWITCH_LOG_LAYOUTS.get(layout_name)
+    if layout is None:
+        raise ValueError(f"Unknown switch log layout: {layout_name}")
+    if layout["format"] == "fixed":
+        return FixedWidthParser(layout)
+    if layout["format"] == "iso8583":
+        return Iso8583Parser(layout)
+    raise ValueError(f"Unsupported switch log format: {layout['format']}")
@@ -0,0 +1,149 @@
+import hashlib
+import mmap
+import os
+import re
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+from app.core.config import (
+    UPLOAD_CHUNK_BYTES,
+    UPLOAD_MAX_BYTES,
+    UPLOAD_STAGING_DIR,
+    UPLOAD_STAGING_TTL_SECONDS,
+)
+
+_STAGING_ID = re.compile(r"^[0-9a-f]{32}$")
+
+
+class StagedUpload:
+    """
+    An upload spilled to the local staging directory. The file stays on disk until
+    ingestion succeeds, so a failed upload can be re-parsed without a new upload.
+    """
+
+    def __init__(self, staging_id: str, path: str, filename: str, size: int, sha256: Optional[str] = None):
+        self.staging_id = staging_id
+        self.path = path
+        self.filename = filename
+        self.size = size
+        self._sha256 = sha256
+
+    @property
+    def sha256(self) -> str:
+        """Hex SHA-256 of the staged content; computed while staging, or on demand for a retry."""
+        if self._sha256 is None:
+            digest = hashlib.sha256()
+            with open(self.path, "rb") as fh:
+                for chunk in iter(lambda: fh.read(UPLOAD_CHUNK_BYTES), b""):
+                    digest.update(chunk)
+            self._sha256 = digest.hexdigest()
+        return self._sha256
+
+    @property
+    def extension(self) -> str:
+        return os.path.splitext(self.filename)[1].lower()
+
+    @contextmanager
+    def open_mmap(self) -> Iterator[mmap.mmap]:
+        """Read-only memory map of the staged file."""
+        with open(self.path, "rb") as fh:
+            mm = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                yield mm
+            finally:
+                mm.close()
+
+    def discard(self):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+def _staged_path(staging_id: str, filename: str) -> str:
+    return os.path.join(UPLOAD_STAGING_DIR, f"{staging_id}__{filename}")
+
+
+def purge_stale_uploads(max_age: int = UPLOAD_STAGING_TTL_SECONDS):
+    """Remove staged files older than max_age seconds."""
+    if not os.path.isdir(UPLOAD_STAGING_DIR):
+        return
+    cutoff = time.time() - max_age
+    for name in os.listdir(UPLOAD_STAGING_DIR):
+        path = os.path.join(UPLOAD_STAGING_DIR, name)
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+        except OSError:
+            continue
+
+
+async def stage_upload(file, max_bytes: int = UPLOAD_MAX_BYTES, chunk_size: int = UPLOAD_CHUNK_BYTES) -> StagedUpload:
+    """
+    Stream an UploadFile to the staging directory in fixed-size chunks,
+    never holding more than one chunk of the payload in memory. The content
+    SHA-256 is computed on the same pass.
+    """
+    os.makedirs(UPLOAD_STAGING_DIR, exist_ok=True)
+    purge_stale_uploads()
+
+    filename = os.path.basename(file.filename or "upload")
+    staging_id = uuid.uuid4().hex
+    path = _staged_path(staging_id, filename)
+
+    size = 0
+    digest = hashlib.sha256()
+    try:
+        with open(path, "wb") as out:
+            while True:
+                chunk = await file.read(chunk_size)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_bytes:
+                    raise ValueError(f"Upload exceeds the maximum allowed size of {max_bytes} bytes")
+                digest.update(chunk)
+                out.write(chunk)
+    except Exception:
+        if os.path.exists(path):
+            os.remove(path)
+        raise
+
+    return StagedUpload(staging_id, path, filename, size, digest.hexdigest())
+
+
+def get_staged_upload(staging_id: str) -> Optional[StagedUpload]:
+    """Look up a previously staged upload for a retry."""
+    if not _STAGING_ID.match(staging_id or "") or not os.path.isdir(UPLOAD_STAGING_DIR):
+        return None
+
+    prefix = f"{staging_id}__"
+    for name in os.listdir(UPLOAD_STAGING_DIR):
+        if name.startswith(prefix):
+            path = os.path.join(UPLOAD_STAGING_DIR, name)
+            return StagedUpload(staging_id, path, name[len(prefix):], os.path.getsize(path))
+    return None
+
+
+def iter_mmap_lines(mm: mmap.mmap, start: int = 0, end: Optional[int] = None, encoding: str = "utf-8") -> Iterator[str]:
+    """
+    Yield decoded lines (newline kept) from a memory-mapped file. Lines are sliced
+    out of a memoryview, so the only copy made is the decoded str itself.
+    """
+    end = len(mm) if end is None else end
+    view = memoryview(mm)
+    try:
+        pos = start
+        while pos < end:
+            nl = mm.find(b"\n", pos, end)
+            stop = end if nl == -1 else nl + 1
+            line = view[pos:stop]
+            try:
+                yield str(line, encoding, "ignore")
+            finally:
+                line.release()
+            pos = stop
+    finally:
+        view.release()
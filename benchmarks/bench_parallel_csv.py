@@ -0,0 +1,70 @@
+"""
+Parallel CSV parse benchmark: parses one staged switch CSV sequentially and with
+1..N parse workers and prints throughput and speedup for each worker count.
+
+    python -m benchmarks.bench_parallel_csv --rows 2000000 --workers 1 2 4 8
+"""
+import argparse
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+
+from app.utils.dtype_planner import normalize_batch
+from app.utils.file_reader import iter_staged_batches
+from app.utils.parallel_csv import iter_parallel_csv_batches
+from app.utils.upload_staging import StagedUpload
+
+
+def build_csv(path, rows):
+    with open(path, "w", newline="") as fh:
+        fh.write("datetime,direction,mti,pan_masked,processingcode,amountminor,currency,terminalid,stan,rrn,source,destination\n")
+        for i in range(rows):
+            fh.write(f'2025-12-01 09:17:00,OUT,0200,4532********1234,010000,{50000 + i % 100},356,'
+                     f'TERM{i % 300:04d},{i % 999999},{251201000000 + i},"ATM, Mumbai",CBS\n')
+
+
+def run_sequential(staged):
+    count = 0
+    for batch in iter_staged_batches(staged):
+        records, _ = normalize_batch(batch, "SWITCH")
+        count += len(records)
+    return count
+
+
+def run_parallel(staged, workers):
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        # Warm the workers up so process start-up is not counted
+        list(pool.map(abs, range(workers)))
+        start = time.perf_counter()
+        count = sum(len(records) for records, _ in iter_parallel_csv_batches(
+            staged, "SWITCH", workers=workers, chunk_bytes=4 * 1024 * 1024, pool=pool))
+        return count, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=500000)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, os.cpu_count() or 1])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "switch.csv")
+        build_csv(path, args.rows)
+        staged = StagedUpload("bench", path, "switch.csv", os.path.getsize(path))
+        print(f"csv: {args.rows} rows, {staged.size / 1024 / 1024:.1f} MiB")
+
+        start = time.perf_counter()
+        count = run_sequential(staged)
+        baseline = time.perf_counter() - start
+        print(f"{'sequential':<12} rows={count:<9} {baseline:7.2f}s {count / baseline:11.0f} rows/s")
+
+        for workers in args.workers:
+            count, elapsed = run_parallel(staged, workers)
+            print(f"{f'workers={workers}':<12} rows={count:<9} {elapsed:7.2f}s {count / elapsed:11.0f} rows/s "
+                  f"speedup={baseline / elapsed:5.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Partitioned matching benchmark: reconciles one synthetic ATM/Switch/Flexcube day with
+1..N shards, each shard count on a pool of the same size, and prints wall time and
+speedup over a single shard. Results are checked to be identical for every shard count.
+
+    python -m benchmarks.bench_partitioned_matching --rows 1000000 --workers 1 2 4 8
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from app.utils.matching_engine import MatchPlan, pack_source
+from app.utils.matching_runner import run_matching_job
+
+RULE = {
+    "matchCondition": {"matchingGroups": [
+        {"fields": [{"matching_fieldA": "rrn", "matching_fieldB": "rrn"},
+                    {"matching_fieldA": "terminalid", "matching_fieldB": "terminalid"}]},
+        {"fields": [{"matching_fieldB": "rrn", "matching_fieldC": "rrn"},
+                    {"matching_fieldB": "stan", "matching_fieldC": "stan"}]},
+    ]},
+    "tolerance": {"allowAmountDiff": "N", "amountDiff": 1},
+}
+
+
+def build_day(rows, seed=7):
+    rnd = random.Random(seed)
+    atm, switch, flex = [], [], []
+    for i in range(rows):
+        rrn = str(251201000000 + i)
+        terminal = f"TERM{i % 300:04d}"
+        amount = float(rnd.choice((500, 1000, 2000, 5000)))
+        atm.append({"id": i, "rrn": rrn, "terminalid": terminal, "amount": amount})
+        if rnd.random() < 0.95:
+            switch.append({"id": i, "rrn": rrn, "terminalid": terminal, "stan": i % 999999})
+        if rnd.random() < 0.9:
+            flex.append({"id": i, "rrn": rrn, "stan": str(i % 999999), "dr": amount + rnd.choice((0, 0, 0, 5))})
+    return atm, switch, flex
+
+
+async def run(packed, workers):
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        # Warm the workers up so process start-up is not counted
+        list(pool.map(abs, range(workers)))
+        start = time.perf_counter()
+        result = await run_matching_job(*packed, RULE, shards=workers, executor=pool)
+        return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=500000)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, os.cpu_count() or 1])
+    args = parser.parse_args()
+
+    atm, switch, flex = build_day(args.rows)
+    plan = MatchPlan(RULE)
+    packed = (pack_source(atm, plan, "ATM"), pack_source(switch, plan, "Switch"), pack_source(flex, plan, "Flexcube"))
+    print(f"sources: atm={len(atm)} switch={len(switch)} flexcube={len(flex)}, cpus={os.cpu_count()}")
+
+    baseline, reference = None, None
+    for workers in args.workers:
+        result, elapsed = asyncio.run(run(packed, workers))
+        counts = {status: len(result[status]) for status in ("matched", "partially_matched", "unmatched")}
+        if reference is None:
+            reference, baseline = result, elapsed
+        elif any(result[status] != reference[status] for status in counts):
+            raise SystemExit(f"shards={workers}: result differs from the single-shard run")
+        print(f"{f'shards={workers}':<10} {elapsed:7.2f}s {len(atm) / elapsed:11.0f} atm rows/s "
+              f"speedup={baseline / elapsed:5.2f}x  {counts}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Switch journal parser benchmark: builds a fixed-width dump and an ISO 8583 dump with
+the shipped layouts and reports parsed records per second for each.
+
+    python -m benchmarks.bench_switch_log_parser --records 1000000
+"""
+import argparse
+import mmap
+import os
+import struct
+import tempfile
+import time
+
+from app.config.switch_log_layouts import SWITCH_LOG_LAYOUTS
+from app.utils.switch_log_parser import build_switch_log_parser
+
+
+def build_fixed_width(path, records):
+    fields = SWITCH_LOG_LAYOUTS["fixed_width"]["fields"]
+    width = max(offset + length for _, offset, length in fields)
+    with open(path, "wb") as fh:
+        for i in range(records):
+            values = {
+                "datetime": "20251201091700", "direction": "OUT", "mti": "0200",
+                "pan_masked": "4532015112830366", "processingcode": "010000",
+                "amountminor": f"{50000 + i % 100:012d}", "currency": "356",
+                "terminalid": f"T{i % 300:07d}", "stan": f"{i % 999999:06d}",
+                "rrn": f"{251201000000 + i:012d}", "source": "ATM", "destination": "CBS",
+            }
+            line = bytearray(b" " * width)
+            for column, offset, length in fields:
+                line[offset:offset + length] = values[column].ljust(length)[:length].encode()
+            fh.write(bytes(line) + b"\n")
+
+
+def iso_message(i):
+    elements = {
+        2: b"164532015112830366", 3: b"010000", 4: b"%012d" % (50000 + i % 100),
+        7: b"1201091700", 11: b"%06d" % (i % 999999), 32: b"06123456",
+        37: b"%012d" % (251201000000 + i), 41: b"T%07d" % (i % 300), 49: b"356",
+        100: b"06654321",
+    }
+    bits = 1 << 127  # secondary bitmap present (element 100)
+    for element in elements:
+        bits |= 1 << (128 - element)
+    body = b"0200" + struct.pack(">QQ", bits >> 64, bits & (2 ** 64 - 1))
+    body += b"".join(elements[e] for e in sorted(elements))
+    return struct.pack(">H", len(body)) + body
+
+
+def build_iso8583(path, records):
+    with open(path, "wb") as fh:
+        for i in range(records):
+            fh.write(iso_message(i))
+
+
+def measure(label, layout, path):
+    parser = build_switch_log_parser(layout)
+    with open(path, "rb") as fh:
+        mm = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            start = time.perf_counter()
+            count = 0
+            for _ in parser.iter_rows(mm):
+                count += 1
+            elapsed = time.perf_counter() - start
+        finally:
+            mm.close()
+    print(f"{label:<12} records={count:<9} {elapsed:7.2f}s {count / elapsed:11.0f} records/s")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--records", type=int, default=200000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        fixed = os.path.join(tmp, "switch.fwf")
+        iso = os.path.join(tmp, "switch.iso")
+        build_fixed_width(fixed, args.records)
+        build_iso8583(iso, args.records)
+        measure("fixed_width", "fixed_width", fixed)
+        measure("iso8583", "iso8583", iso)
+
+
+if __name__ == "__main__":
+    main()